@@ -0,0 +1,204 @@
+"""
+Benchmarks of the 1D site response engines
+
+Each case is run in its own forked process, and the build, static, dynamic and collection (`results_to_dict`)
+times and the peak memory increase of the process are reported.
+
+Run with:
+
+    python -m benchmarks.bench_sra [--quick] [--ofile results.csv]
+"""
+import time
+import resource
+import itertools
+
+import numpy as np
+import eqsig
+import sfsimodels as sm
+
+import o3soil
+import o3soil.sra
+from o3soil.sra.output import O3SRAOutputs
+from o3soil.sra.stats import SRAStats
+from o3soil.parallel import map_in_workers
+from tests.conftest import TEST_DATA_DIR
+
+ENGINES = ['sra', 'essra', 'site_response']
+MODELS = ['elastic', 'pimy', 'pdmy', 'pdmy02', 'pm4sand']
+PHASES = ['build', 'static', 'dynamic', 'collect']
+
+
+def build_elastic_soil(vs, unit_mass=1700.0):
+    sl = sm.Soil()
+    sl.g_mod = vs ** 2 * unit_mass
+    sl.poissons_ratio = 0.3
+    sl.unit_dry_weight = unit_mass * 9.8
+    sl.specific_gravity = 2.65
+    sl.xi = 0.03
+    sl.permeability = 1.0e-5
+    return sl
+
+
+def build_soil(model, vs=180.):
+    if model == 'pm4sand':
+        import liquepy as lq
+        sl = lq.num.o3.PM4Sand(liq_mass_density=1.0e3)
+        sl.relative_density = 0.35
+        sl.g0_mod = 476.0
+        sl.h_po = 0.53
+        sl.unit_sat_weight = 1700.0 * 9.81
+        sl.e_min = 0.5
+        sl.e_max = 0.8
+        sl.poissons_ratio = 0.3
+        sl.phi = 33.
+        sl.permeability = 1.0e-5
+        sl.p_atm = 101.0e3
+        return sl
+    sl = build_elastic_soil(vs)
+    if model == 'elastic':
+        return sl
+    sl.o3_type = model
+    sl.phi = 32.
+    sl.cohesion = 0.0
+    sl.peak_strain = 0.1
+    if model == 'pimy':
+        sl.phi = 0.0
+        sl.cohesion = 60.0e3
+    else:
+        sl.pt_ang = 26.
+        sl.con_rate = 0.067
+        sl.con_rates = [0.067, 5.0, 0.23]
+        sl.dil_rates = [0.06, 3.0, 0.27]
+        sl.liquefac = [1.0, 0.0]
+        sl.e_init = sl.e_curr
+    return sl
+
+
+def build_profile(model, height=20.):
+    sp = sm.SoilProfile()
+    sp.add_layer(0, build_soil(model))
+    sp.add_layer(height / 2, build_elastic_soil(400.))
+    sp.height = height
+    sp.gwl = height
+    return sp
+
+
+def build_motion(duration):
+    asig = eqsig.load_asig(TEST_DATA_DIR + 'short_motion_dt0p01.txt', m=0.5)
+    n_rep = int(np.ceil(duration / asig.time[-1]))
+    vals = np.tile(asig.values, n_rep)[:int(duration / asig.dt)]
+    return eqsig.AccSignal(vals, asig.dt)
+
+
+def _get_peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # MB on linux
+
+
+def run_case(case):
+    """Runs a single case and returns the time of each phase (in s) and the peak memory increase (in MB)"""
+    engine, model, dy, duration, playback, analysis_dt = case
+    timings = dict([(phase, np.nan) for phase in PHASES])
+    timings['collect'] = 0.0
+    results_to_dict = O3SRAOutputs.results_to_dict
+
+    def timed_results_to_dict(self):  # the case runs in its own process, so the patch does not leak
+        t0 = time.perf_counter()
+        od = results_to_dict(self)
+        timings['collect'] += time.perf_counter() - t0
+        return od
+    O3SRAOutputs.results_to_dict = timed_results_to_dict
+
+    rss0 = _get_peak_rss()
+    sp = build_profile(model)
+    asig = build_motion(duration)
+    outs = {'ACCX': 'all', 'TAU': 'all', 'STRS': 'all'}
+    t0 = time.perf_counter()
+    if engine == 'site_response':
+        stats = SRAStats()
+        o3soil.sra.site_response(sp, asig, analysis_dt=analysis_dt, dy=dy, outs=outs, playback=playback,
+                                 stats=stats)
+        phase_times = stats.phase_times
+        timings['build'] = phase_times['build']
+        timings['static'] = phase_times['static']
+        timings['dynamic'] = phase_times['dynamic']
+    else:
+        if engine == 'essra':
+            sra_1d = o3soil.sra.ESSRA1D(sp, dy=dy)
+        else:
+            sra_1d = o3soil.sra.SRA1D(sp, dy=dy)
+        sra_1d.build_model()
+        t1 = time.perf_counter()
+        sra_1d.execute_static()
+        t2 = time.perf_counter()
+        sra_1d.execute_dynamic(asig, analysis_dt=analysis_dt, outs=outs, playback=playback)
+        t3 = time.perf_counter()
+        timings['build'] = t1 - t0
+        timings['static'] = t2 - t1
+        timings['dynamic'] = t3 - t2 - timings['collect']
+    timings['total'] = time.perf_counter() - t0
+    timings['peak_mem'] = _get_peak_rss() - rss0
+    return timings
+
+
+def run_benchmarks(engines=None, models=None, dys=(0.5, 0.25), durations=(5., 20.), playbacks=(False, True),
+                   analysis_dt=0.005, timeout=None):
+    """
+    Runs every combination of the engines, models, sub-layer thicknesses, durations and playback options
+
+    Returns
+    -------
+    rows: list of dict
+        The case and its timings, with the error message if the case failed
+    """
+    if engines is None:
+        engines = ENGINES
+    if models is None:
+        models = MODELS
+    cases = list(itertools.product(engines, models, dys, durations, playbacks, [analysis_dt]))
+    rows = []
+    for case in cases:  # one at a time, so the timings are not affected by other cases
+        res, errors = map_in_workers(run_case, [case], n_workers=1, start_method='fork', timeout=timeout)
+        row = dict(zip(['engine', 'model', 'dy', 'duration', 'playback'], case[:5]))
+        if res[0] is None:
+            row['error'] = errors[0].strip().splitlines()[-1]
+        else:
+            row.update(res[0])
+        rows.append(row)
+    return rows
+
+
+def print_rows(rows):
+    cols = ['engine', 'model', 'dy', 'duration', 'playback'] + PHASES + ['total', 'peak_mem']
+    print(' '.join([f'{col:>13}' for col in cols]))
+    for row in rows:
+        line = []
+        for col in cols:
+            val = row.get(col, '')
+            line.append(f'{val:13.3f}' if isinstance(val, float) else f'{str(val):>13}')
+        if 'error' in row:
+            line.append(f'  failed: {row["error"]}')
+        print(' '.join(line))
+
+
+def rows_to_csv(rows, ofile):
+    cols = ['engine', 'model', 'dy', 'duration', 'playback'] + PHASES + ['total', 'peak_mem', 'error']
+    with open(ofile, 'w') as f:
+        f.write(','.join(cols) + '\n')
+        for row in rows:
+            f.write(','.join([str(row.get(col, '')) for col in cols]) + '\n')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmarks of the 1D site response engines')
+    parser.add_argument('--quick', action='store_true', help='a single short case of each engine and model')
+    parser.add_argument('--ofile', help='save the results to a csv file')
+    parser.add_argument('--timeout', type=float, default=600., help='maximum time of each case (s)')
+    pargs = parser.parse_args()
+    if pargs.quick:
+        brows = run_benchmarks(dys=(0.5,), durations=(2.,), playbacks=(False,), timeout=pargs.timeout)
+    else:
+        brows = run_benchmarks(timeout=pargs.timeout)
+    print_rows(brows)
+    if pargs.ofile:
+        rows_to_csv(brows, pargs.ofile)
@@ -1,3 +1,18 @@
-from o3soil import sra, backbone, drivers
-from . import ssi
-from .generic import get_o3_class_and_args_from_soil_obj
+import importlib
+
+# subpackages and helpers are imported on first access, so `import o3soil` does not load o3seespy or the
+# optional dependencies of the subpackages that are not used
+_SUBMODULES = ['sra', 'backbone', 'drivers', 'ssi', 'generic', 'parallel']
+_GENERIC_ATTRS = ['get_o3_class_and_args_from_soil_obj', 'MaterialRegistry']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name in _GENERIC_ATTRS:
+        return getattr(importlib.import_module(f'{__name__}.generic'), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + _SUBMODULES + _GENERIC_ATTRS)
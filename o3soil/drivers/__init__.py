@@ -1 +1,9 @@
-from . import n2d
+import importlib
+
+_SUBMODULES = ['n2d', 'n3d', 'two_d']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
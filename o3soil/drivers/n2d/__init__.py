@@ -1,3 +1,4 @@
 from .custom_2d import run_ts_custom_strain, run_ud_custom_strain
 from .vload_2d import run_vload
 from .ud_cdss_2d import run_ud_cdss
+from .cyclic_strength import run_csr_n_grid, find_csr_for_n_cycles
@@ -2,6 +2,8 @@ import o3seespy as o3
 import numpy as np
 import math
 
+from o3soil.generic import get_recorder_output_ind
+
 
 def run_ts_custom_strain(mat, esig_v0, strains, osi=None, nu_dyn=None, target_d_inc=0.00001,
                          handle='silent', verbose=0, opyfile=None, dss=False, plain_strain=True):
@@ -103,18 +105,8 @@ def run_ts_custom_strain(mat, esig_v0, strains, osi=None, nu_dyn=None, target_d_
         # iforce3 = o3.get_node_reaction(osi, nodes[3], o3.cc.DOF2D_X)
         # print(iforce0, iforce1, iforce2, iforce3, stresses[2])
     else:
-        ro = o3.recorder.load_recorder_options()
-        import pandas as pd
-        df = pd.read_csv(ro)
-        mat_type = ele.mat.type
-        dfe = df[(df['mat'] == mat_type) & (df['form'] == oop)]
-        df_sxy = dfe[dfe['recorder'] == 'stress']
-        outs = df_sxy['outs'].iloc[0].split('-')
-        sxy_ind = outs.index('sxy')
-
-        df_gxy = dfe[dfe['recorder'] == 'strain']
-        outs = df_gxy['outs'].iloc[0].split('-')
-        gxy_ind = outs.index('gxy')
+        sxy_ind = get_recorder_output_ind(ele.mat.type, 'stress', 'sxy', form=oop)[0]
+        gxy_ind = get_recorder_output_ind(ele.mat.type, 'strain', 'gxy', form=oop)[0]
         stress = [stresses[sxy_ind]]
         cur_strains = o3.get_ele_response(osi, ele, 'strain')
         strain = [cur_strains[gxy_ind]]
@@ -242,18 +234,8 @@ def run_ud_custom_strain(mat, esig_v0, strains, osi=None, nu_dyn=None, target_d_
         force1 = o3.get_node_reaction(osi, nodes[1], o3.cc.DOF2D_X)
         stress = [-force0 - force1]
     else:
-        ro = o3.recorder.load_recorder_options()
-        import pandas as pd
-        df = pd.read_csv(ro)
-        mat_type = ele.mat.type
-        oop = o3.cc.PLANE_STRAIN
-        dfe = df[(df['mat'] == mat_type) & (df['form'] == oop)]
-        df_sxy = dfe[dfe['recorder'] == 'stress']
-        outs = df_sxy['outs'].iloc[0].split('-')
-        sxy_ind = outs.index('sxy')
-        df_gxy = dfe[dfe['recorder'] == 'strain']
-        outs = df_gxy['outs'].iloc[0].split('-')
-        gxy_ind = outs.index('gxy')
+        sxy_ind = get_recorder_output_ind(ele.mat.type, 'stress', 'sxy')[0]
+        gxy_ind = get_recorder_output_ind(ele.mat.type, 'strain', 'gxy')[0]
         stress = [curr_stresses[sxy_ind]]
         # cur_strains = o3.get_ele_response(osi, ele, 'strain')
         # strain = [cur_strains[gxy_ind]]
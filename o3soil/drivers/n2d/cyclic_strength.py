@@ -0,0 +1,360 @@
+import functools
+
+import numpy as np
+
+from o3soil.parallel import map_in_workers
+
+_CSR_N_CACHE = {}  # evaluations of `find_csr_for_n_cycles`, keyed by material and test conditions
+
+
+def get_n_cycles_to_criterion(stress, strain, ppt, esig_v0, csr, static_bias=0.0, strain_limit=0.03, ru_limit=None):
+    """
+    Number of loading cycles of an undrained cyclic simple shear test (see `run_ud_cdss`) to reach a criterion
+
+    A half cycle starts each time the shear stress passes half of the cyclic stress amplitude on the opposite
+    side of the mean (`-static_bias * esig_v0`), and the number of cycles is half the number of half cycles
+    started when the criterion is first reached (so liquefaction in the first loading quarter is 0.5 cycles).
+
+    Parameters
+    ----------
+    stress, strain, ppt: array_like
+        Shear stress, shear strain and vertical stress (negative in compression) returned by `run_ud_cdss`
+    esig_v0: float
+        Initial vertical effective stress
+    csr: float
+        Cyclic stress ratio of the test
+    static_bias: float
+        Static shear stress ratio of the test
+    strain_limit: float
+        Shear strain amplitude at which the soil is considered to have liquefied
+    ru_limit: float
+        If set, then the pore pressure ratio at which the soil is considered to have liquefied, otherwise the
+        strain criterion is used
+
+    Returns
+    -------
+    float
+        Number of cycles, nan if the criterion is not reached
+    """
+    stress = np.asarray(stress, dtype=float)
+    ppt = np.asarray(ppt, dtype=float)
+    consolidated = np.where(-ppt >= 0.99 * esig_v0)[0]
+    if not len(consolidated):
+        return np.nan
+    i_start = consolidated[0]
+    if ru_limit is None:
+        failed = np.abs(np.asarray(strain, dtype=float)[i_start:]) >= strain_limit
+    else:
+        failed = 1 + ppt[i_start:] / esig_v0 >= ru_limit
+    if not np.any(failed):
+        return np.nan
+    i_fail = np.argmax(failed)
+    # side of the mean of each point once past half of the amplitude (zero in between)
+    norm_stress = (stress[i_start:i_start + i_fail + 1] / esig_v0 + static_bias) / csr
+    sides = np.sign(norm_stress) * (np.abs(norm_stress) >= 0.5)
+    sides = sides[sides != 0]
+    n_half_cycles = np.sum(sides[1:] != sides[:-1]) + 1 if len(sides) else 1
+    return 0.5 * n_half_cycles
+
+
+def fit_crr_n_curve(csrs, n_cycs):
+    """
+    Fits the power law `CRR = a * N ** -b` to the cyclic stress ratios and the cycles to liquefaction
+
+    Points that did not liquefy (nan cycles) are ignored.
+
+    Returns
+    -------
+    a, b: float
+        nan if fewer than two points liquefied
+    """
+    csrs = np.asarray(csrs, dtype=float)
+    n_cycs = np.asarray(n_cycs, dtype=float)
+    ok = np.isfinite(n_cycs) & (n_cycs > 0)
+    if np.sum(ok) < 2:
+        return np.nan, np.nan
+    slope, intercept = np.polyfit(np.log(n_cycs[ok]), np.log(csrs[ok]), 1)
+    return np.exp(intercept), -slope
+
+
+def _run_cdss_test(mat_func, kwargs, criterion, item):
+    import o3seespy as o3
+    from o3soil.drivers.n2d.ud_cdss_2d import run_ud_cdss
+    csr, static_bias, esig_v0 = item
+    osi = o3.OpenSeesInstance(ndm=2, ndf=3, state=0)
+    mat = mat_func(osi)
+    kwargs = dict({'init_nonlinear': True}, **kwargs)
+    kwargs['disp_file'] = None  # the tests run at the same time, so they can not share the file
+    stress, strain, ppt, disps = run_ud_cdss(mat, esig_v0, csr, osi=osi, static_bias=static_bias, **kwargs)
+    return get_n_cycles_to_criterion(stress, strain, ppt, esig_v0, csr, static_bias=static_bias, **criterion)
+
+
+def run_csr_n_grid(mat_func, csrs, static_biases=(0.0,), esig_v0s=(100.0,), n_cycles=(5, 10, 15, 20, 30),
+                   n_lim=100, strain_limit=0.03, ru_limit=None, n_workers=None, timeout=None, start_method=None,
+                   **kwargs):
+    """
+    Cyclic strength (CRR-N) curves from a grid of undrained cyclic simple shear tests run in parallel
+
+    Each (csr, static_bias, esig_v0) test is run with `run_ud_cdss` in its own worker process, which only
+    returns the number of cycles to the strain (or pore pressure) criterion, and a power law is fitted
+    to the results of each (static_bias, esig_v0).
+
+    Parameters
+    ----------
+    mat_func: callable
+        Builds the material in an `OpenSeesInstance` (ndm=2, ndf=3), `mat_func(osi)`, must be picklable (e.g. a
+        module level function that returns `o3.nd_material.PM4Sand(osi, ...)`). The material must be in the
+        units of `esig_v0s` (e.g. `p_atm=101.0` for kPa)
+    csrs: array_like
+        Cyclic stress ratios
+    static_biases: array_like
+        Static shear stress ratios
+    esig_v0s: array_like
+        Initial vertical effective stresses
+    n_cycles: array_like
+        Numbers of cycles of the CRR table
+    n_lim: int
+        Maximum number of cycles of each test
+    strain_limit: float
+        Shear strain amplitude at which the soil is considered to have liquefied (and the test stops)
+    ru_limit: float
+        If set, then the pore pressure ratio at which the soil is considered to have liquefied
+    n_workers: int
+        Maximum number of concurrent tests, if None then uses all available cores
+    timeout: float
+        Maximum wall-clock time (in seconds) of each test, after which it is recorded as failed
+    start_method: str
+        Multiprocessing start method of the workers, see `o3soil.parallel.map_in_workers`
+    kwargs:
+        Passed to `run_ud_cdss` (e.g. `nu_dyn`, `strain_inc`), `init_nonlinear` is True unless set
+
+    Returns
+    -------
+    tests: array_like (structured)
+        'csr', 'static_bias', 'esig_v0' and 'n_cyc' (nan if not liquefied within `n_lim` or failed) of each test
+    table: dict
+        'static_bias', 'esig_v0', and the fitted 'a' and 'b' of each curve, 'n_cycles', and 'crr' the cyclic
+        resistance ratio of each curve at each number of cycles (n_curves, len(n_cycles))
+    errors: dict
+        Error message of each failed test, keyed by its index in `tests`
+    """
+    items = [(float(csr), float(sb), float(esig_v0)) for sb in static_biases for esig_v0 in esig_v0s
+             for csr in csrs]
+    kwargs.update({'n_lim': n_lim, 'strain_limit': strain_limit})
+    criterion = {'strain_limit': strain_limit, 'ru_limit': ru_limit}
+    func = functools.partial(_run_cdss_test, mat_func, kwargs, criterion)
+    n_cycs, errors = map_in_workers(func, items, n_workers=n_workers, start_method=start_method, timeout=timeout,
+                                    preload=['o3seespy', 'o3soil.drivers.n2d'])
+    tests = np.zeros(len(items), dtype=[('csr', float), ('static_bias', float), ('esig_v0', float),
+                                        ('n_cyc', float)])
+    for i, item in enumerate(items):
+        tests[i] = item + (np.nan if n_cycs[i] is None else n_cycs[i],)
+
+    n_cycles = np.asarray(n_cycles, dtype=float)
+    table = {'static_bias': [], 'esig_v0': [], 'a': [], 'b': [], 'n_cycles': n_cycles, 'crr': []}
+    for sb in static_biases:
+        for esig_v0 in esig_v0s:
+            group = tests[(tests['static_bias'] == sb) & (tests['esig_v0'] == esig_v0)]
+            a, b = fit_crr_n_curve(group['csr'], group['n_cyc'])
+            table['static_bias'].append(sb)
+            table['esig_v0'].append(esig_v0)
+            table['a'].append(a)
+            table['b'].append(b)
+            table['crr'].append(a * n_cycles ** -b)
+    for item in ['static_bias', 'esig_v0', 'a', 'b', 'crr']:
+        table[item] = np.array(table[item])
+    return tests, table, errors
+
+
+def solve_csr_for_n_cycles(func, n_target, n_lim, csr_init=0.15, rtol=0.01, max_evals=12, evals=None):
+    """
+    Bracketed search for the cyclic stress ratio that causes liquefaction in a target number of cycles
+
+    The number of cycles is decreasing with the CSR. The root is first bracketed by scaling the CSR by 1.5,
+    then refined with a secant step on log N between the bracket ends (kept at least a tenth of the bracket
+    from the ends), or a bisection step if the lower end did not liquefy within `n_lim` cycles.
+
+    Parameters
+    ----------
+    func: callable
+        `func(csr, n_lim)` returns the number of cycles to liquefaction, or nan if not liquefied in `n_lim` cycles
+    n_target: float
+        Target number of cycles
+    n_lim: int
+        Maximum number of cycles of each evaluation (at least `n_target`), beyond which the exact number is not
+        needed
+    csr_init: float
+        First CSR to evaluate
+    rtol: float
+        Relative width of the CSR bracket at which the search stops
+    max_evals: int
+        Maximum number of evaluations of `func`
+    evals: dict
+        Previous evaluations `{csr: (n_cyc, n_lim)}`, updated in place
+
+    Returns
+    -------
+    dict
+        'csr' (interpolated between the bracket ends), 'n_cyc' (cycles at the nearest evaluation),
+        'bracket' (csr_lo, csr_hi), 'n_evals' (new evaluations of `func`), 'evals'
+    """
+    if evals is None:
+        evals = {}
+    log_target = np.log(n_target)
+    n_evals = 0
+
+    def evaluate(csr):
+        nonlocal n_evals
+        csr = float(csr)
+        if csr in evals:
+            n_cyc, n_lim_prev = evals[csr]
+            if np.isfinite(n_cyc) or n_lim_prev >= n_lim:
+                return n_cyc
+        n_cyc = func(csr, n_lim)
+        n_evals += 1
+        evals[csr] = (n_cyc, n_lim)
+        return n_cyc
+
+    def get_bracket():
+        lo, hi, exact = None, None, None
+        for csr, (n_cyc, n_lim_prev) in evals.items():
+            if np.isfinite(n_cyc) and n_cyc == n_target:
+                exact = csr if exact is None else min(exact, csr)
+            elif (np.isfinite(n_cyc) and n_cyc > n_target) or (not np.isfinite(n_cyc) and n_lim_prev >= n_target):
+                lo = csr if lo is None else max(lo, csr)
+            elif np.isfinite(n_cyc):
+                hi = csr if hi is None else min(hi, csr)
+        return lo, hi, exact
+
+    lo, hi, exact = get_bracket()
+    while exact is None and n_evals < max_evals:
+        if lo is None and hi is None:
+            csr = csr_init
+        elif lo is None:
+            csr = hi / 1.5
+        elif hi is None:
+            csr = lo * 1.5
+        elif hi / lo - 1 < rtol:
+            break
+        else:
+            n_lo = evals[lo][0]
+            if np.isfinite(n_lo):
+                f_lo = np.log(n_lo) - log_target
+                f_hi = np.log(evals[hi][0]) - log_target
+                csr = lo + (hi - lo) * f_lo / (f_lo - f_hi)
+                csr = np.clip(csr, lo + 0.1 * (hi - lo), hi - 0.1 * (hi - lo))
+            else:
+                csr = (lo + hi) / 2
+        evaluate(csr)
+        lo, hi, exact = get_bracket()
+
+    res = {'bracket': (lo, hi), 'n_evals': n_evals, 'evals': evals}
+    if exact is not None:
+        res['csr'] = exact
+    elif lo is not None and hi is not None and np.isfinite(evals[lo][0]):
+        f_lo = np.log(evals[lo][0]) - log_target
+        f_hi = np.log(evals[hi][0]) - log_target
+        res['csr'] = lo + (hi - lo) * f_lo / (f_lo - f_hi)
+    elif lo is not None and hi is not None:
+        res['csr'] = (lo + hi) / 2
+    else:
+        res['csr'] = np.nan
+    nearest = [csr for csr in (exact, lo, hi) if csr is not None]
+    nearest = min(nearest, key=lambda x: abs(x - res['csr'])) if len(nearest) and np.isfinite(res['csr']) else None
+    res['n_cyc'] = np.nan if nearest is None else evals[nearest][0]
+    return res
+
+
+def _get_func_key(func):
+    """Name of a function that is the same in every process, or None if it has no name"""
+    qualname = getattr(func, '__qualname__', None)
+    if qualname is None or getattr(func, '__module__', None) is None:
+        return None
+    return func.__module__ + '.' + qualname
+
+
+def _to_hashable(value):
+    """Converts lists and arrays (recursively) to tuples, raises TypeError if the value can not be hashed"""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_to_hashable(v) for v in value)
+    hash(value)
+    return value
+
+
+def _run_cdss_trial(mat_func, esig_v0, static_bias, strain_limit, kwargs, timeout, start_method, csr, n_lim):
+    func = functools.partial(_run_cdss_test, mat_func, dict(kwargs, n_lim=n_lim, strain_limit=strain_limit),
+                             {'strain_limit': strain_limit})
+    n_cycs, errors = map_in_workers(func, [(csr, static_bias, esig_v0)], n_workers=1, start_method=start_method,
+                                    timeout=timeout, preload=['o3seespy', 'o3soil.drivers.n2d'])
+    if errors:
+        raise RuntimeError(errors[0])
+    return n_cycs[0]
+
+
+def find_csr_for_n_cycles(mat_func, n_target=15, esig_v0=100.0, static_bias=0.0, csr_init=0.15, n_max_ratio=2.0,
+                          rtol=0.01, max_evals=12, strain_limit=0.03, mat_key=None, cache=None, timeout=None,
+                          start_method=None, **kwargs):
+    """
+    Cyclic stress ratio that causes liquefaction of a material in a target number of cycles
+
+    Each evaluation is an undrained cyclic simple shear test (`run_ud_cdss`) in its own worker process, stopped
+    at `n_max_ratio * n_target` cycles since only a bound on the number of cycles is needed beyond that (see
+    `solve_csr_for_n_cycles`). The evaluations are cached per material and test conditions, so later searches
+    (e.g. for another number of cycles) start from the known results.
+
+    Parameters
+    ----------
+    mat_func: callable
+        Builds the material in an `OpenSeesInstance` (ndm=2, ndf=3), `mat_func(osi)` (see `run_csr_n_grid`)
+    n_target: float
+        Target number of cycles
+    esig_v0: float
+        Initial vertical effective stress
+    static_bias: float
+        Static shear stress ratio
+    csr_init: float
+        First CSR to evaluate
+    n_max_ratio: float
+        Ratio of the maximum number of cycles of each test to `n_target` (1.0 stops each test at the target,
+        so the search only uses bisection when the test does not liquefy)
+    rtol: float
+        Relative width of the CSR bracket at which the search stops
+    max_evals: int
+        Maximum number of new tests
+    strain_limit: float
+        Shear strain amplitude at which the soil is considered to have liquefied
+    mat_key: hashable
+        Identifies the material in the cache, if None then the module and qualified name of `mat_func` (the
+        evaluations are not cached if `mat_func` has no name, e.g. a `functools.partial`)
+    cache: dict
+        Cache of the evaluations, if None then a module level cache is used (not used if a value of `kwargs` can
+        not be hashed)
+    timeout: float
+        Maximum wall-clock time (in seconds) of each test
+    start_method: str
+        Multiprocessing start method of the workers, see `o3soil.parallel.map_in_workers`
+    kwargs:
+        Passed to `run_ud_cdss` (e.g. `nu_dyn`, `strain_inc`), `init_nonlinear` is True unless set
+
+    Returns
+    -------
+    dict
+        See `solve_csr_for_n_cycles`
+    """
+    if cache is None:
+        cache = _CSR_N_CACHE
+    if mat_key is None:
+        mat_key = _get_func_key(mat_func)
+    try:
+        key = _to_hashable((mat_key, float(esig_v0), float(static_bias), float(strain_limit),
+                            sorted(kwargs.items())))
+    except TypeError:
+        key = None
+    evals = {} if mat_key is None or key is None else cache.setdefault(key, {})
+    n_lim = int(np.ceil(max(n_max_ratio, 1.0) * n_target))
+    func = functools.partial(_run_cdss_trial, mat_func, esig_v0, static_bias, strain_limit, kwargs, timeout,
+                             start_method)
+    return solve_csr_for_n_cycles(func, n_target, n_lim, csr_init=csr_init, rtol=rtol, max_evals=max_evals,
+                                  evals=evals)
@@ -1,10 +1,21 @@
 import o3seespy as o3
 import math
 
+from o3soil.generic import get_recorder_output_ind
+
 
 def run_ud_cdss(mat, esig_v0, csr, osi=None, static_bias=0.0, n_lim=100, nu_dyn=None, opyfile=None,
-                strain_limit=0.03, strain_inc=5.0e-6, verbose=0):
-    """Undrained cyclic simple shear test for 2d element"""
+                strain_limit=0.03, strain_inc=5.0e-6, disp_file='node_disp.txt', init_nonlinear=False, verbose=0):
+    """
+    Undrained cyclic simple shear test for 2d element
+
+    The node displacements are also saved to `disp_file` (not saved if None), which must differ between
+    tests that run at the same time.
+
+    If `init_nonlinear` is True, then the material state is initialised (`set_first_call`) as soon as the material
+    is updated to nonlinear, rather than after the first 25 nonlinear steps. Until then the state of PM4Sand is
+    not set, so without it the same test can fail (nan stress) or not depending on the process it runs in.
+    """
     damp = 0.02
     omega0 = 0.2
     omega1 = 20.0
@@ -53,7 +64,8 @@ def run_ud_cdss(mat, esig_v0, csr, osi=None, static_bias=0.0, n_lim=100, nu_dyn=
     all_stresses_cache = o3.recorder.ElementToArrayCache(osi, ele, arg_vals=['stress'])
     all_strains_cache = o3.recorder.ElementToArrayCache(osi, ele, arg_vals=['strain'])
     nodes_cache = o3.recorder.NodesToArrayCache(osi, all_nodes, dofs=[1, 2, 3], res_type='disp')
-    o3.recorder.NodesToFile(osi, 'node_disp.txt', all_nodes, dofs=[1, 2, 3], res_type='disp')
+    if disp_file is not None:
+        o3.recorder.NodesToFile(osi, disp_file, all_nodes, dofs=[1, 2, 3], res_type='disp')
 
     # Add static vertical pressure and stress bias
     time_series = o3.time_series.Path(osi, time=[0, 100, 1e10], values=[0, 1, 1])
@@ -78,23 +90,17 @@ def run_ud_cdss(mat, esig_v0, csr, osi=None, static_bias=0.0, n_lim=100, nu_dyn=
 
     if hasattr(mat, 'update_to_nonlinear'):
         mat.update_to_nonlinear()
+        if init_nonlinear and hasattr(mat, 'set_first_call'):
+            mat.set_first_call(value=0, ele=ele)
         o3.analyze(osi, 25, dt=1)
-    if hasattr(mat, 'set_first_call'):
+    if not init_nonlinear and hasattr(mat, 'set_first_call'):
         mat.set_first_call(value=0, ele=ele)
     # o3.set_parameter(osi, value=0, eles=[ele], args=['FirstCall', mat.tag])
     o3.analyze(osi, 25, dt=1)
     if nu_dyn is not None:
         mat.set_nu(nu_dyn, ele=ele)
 
-    ro = o3.recorder.load_recorder_options()
-    import pandas as pd
-    df = pd.read_csv(ro)
-    mat_type = ele.mat.type
-    oop = o3.cc.PLANE_STRAIN
-    dfe = df[(df['mat'] == mat_type) & (df['form'] == oop)]
-    df_sxy = dfe[dfe['recorder'] == 'stress']
-    outs = df_sxy['outs'].iloc[0].split('-')
-    sxy_ind = outs.index('sxy')
+    sxy_ind = get_recorder_output_ind(ele.mat.type, 'stress', 'sxy')[0]
 
     n_cyc = 0.0
     target_strain = 1.1 * strain_limit
@@ -145,7 +151,7 @@ def run_ud_cdss(mat, esig_v0, csr, osi=None, static_bias=0.0, n_lim=100, nu_dyn=
         i = 0
         while curr_stress > -(csr + static_bias) * esig_v0:
             o3.analyze(osi, 1, dt=1)
-            curr_stress = o3.get_ele_response(osi, ele, 'stress')[2]
+            curr_stress = o3.get_ele_response(osi, ele, 'stress')[sxy_ind]
             h_disp = o3.get_node_disp(osi, tr_node, o3.cc.X)
 
             if -h_disp >= target_disp:
@@ -192,14 +198,15 @@ def run_ud_cdss(mat, esig_v0, csr, osi=None, static_bias=0.0, n_lim=100, nu_dyn=
     all_stresses = all_stresses_cache.collect()
     all_strains = all_strains_cache.collect()
     disps = nodes_cache.collect()
-    stress = all_stresses[:, 2]
-    strain = all_strains[:, 2]
-    ppt = all_stresses[:, 1]
+    stress = all_stresses[:, sxy_ind]
+    strain = all_strains[:, get_recorder_output_ind(ele.mat.type, 'strain', 'gxy')[0]]
+    ppt = all_stresses[:, get_recorder_output_ind(ele.mat.type, 'stress', 'syy')[0]]
 
     return stress, strain, ppt, disps
 
 
-def run_example(show=0):
+def run_example(show=0, out_dir=''):
+    import os
     import o3seespy as o3
 
     esig_v0 = 101.3
@@ -224,7 +231,9 @@ def run_example(show=0):
     # mat = o3.nd_material.ElasticIsotropic(osi, e_mod=1.0e10, nu=0.3)  # TODO: not working with the elastic model!!!
     # nu_dyn = None
     stress, strain, ppt, disps = run_ud_cdss(mat, csr=csr, osi=osi, n_lim=20, strain_limit=0.03, nu_dyn=nu_dyn,
-                                                esig_v0=esig_v0, strain_inc=strain_inc, opyfile='ss.py', verbose=0)
+                                                esig_v0=esig_v0, strain_inc=strain_inc,
+                                                opyfile=os.path.join(out_dir, 'ss.py'),
+                                                disp_file=os.path.join(out_dir, 'node_disp.txt'), verbose=0)
 
     if show:
         import matplotlib.pyplot as plt
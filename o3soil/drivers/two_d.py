@@ -1,9 +1,6 @@
 import o3seespy as o3
 
-import liquepy as lq
 import numpy as np
-import eqsig
-import sfsimodels as sm
 
 
 def run_2d_stress_driver(osi, base_mat, esig_v0, forces, d_step=0.001, max_steps=10000, handle='silent', da_strain_max=0.05, max_cycles=200, srate=0.0001, esig_v_min=1.0, k0_init=1, verbose=0,
@@ -317,6 +314,7 @@ def _set_params_from_op_pimy_model(sl, p_ref, strain_max, hyp=True):
 
 
 def get_pimy_soil():
+    import sfsimodels as sm
     sl = sm.Soil()
     vs = 200.
     unit_mass = 1700.0
@@ -340,6 +338,7 @@ def get_pimy_soil():
 if __name__ == '__main__':
 
     import matplotlib.pyplot as plt
+    import eqsig
 
     sl = get_pimy_soil()
 
@@ -1,5 +1,12 @@
+import csv
+import inspect
+import functools
+
+import numpy as np
 import o3seespy as o3
 
+STRESS_DEPENDENT_PARAMS = ['g_mod_ref', 'bulk_mod_ref', 'p_ref', 'e_mod', 'g_mod']
+
 
 def get_o3_class_and_args_from_soil_obj(sl, saturated=False, esig_v0=None, f_order=1e3, overrides=None):
     if overrides is None:
@@ -71,3 +78,105 @@ def get_o3_class_and_args_from_soil_obj(sl, saturated=False, esig_v0=None, f_ord
         app2mod['rho'] = 'unit_moist_mass'
     args, kwargs = o3.extensions.get_o3_kwargs_from_obj(sl, sl_class, custom=app2mod, overrides=overrides)
     return sl_class, args, kwargs
+
+
+@functools.lru_cache(maxsize=None)
+def get_recorder_layout():
+    """
+    Output components of the element recorders, keyed by (material type, formulation, recorder)
+
+    Parsed once per process from the o3seespy recorder options.
+    """
+    layout = {}
+    with o3.recorder.load_recorder_options() as f:
+        for row in csv.DictReader(f):
+            layout[(row['mat'], row['form'], row['recorder'])] = tuple(row['outs'].split('-'))
+    return layout
+
+
+@functools.lru_cache(maxsize=None)
+def get_recorder_output_ind(mat_type, recorder, component, form=o3.cc.PLANE_STRAIN):
+    """
+    Index of an output component of an element recorder (e.g. 'sxy' of 'stress')
+
+    Returns
+    -------
+    ind: int
+        Index of the component in the outputs of the element
+    n_outs: int
+        Number of outputs of the element
+    """
+    outs = get_recorder_layout().get((mat_type, form, recorder))
+    if outs is None:
+        raise ValueError(f'recorder options not available for: {mat_type}, {form}, {recorder}')
+    return outs.index(component), len(outs)
+
+
+class MaterialRegistry(object):
+    """
+    Creates OpenSees materials, and returns the existing material if an identical material has already been created
+
+    Materials are keyed on the class and the (canonicalised) args and kwargs, so identical sub-layers anywhere in
+    the model share a single material.
+
+    Parameters
+    ----------
+    osi: o3seespy.OpenSeesInstance
+    rtol: float
+        If greater than zero, then the stress-dependent parameters (`quantised`) are rounded to a geometric grid
+        with a ratio of `1 + rtol`, so that sub-layers with nearly the same stress share a material
+    quantised: list of str
+        Names of the parameters that are rounded if `rtol` is greater than zero
+    """
+
+    def __init__(self, osi, rtol=0.0, quantised=None):
+        self.osi = osi
+        self.rtol = rtol
+        if quantised is None:
+            quantised = STRESS_DEPENDENT_PARAMS
+        self.quantised = quantised
+        self.mats = {}
+        self._arg_names = {}
+
+    def get_arg_names(self, mat_class):
+        if mat_class not in self._arg_names:
+            self._arg_names[mat_class] = list(inspect.signature(mat_class.__init__).parameters)[2:]  # skip self, osi
+        return self._arg_names[mat_class]
+
+    def quantise(self, value):
+        if not self.rtol or value == 0:
+            return value
+        step = np.log1p(self.rtol)
+        return float(np.sign(value) * np.exp(np.round(np.log(abs(value)) / step) * step))
+
+    def canonical(self, value):
+        """Hashable version of the value, with floats rounded to 12 significant figures"""
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return tuple([self.canonical(val) for val in value])
+        if isinstance(value, (float, np.floating)):
+            return float(f'{value:.12g}')
+        if isinstance(value, np.integer):
+            return int(value)
+        return value
+
+    def get_mat(self, mat_class, args, kwargs, dynamic_poissons_ratio=None):
+        """
+        Returns the material of class `mat_class` built with `args` and `kwargs` (creates it if it does not exist)
+        """
+        if self.rtol:
+            names = self.get_arg_names(mat_class)
+            args = [self.quantise(arg) if names[i] in self.quantised and isinstance(arg, float) else arg
+                    for i, arg in enumerate(args)]
+            kwargs = {pm: self.quantise(kwargs[pm]) if pm in self.quantised and isinstance(kwargs[pm], float)
+                      else kwargs[pm] for pm in kwargs}
+        key = (mat_class, self.canonical(args), tuple([(pm, self.canonical(kwargs[pm])) for pm in sorted(kwargs)]),
+               self.canonical(dynamic_poissons_ratio))
+        if key not in self.mats:
+            mat = mat_class(self.osi, *args, **kwargs)
+            mat.dynamic_poissons_ratio = dynamic_poissons_ratio
+            self.mats[key] = mat
+        return self.mats[key]
+
+    @property
+    def n_mats(self):
+        return len(self.mats)
@@ -0,0 +1,138 @@
+import os
+import time
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+
+def get_n_workers(n_workers=None):
+    """Number of worker processes, defaults to the number of cores available to this process"""
+    if n_workers is None or n_workers <= 0:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+    return int(n_workers)
+
+
+def get_default_start_method():
+    """Start method for clean worker processes, 'forkserver' where available, otherwise 'spawn'"""
+    if 'forkserver' in mp.get_all_start_methods():
+        return 'forkserver'
+    return 'spawn'
+
+
+def _call_and_send(conn, func, item):
+    try:
+        res = (0, func(item))
+    except BaseException:
+        res = (1, traceback.format_exc())
+    conn.send(res)
+    conn.close()
+
+
+def get_context(start_method=None, preload=None):
+    """Multiprocessing context of the start method (see `map_in_workers`)"""
+    if start_method is None:
+        start_method = get_default_start_method()
+    ctx = mp.get_context(start_method)
+    if start_method == 'forkserver' and preload is not None:
+        ctx.set_forkserver_preload(list(preload))
+    return ctx
+
+
+def map_in_workers(func, items, n_workers=None, start_method=None, timeout=None, preload=None, callback=None):
+    """
+    Evaluates `func(item)` for each item, with each evaluation in its own worker process
+
+    OpenSees holds a single global model per process (and does not always fully reset on wipe),
+    so every evaluation gets a fresh process, and a failed evaluation (including a crash or hang of
+    the OpenSees library) does not stop the others.
+
+    Parameters
+    ----------
+    func: callable
+        Function of a single item, must be picklable unless `start_method='fork'`
+    items: iterable
+        Inputs to `func`
+    n_workers: int
+        Maximum number of concurrent worker processes, if None then uses all available cores
+    start_method: str
+        Multiprocessing start method, if None then uses 'forkserver' where available, otherwise 'spawn'.
+        With 'fork' each worker inherits the current state of this process.
+    timeout: float
+        Maximum wall-clock time (in seconds) of each evaluation, after which the worker is terminated
+    preload: list of str
+        Modules to import once in the fork server (only used with 'forkserver')
+    callback: callable
+        If set, then called as `callback(i, result, error)` as soon as the evaluation of item `i` finishes (`error`
+        is None if it succeeded), and the results are not kept
+
+    Returns
+    -------
+    results: list
+        `func(item)` in the order of `items` (None where the evaluation failed, or all None if `callback` is set)
+    errors: dict
+        Error message of each failed evaluation, keyed by the index of the item
+    """
+    items = list(items)
+    ctx = get_context(start_method, preload)
+    n_workers = min(get_n_workers(n_workers), max(len(items), 1))
+    results = [None] * len(items)
+    errors = {}
+    pending = list(range(len(items)))[::-1]
+    running = {}  # receiving connection -> (item index, process, start time)
+    while pending or running:
+        while pending and len(running) < n_workers:
+            i = pending.pop()
+            r_conn, s_conn = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_call_and_send, args=(s_conn, func, items[i]))
+            proc.start()
+            s_conn.close()
+            running[r_conn] = (i, proc, time.time())
+        wait_time = None
+        if timeout is not None:
+            first_start = min([running[conn][2] for conn in running])
+            wait_time = max(first_start + timeout - time.time(), 0.0)
+        for conn in wait(list(running), timeout=wait_time):
+            i, proc, start = running.pop(conn)
+            try:
+                failed, res = conn.recv()
+            except EOFError:  # worker died before sending a result
+                proc.join()
+                failed, res = 1, f'worker process exited with code {proc.exitcode}'
+            conn.close()
+            proc.join()
+            if failed:
+                errors[i] = res
+            elif callback is None:
+                results[i] = res
+            if callback is not None:
+                callback(i, None if failed else res, res if failed else None)
+        if timeout is not None:
+            for conn in list(running):
+                i, proc, start = running[conn]
+                if time.time() - start > timeout:
+                    proc.terminate()
+                    proc.join()
+                    conn.close()
+                    del running[conn]
+                    errors[i] = f'worker process terminated after exceeding timeout={timeout}s'
+                    if callback is not None:
+                        callback(i, None, errors[i])
+    return results, errors
+
+
+def run_in_fork(func):
+    """
+    Evaluates `func()` in a forked copy of the current process and returns the result
+
+    The state of the current process (including any OpenSees model) is left unchanged,
+    so it can be used as a snapshot that several evaluations start from.
+    """
+    if 'fork' not in mp.get_all_start_methods():
+        raise ValueError("run_in_fork requires the 'fork' start method, which is not available on this platform")
+    results, errors = map_in_workers(lambda x: func(), [None], n_workers=1, start_method='fork')
+    if errors:
+        raise RuntimeError(errors[0])
+    return results[0]
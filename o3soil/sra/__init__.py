@@ -1,2 +1,7 @@
 from .one_d import *
-from .one_d_eff import run_essra, ESSRA1D
\ No newline at end of file
+from .one_d_eff import run_essra, ESSRA1D
+from .batch import run_sra_suite
+from .one_d_fd import run_fd_sra, FDSRA1D
+from .output import NpzResults
+from .stochastic import run_sra_monte_carlo
+from .post import calc_response_spectra, calc_response_spectra_from_results, calc_transfer_functions
@@ -0,0 +1,164 @@
+import os
+import functools
+import traceback
+import multiprocessing as mp
+
+from o3soil.parallel import map_in_workers, get_context
+
+_INIT_KWARGS = ['dy', 'k0', 'base_imp', 'opfile', 'verbose', 'mat_rtol', 'cache_fmt', 'instrument', 'f_max',
+                'n_per_wave', 'softening']
+
+
+def _get_motion_cache_path(cache_path, i):
+    ffp = os.path.join(cache_path, f'{i}', '')
+    if not os.path.exists(ffp):
+        os.makedirs(ffp)
+    return ffp
+
+
+def _run_motion(sp, essra, cache_path, kwargs, item):
+    i, asig = item
+    from o3soil.sra.one_d import run_sra
+    from o3soil.sra.one_d_eff import run_essra
+    if cache_path is not None:
+        kwargs = dict(kwargs)
+        kwargs['cache_path'] = _get_motion_cache_path(cache_path, i)
+    if essra:
+        sra_1d = run_essra(sp, asig, **kwargs)
+    else:
+        sra_1d = run_sra(sp, asig, **kwargs)
+    return sra_1d.out_dict
+
+
+def _run_motion_from_static(sra_1d, cache_path, kwargs, item):
+    i, asig = item
+    if cache_path is not None:
+        sra_1d.cache_path = _get_motion_cache_path(cache_path, i)
+        sra_1d.o3res.cache_path = sra_1d.cache_path
+    sra_1d.execute_dynamic(asig, **kwargs)
+    return sra_1d.out_dict
+
+
+def _run_suite_from_static(sp, essra, init_kwargs, cache_path, dyn_kwargs, n_workers, timeout, conn, asigs):
+    # sends the result of each motion as soon as it finishes, so the suite is never held in (or pickled by) this worker
+    try:
+        sra_1d = build_static_sra(sp, essra=essra, **init_kwargs)
+    except BaseException:
+        conn.send((None, None, traceback.format_exc()))
+        conn.close()
+        return
+    func = functools.partial(_run_motion_from_static, sra_1d, cache_path, dyn_kwargs)
+    map_in_workers(func, enumerate(asigs), n_workers=n_workers, start_method='fork', timeout=timeout,
+                   callback=lambda i, res, error: conn.send((i, res, error)))
+    conn.close()
+
+
+def build_static_sra(sp, essra=False, **kwargs):
+    """
+    Build the soil column and run the static analysis (and the static loads if `sp` has `hloads`)
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+    essra: bool
+        If True then builds an `ESSRA1D` object otherwise a `SRA1D` object
+    kwargs:
+        Passed to the `SRA1D` or `ESSRA1D` initialisation
+
+    Returns
+    -------
+    SRA1D or ESSRA1D object
+    """
+    from o3soil.sra.one_d import SRA1D
+    from o3soil.sra.one_d_eff import ESSRA1D
+    if essra:
+        sra_1d = ESSRA1D(sp, **kwargs)
+    else:
+        sra_1d = SRA1D(sp, **kwargs)
+    sra_1d.build_model()
+    sra_1d.execute_static()
+    if hasattr(sra_1d.sp, 'hloads'):
+        sra_1d.apply_loads()
+    return sra_1d
+
+
+def run_sra_suite(sp, asigs, n_workers=None, essra=False, cache_path=None, reuse_static=True, timeout=None,
+                  start_method=None, **kwargs):
+    """
+    Run a site response analysis of a soil profile for each motion in a suite of ground motions
+
+    Each motion is analysed in an isolated worker process with its own OpenSeesInstance.
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+        A soil profile
+    asigs: iterable of eqsig.AccSignal objects
+        The suite of input motions
+    n_workers: int
+        Maximum number of concurrent analyses, if None then uses all available cores
+    essra: bool
+        If True then use the effective stress analysis (`run_essra`) otherwise `run_sra`
+    cache_path: str
+        If not None, then the results of motion `i` are cached in the folder `<cache_path>/<i>/`
+    reuse_static: bool
+        If True (and the platform supports 'fork'), then the model is built and the static analysis is run once
+        in a dedicated worker process, and the worker of each motion is forked from that post-static state
+        (so no OpenSees model is built in this process). The results are sent back per motion as they finish.
+        Raises a RuntimeError if the static analysis fails, since none of the motions can then be run
+    timeout: float
+        Maximum wall-clock time (in seconds) of each analysis, after which it is recorded as failed
+    start_method: str
+        Multiprocessing start method of the workers (of the static state worker if `reuse_static`), see
+        `o3soil.parallel.map_in_workers`
+    kwargs:
+        Passed to `run_sra` or `run_essra` (e.g. `outs`, `analysis_dt`, `dy`, `base_imp`)
+
+    Returns
+    -------
+    out_dicts: list
+        The output dictionary of each analysis in the order of `asigs` (None if the analysis failed)
+    errors: dict
+        Error message of each failed analysis, keyed by the index of the motion
+    """
+    asigs = list(asigs)
+    if reuse_static and 'fork' in mp.get_all_start_methods():
+        init_kwargs = {}
+        dyn_kwargs = {'playback': False, 'playback_dt': 0.01}  # consistent with run_sra
+        for item in kwargs:
+            if item in _INIT_KWARGS:
+                init_kwargs[item] = kwargs[item]
+            else:
+                dyn_kwargs[item] = kwargs[item]
+        # the static state is built in a clean worker, so this process never builds an OpenSees model
+        ctx = get_context(start_method, preload=['o3soil.sra'])
+        r_conn, s_conn = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_run_suite_from_static, args=(sp, essra, init_kwargs, cache_path, dyn_kwargs,
+                                                                n_workers, timeout, s_conn, asigs))
+        proc.start()
+        s_conn.close()
+        out_dicts = [None] * len(asigs)
+        errors = {}
+        pending = set(range(len(asigs)))
+        while True:
+            try:
+                i, res, error = r_conn.recv()
+            except EOFError:
+                break
+            if i is None:
+                r_conn.close()
+                proc.join()
+                raise RuntimeError('The static analysis of the suite failed:\n' + error)
+            pending.discard(i)
+            if error is None:
+                out_dicts[i] = res
+            else:
+                errors[i] = error
+        r_conn.close()
+        proc.join()
+        for i in sorted(pending):
+            errors[i] = f'static state worker process exited with code {proc.exitcode}'
+        return out_dicts, errors
+    func = functools.partial(_run_motion, sp, essra, cache_path, kwargs)
+    return map_in_workers(func, enumerate(asigs), n_workers=n_workers, start_method=start_method, timeout=timeout,
+                          preload=['o3soil.sra'])
@@ -0,0 +1,259 @@
+import numpy as np
+import o3seespy as o3
+
+ELE_PROP_DTYPE = np.dtype([('layer', int), ('saturated', bool), ('v_eff', float), ('m_eff', float),
+                           ('unit_mass', float), ('g_mod', float)])
+
+
+def _as_float(value):
+    return np.nan if value is None else value
+
+
+def get_ele_prop_table(sp, depths):
+    """
+    Soil properties at the centre of each element of a soil column
+
+    The layer of each element is found with `searchsorted` over the layer depths, and the vertical effective
+    stress is interpolated from its values at the layer boundaries and the water table (where it is piecewise
+    linear), so the profile is integrated once per layer rather than once per element.
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+    depths: array_like
+        Depths of the element centres (positive downwards)
+
+    Returns
+    -------
+    array_like (structured)
+        'layer': index of the layer (as in `sp.layer`),
+        'saturated': True if below the water table,
+        'v_eff': vertical effective stress (Pa),
+        'm_eff': mean effective stress (Pa) with k0 from the Poisson's ratio of the layer,
+        'unit_mass': saturated or dry unit mass (kg/m3), nan if not defined,
+        'g_mod': shear modulus at the mean (or vertical) effective stress if the soil is stress dependent,
+        otherwise the shear modulus of the soil (Pa), nan for pre-built materials
+    """
+    depths = np.asarray(depths, dtype=float)
+    layer_depths = np.array([sp.layer_depth(i + 1) for i in range(sp.n_layers)], dtype=float)
+    layers = [sp.layer(i + 1) for i in range(sp.n_layers)]
+    props = np.zeros(len(depths), dtype=ELE_PROP_DTYPE)
+    props['layer'] = np.searchsorted(layer_depths, depths, side='right')
+    props['saturated'] = depths > sp.gwl
+
+    max_depth = max(np.max(depths), layer_depths[-1])
+    bounds = list(layer_depths[layer_depths < max_depth]) + [max_depth]
+    if np.isfinite(sp.gwl) and 0 < sp.gwl < max_depth:
+        bounds.append(sp.gwl)
+    bounds = np.unique(bounds)
+    v_effs = np.array([sp.get_v_eff_stress_at_depth(z) for z in bounds], dtype=float)
+    props['v_eff'] = np.interp(depths, bounds, v_effs)
+
+    for i, sl in enumerate(layers):
+        inds = np.where(props['layer'] == i + 1)[0]
+        if not len(inds):
+            continue
+        sat = props['saturated'][inds]
+        if np.any(sat):
+            props['unit_mass'][inds[sat]] = _as_float(getattr(sl, 'unit_sat_mass', None))
+        if not np.all(sat):
+            props['unit_mass'][inds[~sat]] = _as_float(getattr(sl, 'unit_dry_mass', None))
+        if hasattr(sl, 'op_type'):
+            props['m_eff'][inds] = np.nan
+            props['g_mod'][inds] = np.nan
+            continue
+        v_eff = props['v_eff'][inds]
+        nu = _as_float(sl.poissons_ratio)
+        k0 = nu / (1 - nu)
+        m_eff = v_eff * (1 + 2 * k0) / 3
+        props['m_eff'][inds] = m_eff
+        try:
+            if hasattr(sl, 'get_g_mod_at_m_eff_stress'):
+                props['g_mod'][inds] = sl.get_g_mod_at_m_eff_stress(m_eff)
+            elif hasattr(sl, 'get_g_mod_at_v_eff_stress'):
+                props['g_mod'][inds] = sl.get_g_mod_at_v_eff_stress(v_eff)
+            else:
+                props['g_mod'][inds] = _as_float(getattr(sl, 'g_mod', None))
+        except TypeError:  # stress dependence not defined (e.g. g0_mod is None)
+            props['g_mod'][inds] = np.nan
+    return props
+
+
+def gen_wavelength_split(sp, f_max, n_per_wave=10, softening=1.0, dy=0.5, min_dy=0.1):
+    """
+    Splits a soil profile into sub-layers sized from the shear wavelength at a target maximum frequency
+
+    The target thickness at each depth is `softening * Vs / (f_max * n_per_wave)`, and each layer is divided
+    into the fewest equal-wavelength sub-layers that satisfy it, so that stiff deep layers get fewer, thicker
+    elements than soft layers. Sets and returns `sp.split` in the same form as `sp.gen_split`.
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+    f_max: float
+        Maximum frequency that the mesh must transmit (Hz)
+    n_per_wave: int
+        Number of elements per wavelength
+    softening: float
+        Ratio of the strain-softened to the small strain shear wave velocity (<= 1)
+    dy: float
+        Target thickness where the shear wave velocity is not defined (e.g. pre-built materials)
+    min_dy: float
+        Minimum thickness of the sub-layers
+
+    Returns
+    -------
+    dict
+        'thickness', 'depth' (top of each sub-layer), 'shear_vel' and 'unit_mass'
+    """
+    layer_depths = np.array([sp.layer_depth(i + 1) for i in range(sp.n_layers)] + [sp.height], dtype=float)
+    node_depths = [0.0]
+    for i in range(sp.n_layers):
+        top, bot = layer_depths[i], layer_depths[i + 1]
+        if bot <= top:
+            continue
+        zs = np.linspace(top, bot, int(np.ceil((bot - top) / min_dy)) + 1)
+        props = get_ele_prop_table(sp, (zs[1:] + zs[:-1]) / 2)
+        vs = np.sqrt(props['g_mod'] / props['unit_mass'])
+        h_target = np.where(np.isfinite(vs), softening * vs / (f_max * n_per_wave), dy)
+        h_target = np.maximum(h_target, min_dy)
+        n_waves = np.insert(np.cumsum(np.diff(zs) / h_target), 0, 0)  # elements needed down to each depth
+        n_eles = max(int(np.ceil(n_waves[-1] - 1.0e-9)), 1)
+        node_depths += list(np.interp(np.arange(1, n_eles) * n_waves[-1] / n_eles, n_waves, zs)) + [bot]
+    node_depths = np.array(node_depths)
+    props = get_ele_prop_table(sp, (node_depths[1:] + node_depths[:-1]) / 2)
+    sp.split = {'thickness': np.diff(node_depths), 'depth': node_depths[:-1],
+                'shear_vel': np.sqrt(props['g_mod'] / props['unit_mass']), 'unit_mass': props['unit_mass']}
+    return sp.split
+
+
+def gen_column_split(sp, dy=0.5, f_max=None, n_per_wave=10, softening=1.0):
+    """
+    Splits a soil profile into the sub-layers of a soil column
+
+    Uses sub-layers of thickness `dy` (`sp.gen_split`), or if `f_max` is set then sub-layers sized
+    from the shear wavelength (see `gen_wavelength_split`).
+    """
+    if f_max is None:
+        sp.gen_split(props=['shear_vel', 'unit_mass'], target=dy)
+        return sp.split
+    return gen_wavelength_split(sp, f_max, n_per_wave=n_per_wave, softening=softening, dy=dy)
+
+
+def send_commands(osi, op_base_type, parameters):
+    """
+    Sends one OpenSees command per set of parameters, without creating an o3seespy object for each
+
+    Parameters
+    ----------
+    osi: o3seespy.OpenSeesInstance
+    op_base_type: str
+        Name of the command in openseespy (e.g. 'node')
+    parameters: list of lists
+        Arguments of each command
+    """
+    for params in parameters:
+        osi.to_process(op_base_type, params)
+
+
+class SoilColumnMesh(object):
+    """
+    Nodes, element connectivity and constraints of a soil column that is one element wide
+
+    The node coordinates, element connectivity and the tied nodes are prepared as arrays, and `build` sends
+    the prepared node and `equalDOF` arguments straight to OpenSees (see `send_commands`), with a single
+    `fixY` command for the base. OpenSees (through openseespy) has no batched node or `equalDOF` command, nor
+    an `eval` for a block of commands, so there is still one call per node and per tied row.
+
+    Parameters
+    ----------
+    node_depths: array_like
+        y-coordinates of the rows of nodes (negative downwards), starting at the surface
+    ele_width: float
+        Width of the column
+    base_imp: float
+        If negative then the base is fixed, otherwise the base is free in x and connected to a dashpot
+    """
+
+    def __init__(self, node_depths, ele_width, base_imp=0):
+        self.node_depths = np.asarray(node_depths, dtype=float)
+        self.ele_width = ele_width
+        self.base_imp = base_imp
+        self.n_node_rows = len(self.node_depths)
+        self.node_xs = np.array([0.0, ele_width])
+        rows = np.arange(self.n_node_rows - 1)
+        # indices of the nodes of each element in the flattened (row, column) array, anti-clockwise from bottom left
+        self.ele_node_inds = np.stack([2 * (rows + 1), 2 * (rows + 1) + 1, 2 * rows + 1, 2 * rows], axis=1)
+        # Defined in build
+        self.sn = None
+        self.dashpot_nodes = None
+
+    @property
+    def node_coords(self):
+        """Coordinates of the nodes (n_node_rows, 2, 2)"""
+        xs, ys = np.meshgrid(self.node_xs, self.node_depths)
+        return np.stack([xs, ys], axis=-1)
+
+    def build(self, osi, ndf=2):
+        """
+        Creates the nodes, ties the left and right nodes of each row, and fixes the base
+
+        Parameters
+        ----------
+        osi: o3seespy.OpenSeesInstance
+        ndf: int
+            Number of degrees of freedom of the soil nodes (3 includes pore pressure, which is fixed at the base)
+
+        Returns
+        -------
+        sn: array_like (n_node_rows, 2)
+            Soil nodes
+        """
+        coords = self.node_coords.reshape(-1, 2).tolist()
+        nodes = [o3.node.Node(osi, x, y, build=0) for x, y in coords]
+        send_commands(osi, 'node', [nd.parameters for nd in nodes])
+        self.sn = np.array(nodes).reshape(self.n_node_rows, 2)
+        tie_dofs = [o3.cc.DOF2D_X, o3.cc.DOF2D_Y]
+        if ndf == 3:
+            tie_dofs.append(o3.cc.DOF2D_PP)
+        tags = np.array([nd.tag for nd in nodes]).reshape(self.n_node_rows, 2)
+        send_commands(osi, 'equalDOF', [[l_tag, r_tag, *tie_dofs] for l_tag, r_tag in tags[:-1].tolist()])
+        x_fix = o3.cc.FIXED if self.base_imp < 0 else o3.cc.FREE
+        base_fix = [x_fix, o3.cc.FIXED, o3.cc.FIXED][:ndf]
+        osi.to_process('fixY', [float(self.node_depths[-1]), *base_fix])  # only the base nodes exist at this depth
+
+        if self.base_imp >= 0:
+            if ndf != 2:
+                osi.reset_model_params(2, ndf=2)
+            # Define dashpot nodes
+            self.dashpot_nodes = [o3.node.Node(osi, 0, self.node_depths[-1]) for i in range(2)]
+            o3.Fix2DOF(osi, self.dashpot_nodes[0], o3.cc.FIXED, o3.cc.FIXED)
+            o3.Fix2DOF(osi, self.dashpot_nodes[1], o3.cc.FREE, o3.cc.FIXED)
+            # define equal DOF for dashpot and soil base nodes
+            o3.EqualDOFMulti(osi, self.sn[-1][0], [self.sn[-1][1], self.dashpot_nodes[1]], [o3.cc.X])
+        return self.sn
+
+    @property
+    def ele_nodes(self):
+        """Nodes of each element (n_eles, 4), anti-clockwise from bottom left"""
+        return self.sn.ravel()[self.ele_node_inds]
+
+    def build_base_dashpot(self, osi, base_imp):
+        """
+        Creates the viscous dashpot at the base of the column
+
+        Parameters
+        ----------
+        osi: o3seespy.OpenSeesInstance
+        base_imp: float
+            Impedance of the base (in Pa.s/m)
+
+        Returns
+        -------
+        c_base: float
+            Dashpot coefficient
+        """
+        c_base = self.ele_width * base_imp / 1e3
+        dashpot_mat = o3.uniaxial_material.Viscous(osi, c_base, alpha=1.)
+        o3.element.ZeroLength(osi, self.dashpot_nodes, mats=[dashpot_mat], dirs=[o3.cc.DOF2D_X])
+        return c_base
@@ -1,15 +1,21 @@
 import numpy as np
-import sfsimodels as sm
 import o3seespy as o3
 import o3seespy.extensions
-import copy
+from o3soil.generic import MaterialRegistry
 from o3soil.sra.output import O3SRAOutputs
+from o3soil.sra.column import SoilColumnMesh, get_ele_prop_table, gen_column_split
+from o3soil.parallel import run_in_fork
+from o3soil.sra.stepping import AdaptiveStepper, DEFAULT_FALLBACKS
+from o3soil.sra.stats import SRAStats, time_phase, timed_phase
+from o3soil.sra.one_d_fd import get_hyp_params, calc_mod_hyp_g_mod_red_and_xi
 
 
 class SRA1D(object):
     osi = None
 
-    def __init__(self, sp, dy=0.5, k0=0.5, base_imp=0, cache_path=None, opfile=None):
+    def __init__(self, sp, dy=0.5, k0=0.5, base_imp=0, cache_path=None, opfile=None, mat_rtol=0.0,
+                 cache_fmt='npz', instrument=False, elastic=False, f_max=None, n_per_wave=10, softening=1.0,
+                 verbose=0):
         """
 
         Parameters
@@ -23,9 +29,30 @@ class SRA1D(object):
             If negative then use fixed base
         cache_path
         opfile
+        mat_rtol: float
+            If greater than zero, then sub-layers with stress-dependent moduli within this relative tolerance share a
+            material (see `o3soil.MaterialRegistry`)
+        cache_fmt: str
+            Format of the results saved to `cache_path` (see `O3SRAOutputs.results_to_files`)
+        instrument: bool
+            If True, then the time of each phase, the time steps and the solver iterations of each step are
+            recorded in `self.stats` (a `SRAStats` object) and saved to `<cache_path>stats.json`
+        elastic: bool
+            If True, then all soils are built as `ElasticIsotropic` materials with the small strain shear modulus
+            (required for the equivalent linear analysis, see `execute_eql`)
+        f_max: float
+            If set, then the sub-layers are sized from the shear wavelength at this frequency (Hz) rather than `dy`
+            (see `o3soil.sra.column.gen_wavelength_split`)
+        n_per_wave: int
+            Number of elements per wavelength (if `f_max` is set)
+        softening: float
+            Ratio of the strain-softened to the small strain shear wave velocity used to size the sub-layers
+        verbose: int
+            If greater than zero, then failed time steps and a failed analysis are printed (they are always
+            recorded in `self.step_history`)
         """
         self.sp = sp
-        sp.gen_split(props=['shear_vel', 'unit_mass'], target=dy)
+        gen_column_split(sp, dy=dy, f_max=f_max, n_per_wave=n_per_wave, softening=softening)
         thicknesses = sp.split["thickness"]
         self.n_node_rows = len(thicknesses) + 1
         node_depths = -np.cumsum(sp.split["thickness"])
@@ -41,11 +68,24 @@ class SRA1D(object):
         self.ele_width = 3 * min(thicknesses)
         self.cache_path = cache_path
         self.opfile = opfile
+        self.mat_rtol = mat_rtol
+        self.cache_fmt = cache_fmt
+        self.stats = SRAStats() if instrument else None
+        self.elastic = elastic
+        self.verbose = verbose
         # Defined in static analysis
         self.soil_mats = None
         self.eles = None
+        self.ele_props = None  # soil properties of each element (see `get_ele_prop_table`)
         self.sn = None  # soil nodes
-
+        # Defined in dynamic analysis
+        self.step_history = None
+        # Defined in equivalent linear analysis
+        self.eql_e_mods = None  # Young's modulus of each element
+        self.eql_xi = None  # damping ratio of each element
+        self.eql_n_iters = None
+
+    @timed_phase('build')
     def build_model(self):
         # Define nodes and set boundary conditions for simple shear deformation
         # Start at top and build down?
@@ -55,50 +95,22 @@ class SRA1D(object):
             self.state = 0
         if self.osi is None:
             self.osi = o3.OpenSeesInstance(ndm=2, ndf=2, state=self.state)
-        nx = 1
-        sn = []
-        # sn = [[o3.node.Node(osi, ele_width * j, 0) for j in range(nx + 1)]]
-        for i in range(0, self.n_node_rows):
-            # Establish left and right nodes
-            sn.append([o3.node.Node(self.osi, self.ele_width * j, self.node_depths[i]) for j in range(nx + 1)])
-            # set x and y dofs equal for left and right nodes
-            if i != self.n_node_rows - 1:
-                o3.EqualDOF(self.osi, sn[i][0], sn[i][-1], [o3.cc.DOF2D_X, o3.cc.DOF2D_Y])
-        sn = np.array(sn)
-
-        if self.base_imp < 0:
-            # Fix base nodes
-            for j in range(nx + 1):
-                o3.Fix2DOF(self.osi, sn[-1][j], o3.cc.FIXED, o3.cc.FIXED)
-        else:
-            # Fix base nodes
-            for j in range(nx + 1):
-                o3.Fix2DOF(self.osi, sn[-1][j], o3.cc.FREE, o3.cc.FIXED)
-
-            # Define dashpot nodes
-            dashpot_node_l = o3.node.Node(self.osi, 0, self.node_depths[-1])
-            dashpot_node_2 = o3.node.Node(self.osi, 0, self.node_depths[-1])
-            o3.Fix2DOF(self.osi, dashpot_node_l, o3.cc.FIXED, o3.cc.FIXED)
-            o3.Fix2DOF(self.osi, dashpot_node_2, o3.cc.FREE, o3.cc.FIXED)
-
-            # define equal DOF for dashpot and soil base nodes
-            o3.EqualDOF(self.osi, sn[-1][0], sn[-1][1], [o3.cc.X])
-            o3.EqualDOF(self.osi, sn[-1][0], dashpot_node_2, [o3.cc.X])
+        self.mesh = SoilColumnMesh(self.node_depths, self.ele_width, base_imp=self.base_imp)
+        sn = self.mesh.build(self.osi, ndf=2)
+        ele_nodes = self.mesh.ele_nodes
 
         # define materials
         pois = self.k0 / (1 + self.k0)
         ele_thick = 1.0  # m
         self.soil_mats = []
         strains = np.logspace(-6, -0.5, 16)
-        prev_args = []
-        prev_kwargs = {}
-        prev_sl_class = None
+        self.mat_registry = MaterialRegistry(self.osi, rtol=self.mat_rtol)
         self.eles = []
+        self.ele_props = get_ele_prop_table(self.sp, -self.ele_depths)
+        sls = [self.sp.layer(i + 1) for i in range(self.sp.n_layers)]
         for i in range(len(self.ele_depths)):
-            y_depth = -self.ele_depths[i]
-
-            sl_id = self.sp.get_layer_index_by_depth(y_depth)
-            sl = self.sp.layer(sl_id)
+            props = self.ele_props[i]
+            sl = sls[props['layer'] - 1]
             if hasattr(sl, 'op_type'):
                 if sl.built:
                     pass
@@ -108,10 +120,7 @@ class SRA1D(object):
                     self.soil_mats.append(mat)
             else:
                 app2mod = {}
-                if y_depth > self.sp.gwl:
-                    umass = sl.unit_sat_mass / 1e3  # TODO: work out how to run in Pa, N, m, s
-                else:
-                    umass = sl.unit_dry_mass / 1e3
+                umass = float(props['unit_mass']) / 1e3  # TODO: work out how to run in Pa, N, m, s
                 overrides = {'nu': pois, 'p_atm': 101,
                              'rho': umass,
                              'unit_moist_mass': umass,
@@ -121,26 +130,25 @@ class SRA1D(object):
                 # Define material
                 if not hasattr(sl, 'o3_type'):
                     sl.o3_type = sl.type  # for backward compatibility
-                if sl.o3_type == 'pm4sand':
+                o3_type = None if self.elastic else sl.o3_type
+                if o3_type == 'pm4sand':
                     sl_class = o3.nd_material.PM4Sand
                     # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
                     app2mod = sl.app2mod
-                elif sl.o3_type == 'sdmodel':
+                elif o3_type == 'sdmodel':
                     sl_class = o3.nd_material.StressDensity
                     # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
                     app2mod = sl.app2mod
-                elif sl.o3_type in ['pimy', 'pdmy', 'pdmy02']:
+                elif o3_type in ['pimy', 'pdmy', 'pdmy02']:
                     if hasattr(sl, 'get_g_mod_at_m_eff_stress'):
                         if hasattr(sl, 'g_mod_p0') and sl.g_mod_p0 != 0.0:
-                            v_eff = self.sp.get_v_eff_stress_at_depth(y_depth)
-                            k0 = sl.poissons_ratio / (1 - sl.poissons_ratio)
-                            m_eff = v_eff * (1 + 2 * k0) / 3
-                            p = m_eff  # Pa
+                            p = float(props['m_eff'])  # Pa
                             overrides['d'] = 0.0
+                            g_mod_r = float(props['g_mod']) / 1e3
                         else:
                             p = 101.0e3  # Pa
                             overrides['d'] = sl.a
-                        g_mod_r = sl.get_g_mod_at_m_eff_stress(p) / 1e3
+                            g_mod_r = sl.get_g_mod_at_m_eff_stress(p) / 1e3
                     else:
                         p = 101.0e3  # Pa
                         overrides['d'] = 0.0
@@ -150,12 +158,12 @@ class SRA1D(object):
                     overrides['p_ref'] = p / 1e3
                     overrides['g_mod_ref'] = g_mod_r
                     overrides['bulk_mod_ref'] = b_mod
-                    if sl.o3_type == 'pimy':
+                    if o3_type == 'pimy':
                         overrides['cohesion'] = sl.cohesion / 1e3
                         sl_class = o3.nd_material.PressureIndependMultiYield
-                    elif sl.o3_type == 'pdmy':
+                    elif o3_type == 'pdmy':
                         sl_class = o3.nd_material.PressureDependMultiYield
-                    elif sl.o3_type == 'pdmy02':
+                    elif o3_type == 'pdmy02':
                         sl_class = o3.nd_material.PressureDependMultiYield02
                 else:
                     g_mod = self.sp.split['shear_vel'][i] ** 2 / self.unit_masses[i]
@@ -165,29 +173,22 @@ class SRA1D(object):
                     app2mod['rho'] = 'unit_moist_mass'
                 args, kwargs = o3.extensions.get_o3_kwargs_from_obj(sl, sl_class, custom=app2mod, overrides=overrides)
 
-                if o3.extensions.has_o3_model_changed(sl_class, prev_sl_class, args, prev_args, kwargs, prev_kwargs):
-                    mat = sl_class(self.osi, *args, **kwargs)
-                    prev_sl_class = sl_class
-                    prev_args = copy.deepcopy(args)
-                    prev_kwargs = copy.deepcopy(kwargs)
-                    mat.dynamic_poissons_ratio = sl.poissons_ratio
+                n_mats = self.mat_registry.n_mats
+                mat = self.mat_registry.get_mat(sl_class, args, kwargs, dynamic_poissons_ratio=sl.poissons_ratio)
+                if self.mat_registry.n_mats > n_mats:  # new material
                     self.soil_mats.append(mat)
 
             # def element
-            for xx in range(nx):
-                nodes = [sn[i + 1][xx], sn[i + 1][xx + 1], sn[i][xx + 1], sn[i][xx]]  # anti-clockwise
-                # eles.append(o3.element.Quad(self.osi, nodes, ele_thick, o3.cc.PLANE_STRAIN, mat, b2=-grav * unit_masses[i]))
-                self.eles.append(o3.element.SSPquad(self.osi, nodes, mat, o3.cc.PLANE_STRAIN, ele_thick, 0.0,
-                                                    -self.grav * self.unit_masses[i]))
+            self.eles.append(o3.element.SSPquad(self.osi, list(ele_nodes[i]), mat, o3.cc.PLANE_STRAIN, ele_thick, 0.0,
+                                                -self.grav * self.unit_masses[i]))
         self.sn = sn
         if self.base_imp >= 0:
             # define material and element for viscous dampers
-            if self.base_imp == 0:
+            base_imp = self.base_imp
+            if base_imp == 0:
                 sl = self.sp.get_soil_at_depth(self.sp.height)
                 base_imp = sl.unit_dry_mass * self.sp.get_shear_vel_at_depth(self.sp.height)
-            self.c_base = self.ele_width * base_imp / 1e3
-            dashpot_mat = o3.uniaxial_material.Viscous(self.osi, self.c_base, alpha=1.)
-            o3.element.ZeroLength(self.osi, [dashpot_node_l, dashpot_node_2], mats=[dashpot_mat], dirs=[o3.cc.DOF2D_X])
+            self.c_base = self.mesh.build_base_dashpot(self.osi, base_imp)
 
         self.o3res = o3.results.Results2D(cache_path=self.cache_path)
         self.o3res.wipe_old_files()
@@ -197,6 +198,7 @@ class SRA1D(object):
         for ele in self.eles:
             self.o3res.mat2ele_tags.append([ele.mat.tag, ele.tag])
 
+    @timed_phase('static')
     def execute_static(self, ray_freqs=(0.5, 10), xi=0.03):
         # Static analysis
         o3.constraints.Transformation(self.osi)
@@ -236,6 +238,7 @@ class SRA1D(object):
         # Convert to positive since ele depths go downwards
         return int(np.round(np.interp(depth, -self.ele_depths, np.arange(len(self.ele_depths)))))
 
+    @timed_phase('loads')
     def apply_loads(self, ray_freqs=(0.5, 10), xi=0.03):
         o3.set_time(self.osi, 0.0)
 
@@ -255,7 +258,6 @@ class SRA1D(object):
         o3.rayleigh.Rayleigh(self.osi, a0, a1, 0, 0)
 
         static_time = 500
-        print('time: ', o3.get_time(self.osi))
         # Add static stress bias
         time_series = o3.time_series.Path(self.osi, time=[0, static_time / 2, static_time, 1e3], values=[0, 0.5, 1, 1],
                                           use_last=True)
@@ -265,7 +267,6 @@ class SRA1D(object):
             pload = self.sp.hloads[i].p_x
             y = self.sp.hloads[i].y
             ind = self.get_nearest_node_layer_at_depth(y)
-            print(i, y, ind)
             if self.sp.loads_are_stresses:
                 pload *= self.ele_width
             o3.Load(self.osi, self.sn[ind][0], [pload, 0])
@@ -277,8 +278,139 @@ class SRA1D(object):
         o3.analyze(self.osi, int(static_time / static_dt), static_dt)
         o3.load_constant(self.osi, time=0)
 
+    def apply_eql_props(self, e_mods, xis, ray_freqs=(0.5, 10)):
+        """
+        Sets the Young's modulus (through a parameter of each element) and the Rayleigh damping
+        (through a region of each element) of each element
+        """
+        omega_1 = 2 * np.pi * ray_freqs[0]
+        omega_2 = 2 * np.pi * ray_freqs[1]
+        for i, ele in enumerate(self.eles):
+            self.osi.to_process('parameter', [i + 1, 'element', ele.tag, 'E'])
+            self.osi.to_process('updateParameter', [i + 1, float(e_mods[i])])
+            a0 = 2 * xis[i] * omega_1 * omega_2 / (omega_1 + omega_2)
+            a1 = 2 * xis[i] / (omega_1 + omega_2)
+            self.osi.to_process('region', [i + 1, '-ele', ele.tag, '-rayleigh', float(a0), float(a1), 0.0, 0.0])
+
+    def execute_eql(self, asig, outs=None, n_iter=15, strain_ratio=0.65, tol=0.01, xi=0.03, **kwargs):
+        """
+        Time domain equivalent linear analysis on the OpenSees soil column
+
+        The column (built with `elastic=True`) and its static analysis are reused for every iteration, each
+        iteration runs the motion from the post-static state (see `keep_static_state`), and then the modulus and
+        damping of each element are updated from its effective strain with the modified hyperbolic model
+        (see `o3soil.sra.one_d_fd.get_hyp_params`). The outputs are those of the last iteration.
+
+        Parameters
+        ----------
+        asig: eqsig.AccSignal object
+        outs: dict
+            Outputs as in `execute_dynamic` (default all 'ACCX', 'STRS' and 'TAU')
+        n_iter: int
+            Maximum number of iterations
+        strain_ratio: float
+            Ratio of the effective to the maximum shear strain
+        tol: float
+            Convergence tolerance of the relative change of the modulus and damping between iterations
+        xi: float
+            Damping ratio of soils that do not have `xi` set
+        kwargs:
+            Passed to `execute_dynamic`
+        """
+        if not self.elastic:
+            raise ValueError('the equivalent linear analysis requires SRA1D(elastic=True)')
+        if outs is None:
+            outs = {'ACCX': 'all', 'STRS': 'all', 'TAU': 'all'}
+        xi0, strain_ref, curvature = get_hyp_params(self.sp, -self.ele_depths, xi=xi)
+        inds = np.where(~np.isnan(strain_ref))[0]
+        e_mod0 = np.array([ele.mat.e_mod for ele in self.eles], dtype=float)
+        self.eql_e_mods = e_mod0.copy()
+        self.eql_xi = xi0
+        run_outs = dict(outs)
+        run_outs['STRS'] = 'all'
+        kwargs['playback'] = False
+        self.eql_n_iters = 0
+        for i in range(n_iter):
+            self.execute_dynamic(asig, xi=xi, outs=run_outs, keep_static_state=True, **kwargs)
+            self.eql_n_iters += 1
+            if not len(inds):
+                break
+            strain_eff = strain_ratio * np.max(np.abs(self.out_dict['STRS'][inds]), axis=-1)
+            g_mod_red, xi_new = calc_mod_hyp_g_mod_red_and_xi(strain_eff, strain_ref[inds], curvature[inds],
+                                                             xi0[inds])
+            e_new = e_mod0[inds] * g_mod_red
+            err = max(np.max(np.abs(e_new - self.eql_e_mods[inds]) / e_new),
+                      np.max(np.abs(xi_new - self.eql_xi[inds]) / xi_new))
+            if err < tol or i == n_iter - 1:
+                break
+            self.eql_e_mods[inds] = e_new
+            self.eql_xi[inds] = xi_new
+        if 'STRS' not in outs:
+            del self.out_dict['STRS']
+        elif not (isinstance(outs['STRS'], str) and outs['STRS'] == 'all'):
+            ele_inds = [np.argmin(abs(abs(self.ele_depths) - abs(depth))) for depth in outs['STRS']]
+            self.out_dict['STRS'] = self.out_dict['STRS'][ele_inds]
+
+    def apply_motion(self, asig):
+        """
+        Defines the dynamic input motion at the base of the column, returns the load pattern
+
+        A zero is appended to the motion, since OpenSees evaluates a `Path` as zero at exactly its last time
+        (which the time steps land on), so the motion would otherwise drop to zero in the last step.
+        """
+        if self.base_imp < 0:  # fixed base
+            acc_series = o3.time_series.Path(self.osi, dt=asig.dt, values=np.append(asig.values, 0.0))
+            return o3.pattern.UniformExcitation(self.osi, dir=o3.cc.X, accel_series=acc_series)
+        ts_obj = o3.time_series.Path(self.osi, dt=asig.dt, values=np.append(asig.velocity, 0.0), factor=self.c_base)
+        pattern = o3.pattern.Plain(self.osi, ts_obj)
+        o3.Load(self.osi, self.sn[-1][0], [1., 0.])
+        return pattern
+
     def execute_dynamic(self, asig, analysis_dt=0.001, ray_freqs=(0.5, 10), xi=0.03, analysis_time=None,
-                        outs=None, rec_dt=None, playback_dt=None, playback=True):
+                        outs=None, rec_dt=None, playback_dt=None, playback=True, keep_static_state=False,
+                        min_analysis_dt=None, chunked=False, stream=False, summary=False,
+                        fallbacks=DEFAULT_FALLBACKS):
+        """
+        Run the dynamic analysis of the input motion and collect the outputs in `self.out_dict`
+
+        The analysis uses an adaptive time step (see `o3soil.sra.stepping.AdaptiveStepper`), which starts at
+        `analysis_dt` and is halved on non-convergence (down to `min_analysis_dt`). Before the time step is halved,
+        the failed step is retried with each of the `fallbacks` solvers. The time steps used (and the steps rescued
+        by a fallback) are stored in `self.step_history`.
+
+        Parameters
+        ----------
+        analysis_dt: float
+            Maximum time step of the analysis
+        min_analysis_dt: float
+            Minimum time step of the analysis, if None then `analysis_dt / 2 ** 10`
+        chunked: bool
+            If True, then many time steps are run per call to OpenSees (see `AdaptiveStepper`),
+            the outputs match single steps, but the run times were not measurably shorter
+        fallbacks: list of `o3soil.sra.stepping.Solver`
+            Solvers tried in order on a failed step (the analysis returns to `Newton` after the step),
+            if None or empty then failed steps are only substepped
+        stream: bool
+            If True, then the outputs are streamed to binary files (in `cache_path`, which must be set) during
+            the analysis and the arrays of `out_dict` are memory-mapped to them
+        summary: bool
+            If True, then the full time series are not stored, instead `out_dict` has the running summary
+            statistics (max, min, peak, time of peak, rms, Arias intensity) of each output at each depth
+            (see `O3SRAOutputs.summary_to_dict`)
+        keep_static_state: bool
+            If True, then the dynamic analysis is run in a forked copy of the process, so that the model
+            remains in its post-static state and `execute_dynamic` can be called again for another motion
+            without rebuilding the model and repeating the static analysis.
+        """
+        if keep_static_state:
+            def run_dynamic():
+                self.execute_dynamic(asig, analysis_dt=analysis_dt, ray_freqs=ray_freqs, xi=xi,
+                                     analysis_time=analysis_time, outs=outs, rec_dt=rec_dt, playback_dt=playback_dt,
+                                     playback=playback, min_analysis_dt=min_analysis_dt,
+                                     chunked=chunked, stream=stream, summary=summary, fallbacks=fallbacks)
+                return self.out_dict, self.step_history, self.stats
+            self.out_dict, self.step_history, self.stats = run_in_fork(run_dynamic)
+            return
         self.rec_dt = rec_dt
         self.playback_dt = playback_dt
         if rec_dt is None:
@@ -304,6 +436,8 @@ class SRA1D(object):
         a0 = 2 * xi * omega_1 * omega_2 / (omega_1 + omega_2)
         a1 = 2 * xi / (omega_1 + omega_2)
         o3.rayleigh.Rayleigh(self.osi, a0, a1, 0, 0)
+        if self.eql_xi is not None:
+            self.apply_eql_props(self.eql_e_mods, self.eql_xi, ray_freqs)
 
         init_time = o3.get_time(self.osi)
         if playback:
@@ -312,36 +446,51 @@ class SRA1D(object):
         else:
             self.o3res.dynamic = False
         self.o3sra_outs = O3SRAOutputs()
-        self.o3sra_outs.start_recorders(self.osi, outs, self.sn, self.eles, rec_dt=self.rec_dt)
+        self.o3sra_outs.start_recorders(self.osi, outs, self.sn, self.eles, rec_dt=self.rec_dt, stream=stream,
+                                        stream_path=self.cache_path, summary=summary)
 
         # Define the dynamic input motion
-        if self.base_imp < 0:  # fixed base
-            acc_series = o3.time_series.Path(self.osi, dt=asig.dt, values=asig.values)
-            o3.pattern.UniformExcitation(self.osi, dir=o3.cc.X, accel_series=acc_series)
-        else:
-            ts_obj = o3.time_series.Path(self.osi, dt=asig.dt, values=asig.velocity * 1, factor=self.c_base)
-            o3.pattern.Plain(self.osi, ts_obj)
-            o3.Load(self.osi, self.sn[-1][0], [1., 0.])
+        self.apply_motion(asig)
         if self.state == 3:
             o3.extensions.to_py_file(self.osi, self.opfile)
         # Run the dynamic motion
         o3.record(self.osi)
-        while o3.get_time(self.osi) - init_time < analysis_time:
-            if o3.analyze(self.osi, 1, analysis_dt):
-                print('failed')
-                if o3.analyze(self.osi, 10, analysis_dt / 10):
-                    break
+        rec_dts = [self.rec_dt]
+        if playback:
+            rec_dts.append(self.playback_dt)
+        stepper = AdaptiveStepper(self.osi, analysis_dt, dt_min=min_analysis_dt, rec_dts=rec_dts,
+                                  chunked=chunked, verbose=self.verbose,
+                                  callback=self.o3sra_outs.update if summary else None,
+                                  record_iters=self.stats is not None, fallbacks=fallbacks)
+        with time_phase(self.stats, 'dynamic'):
+            completed = stepper.run(analysis_time)
+        if not completed and self.verbose:
+            print(f'analysis failed to converge at time: {o3.get_time(self.osi) - init_time:.4g}')
+        self.step_history = stepper.step_history
+        if self.stats is not None:
+            self.stats.step_history = self.step_history
         o3.wipe(self.osi)
-        self.out_dict = self.o3sra_outs.results_to_dict()
+        with time_phase(self.stats, 'collect'):
+            self.out_dict = self.o3sra_outs.results_to_dict()
 
         if self.cache_path:
             self.o3sra_outs.cache_path = self.cache_path
-            self.o3sra_outs.results_to_files()
+            params = {'analysis_dt': analysis_dt, 'min_analysis_dt': min_analysis_dt, 'rec_dt': self.rec_dt,
+                      'analysis_time': analysis_time, 'ray_freqs': ray_freqs, 'xi': xi, 'base_imp': self.base_imp,
+                      'k0': self.k0, 'motion': asig.label, 'motion_dt': asig.dt,
+                      'completed': self.step_history['completed'],
+                      'n_rescued': len(self.step_history['rescued'])}
+            self.o3sra_outs.results_to_files(fmt=self.cache_fmt, params=params)
+            if self.stats is not None:
+                self.stats.to_file(self.cache_path + 'stats.json')
             self.o3res.save_to_cache()
 
 
 def run_sra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, analysis_time=None, outs=None,
-                  base_imp=0, k0=0.5, cache_path=None, opfile=None, playback=False, rec_dt=None):
+                  base_imp=0, k0=0.5, cache_path=None, opfile=None, playback=False, rec_dt=None,
+                  min_analysis_dt=None, mat_rtol=0.0, stream=False, cache_fmt='npz',
+                  summary=False, instrument=False, fallbacks=DEFAULT_FALLBACKS, f_max=None, n_per_wave=10,
+                  softening=1.0, verbose=0):
     """
 
     Parameters
@@ -350,7 +499,8 @@ def run_sra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, a
     asig
     ray_freqs
     xi
-    analysis_dt
+    analysis_dt: float
+        Maximum time step of the analysis
     dy
     analysis_time
     outs
@@ -362,24 +512,80 @@ def run_sra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, a
     cache_path
     opfile
     playback
+    mat_rtol: float
+        Relative tolerance for sharing materials with stress-dependent moduli (see `o3soil.MaterialRegistry`)
+    stream: bool
+        If True, then the outputs are streamed to binary files and memory-mapped (see `execute_dynamic`)
+    summary: bool
+        If True, then only the summary statistics of the outputs are collected (see `execute_dynamic`)
+    instrument: bool
+        If True, then the phase times and time step statistics are recorded in `stats` (see `SRAStats`)
+    fallbacks: list of `o3soil.sra.stepping.Solver`
+        Solvers tried in order on a failed time step (see `execute_dynamic`)
+    cache_fmt: str
+        Format of the results saved to `cache_path` (see `O3SRAOutputs.results_to_files`)
+    f_max: float
+        If set, then the sub-layers are sized from the shear wavelength at this frequency (Hz) rather than `dy`
+        (see `o3soil.sra.column.gen_wavelength_split`)
+    n_per_wave: int
+        Number of elements per wavelength (if `f_max` is set)
+    softening: float
+        Ratio of the strain-softened to the small strain shear wave velocity used to size the sub-layers
+    verbose: int
+        If greater than zero, then failed time steps and a failed analysis are printed
 
     Returns
     -------
 
     """
-    sra_1d = SRA1D(sp, dy=dy, k0=k0, base_imp=base_imp, cache_path=cache_path, opfile=opfile)
+    sra_1d = SRA1D(sp, dy=dy, k0=k0, base_imp=base_imp, cache_path=cache_path, opfile=opfile,
+                   mat_rtol=mat_rtol, cache_fmt=cache_fmt, instrument=instrument, f_max=f_max,
+                   n_per_wave=n_per_wave, softening=softening, verbose=verbose)
     sra_1d.build_model()
     sra_1d.execute_static()
     if hasattr(sra_1d.sp, 'hloads'):
         sra_1d.apply_loads()
     sra_1d.execute_dynamic(asig, analysis_dt=analysis_dt, ray_freqs=ray_freqs, xi=xi, analysis_time=analysis_time,
-                           outs=outs, playback=playback, playback_dt=0.01, rec_dt=rec_dt)
+                           outs=outs, playback=playback, playback_dt=0.01, rec_dt=rec_dt,
+                           min_analysis_dt=min_analysis_dt, stream=stream,
+                           summary=summary, fallbacks=fallbacks)
     return sra_1d
 
 
 
+def run_eql_sra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, analysis_time=None, outs=None,
+                base_imp=0, k0=0.5, rec_dt=None, n_iter=15, strain_ratio=0.65, tol=0.01, f_max=None, n_per_wave=10,
+                softening=1.0):
+    """
+    Time domain equivalent linear site response analysis on the same soil column as `run_sra`
+
+    Parameters
+    ----------
+    n_iter: int
+        Maximum number of equivalent linear iterations
+    strain_ratio: float
+        Ratio of the effective to the maximum shear strain
+    tol: float
+        Convergence tolerance of the relative change of the modulus and damping between iterations
+
+    See `run_sra` and `SRA1D.execute_eql`
+
+    Returns
+    -------
+    SRA1D object
+    """
+    sra_1d = SRA1D(sp, dy=dy, k0=k0, base_imp=base_imp, elastic=True, f_max=f_max, n_per_wave=n_per_wave,
+                   softening=softening)
+    sra_1d.build_model()
+    sra_1d.execute_static()
+    sra_1d.execute_eql(asig, outs=outs, n_iter=n_iter, strain_ratio=strain_ratio, tol=tol, xi=xi,
+                       analysis_dt=analysis_dt, ray_freqs=ray_freqs, analysis_time=analysis_time, rec_dt=rec_dt)
+    return sra_1d
+
+
 def site_response(sp, asig, freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, analysis_time=None, outs=None,
-                  rec_dt=None, base_imp=0, cache_path=None, opfile=None, playback=False):
+                  rec_dt=None, base_imp=0, cache_path=None, opfile=None, playback=False, mat_rtol=0.0, f_max=None,
+                  n_per_wave=10, softening=1.0, stats=None, verbose=0):
     """
     Run seismic analysis of a soil profile - example based on:
     http://opensees.berkeley.edu/wiki/index.php/Site_Response_Analysis_of_a_Layered_Soil_Column_(Total_Stress_Analysis)
@@ -394,6 +600,20 @@ def site_response(sp, asig, freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5,
         If positive then use as impedence at base of model,
         If zero then use last soil layer
         If negative then use fixed base
+    mat_rtol: float
+        Relative tolerance for sharing materials with stress-dependent moduli (see `o3soil.MaterialRegistry`)
+    f_max: float
+        If set, then the sub-layers are sized from the shear wavelength at this frequency (Hz) rather than `dy`
+        (see `o3soil.sra.column.gen_wavelength_split`)
+    n_per_wave: int
+        Number of elements per wavelength (if `f_max` is set)
+    softening: float
+        Ratio of the strain-softened to the small strain shear wave velocity used to size the sub-layers
+    stats: o3soil.sra.stats.SRAStats object
+        If set, then the time of each phase (build, static, loads, dynamic and collect) is added to it, and
+        the time steps (and the failed step, if the analysis failed) are set as its `step_history`
+    verbose: int
+        If greater than zero, then a failed analysis is printed
 
     Returns
     -------
@@ -410,186 +630,179 @@ def site_response(sp, asig, freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5,
     state = 0
     if opfile:
         state = 3
-    osi = o3.OpenSeesInstance(ndm=2, ndf=2, state=state)
-    assert isinstance(sp, sm.SoilProfile)
-    sp.gen_split(props=['shear_vel', 'unit_mass'], target=dy)
-    thicknesses = sp.split["thickness"]
-    n_node_rows = len(thicknesses) + 1
-    node_depths = np.cumsum(sp.split["thickness"])
-    node_depths = np.insert(node_depths, 0, 0)
-    ele_depths = (node_depths[1:] + node_depths[:-1]) / 2
-    unit_masses = sp.split["unit_mass"] / 1e3
-
-    grav = 9.81
-    # Rayleigh damping parameters
-    omega_1 = 2 * np.pi * freqs[0]
-    omega_2 = 2 * np.pi * freqs[1]
-    a0 = 2 * xi * omega_1 * omega_2 / (omega_1 + omega_2)
-    a1 = 2 * xi / (omega_1 + omega_2)
-
-    k0 = 0.5
-    pois = k0 / (1 + k0)
-
-    ele_width = 3 * min(thicknesses)
-
-    # Define nodes and set boundary conditions for simple shear deformation
-    # Start at top and build down?
-    nx = 1
-    sn = []
-    # sn = [[o3.node.Node(self.osi, ele_width * j, 0) for j in range(nx + 1)]]
-    for i in range(0, n_node_rows):
-        # Establish left and right nodes
-        sn.append([o3.node.Node(osi, ele_width * j, -node_depths[i]) for j in range(nx + 1)])
-        # set x and y dofs equal for left and right nodes
-        if i != n_node_rows -1:
-            o3.EqualDOF(osi, sn[i][0], sn[i][-1], [o3.cc.X, o3.cc.Y])
-    sn = np.array(sn)
-
-    if base_imp < 0:
-        # Fix base nodes
-        for j in range(nx + 1):
-            o3.Fix2DOF(osi, sn[-1][j], o3.cc.FIXED, o3.cc.FIXED)
-    else:
-        # Fix base nodes
-        for j in range(nx + 1):
-            o3.Fix2DOF(osi, sn[-1][j], o3.cc.FREE, o3.cc.FIXED)
-
-        # Define dashpot nodes
-        dashpot_node_l = o3.node.Node(osi, 0, -node_depths[-1])
-        dashpot_node_2 = o3.node.Node(osi, 0, -node_depths[-1])
-        o3.Fix2DOF(osi, dashpot_node_l, o3.cc.FIXED, o3.cc.FIXED)
-        o3.Fix2DOF(osi, dashpot_node_2, o3.cc.FREE, o3.cc.FIXED)
-
-        # define equal DOF for dashpot and soil base nodes
-        o3.EqualDOF(osi, sn[-1][0], sn[-1][1], [o3.cc.X])
-        o3.EqualDOF(osi, sn[-1][0], dashpot_node_2, [o3.cc.X])
-
-    # define materials
-    ele_thick = 1.0  # m
-    soil_mats = []
-    strains = np.logspace(-6, -0.5, 16)
-    prev_args = []
-    prev_kwargs = {}
-    prev_sl_class = None
-    eles = []
-    for i in range(len(thicknesses)):
-        y_depth = ele_depths[i]
-
-        sl_id = sp.get_layer_index_by_depth(y_depth)
-        sl = sp.layer(sl_id)
-
-        app2mod = {}
-        if y_depth > sp.gwl:
-            umass = sl.unit_sat_mass / 1e3  # TODO: work out how to run in Pa, N, m, s
-        else:
-            umass = sl.unit_dry_mass / 1e3
-        overrides = {'nu': pois, 'p_atm': 101,
-                     'rho': umass,
-                     'unit_moist_mass': umass,
-                     'nd': 2.0,
-                     # 'n_surf': 25
-                     }
-        # Define material
-        if not hasattr(sl, 'o3_type'):
-            sl.o3_type = sl.type
-        if sl.o3_type == 'pm4sand':
-            sl_class = o3.nd_material.PM4Sand
-            # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
-            app2mod = sl.app2mod
-        elif sl.o3_type == 'sdmodel':
-            sl_class = o3.nd_material.StressDensity
-            # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
-            app2mod = sl.app2mod
-        elif sl.o3_type in ['pimy', 'pdmy', 'pdmy02']:
-            if hasattr(sl, 'get_g_mod_at_m_eff_stress'):
-                if hasattr(sl, 'g_mod_p0') and sl.g_mod_p0 != 0.0:
-                    v_eff = sp.get_v_eff_stress_at_depth(y_depth)
-                    k0 = sl.poissons_ratio / (1 - sl.poissons_ratio)
-                    m_eff = v_eff * (1 + 2 * k0) / 3
-                    p = m_eff  # Pa
-                    overrides['d'] = 0.0
+    with time_phase(stats, 'build'):
+        osi = o3.OpenSeesInstance(ndm=2, ndf=2, state=state)
+        import sfsimodels as sm
+        assert isinstance(sp, sm.SoilProfile)
+        gen_column_split(sp, dy=dy, f_max=f_max, n_per_wave=n_per_wave, softening=softening)
+        thicknesses = sp.split["thickness"]
+        n_node_rows = len(thicknesses) + 1
+        node_depths = np.cumsum(sp.split["thickness"])
+        node_depths = np.insert(node_depths, 0, 0)
+        ele_depths = (node_depths[1:] + node_depths[:-1]) / 2
+        unit_masses = sp.split["unit_mass"] / 1e3
+
+        grav = 9.81
+        # Rayleigh damping parameters
+        omega_1 = 2 * np.pi * freqs[0]
+        omega_2 = 2 * np.pi * freqs[1]
+        a0 = 2 * xi * omega_1 * omega_2 / (omega_1 + omega_2)
+        a1 = 2 * xi / (omega_1 + omega_2)
+
+        k0 = 0.5
+        pois = k0 / (1 + k0)
+
+        ele_width = 3 * min(thicknesses)
+
+        # Define nodes and set boundary conditions for simple shear deformation
+        # Start at top and build down?
+        mesh = SoilColumnMesh(-node_depths, ele_width, base_imp=base_imp)
+        sn = mesh.build(osi, ndf=2)
+        ele_nodes = mesh.ele_nodes
+
+        # define materials
+        ele_thick = 1.0  # m
+        soil_mats = []
+        strains = np.logspace(-6, -0.5, 16)
+        mat_registry = MaterialRegistry(osi, rtol=mat_rtol)
+        eles = []
+        ele_props = get_ele_prop_table(sp, ele_depths)
+        sls = [sp.layer(i + 1) for i in range(sp.n_layers)]
+        for i in range(len(thicknesses)):
+            props = ele_props[i]
+            sl = sls[props['layer'] - 1]
+
+            app2mod = {}
+            umass = float(props['unit_mass']) / 1e3  # TODO: work out how to run in Pa, N, m, s
+            overrides = {'nu': pois, 'p_atm': 101,
+                         'rho': umass,
+                         'unit_moist_mass': umass,
+                         'nd': 2.0,
+                         # 'n_surf': 25
+                         }
+            # Define material
+            if not hasattr(sl, 'o3_type'):
+                sl.o3_type = sl.type
+            if sl.o3_type == 'pm4sand':
+                sl_class = o3.nd_material.PM4Sand
+                # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
+                app2mod = sl.app2mod
+            elif sl.o3_type == 'sdmodel':
+                sl_class = o3.nd_material.StressDensity
+                # overrides = {'nu': pois, 'p_atm': 101, 'unit_moist_mass': umass}
+                app2mod = sl.app2mod
+            elif sl.o3_type in ['pimy', 'pdmy', 'pdmy02']:
+                if hasattr(sl, 'get_g_mod_at_m_eff_stress'):
+                    if hasattr(sl, 'g_mod_p0') and sl.g_mod_p0 != 0.0:
+                        p = float(props['m_eff'])  # Pa
+                        overrides['d'] = 0.0
+                        g_mod_r = float(props['g_mod']) / 1e3
+                    else:
+                        p = 101.0e3  # Pa
+                        overrides['d'] = sl.a
+                        g_mod_r = sl.get_g_mod_at_m_eff_stress(p) / 1e3
                 else:
                     p = 101.0e3  # Pa
-                    overrides['d'] = sl.a
-                g_mod_r = sl.get_g_mod_at_m_eff_stress(p) / 1e3
+                    overrides['d'] = 0.0
+                    g_mod_r = sl.g_mod / 1e3
+
+                b_mod = 2 * g_mod_r * (1 + sl.poissons_ratio) / (3 * (1 - 2 * sl.poissons_ratio))
+                overrides['p_ref'] = p / 1e3
+                overrides['g_mod_ref'] = g_mod_r
+                overrides['bulk_mod_ref'] = b_mod
+                if sl.o3_type == 'pimy':
+                    overrides['cohesion'] = sl.cohesion / 1e3
+                    sl_class = o3.nd_material.PressureIndependMultiYield
+                elif sl.o3_type == 'pdmy':
+                    sl_class = o3.nd_material.PressureDependMultiYield
+                elif sl.o3_type == 'pdmy02':
+                    sl_class = o3.nd_material.PressureDependMultiYield02
+                    app2mod['e_init'] = 'e_curr'
             else:
-                p = 101.0e3  # Pa
-                overrides['d'] = 0.0
-                g_mod_r = sl.g_mod / 1e3
-
-            b_mod = 2 * g_mod_r * (1 + sl.poissons_ratio) / (3 * (1 - 2 * sl.poissons_ratio))
-            overrides['p_ref'] = p / 1e3
-            overrides['g_mod_ref'] = g_mod_r
-            overrides['bulk_mod_ref'] = b_mod
-            if sl.o3_type == 'pimy':
-                overrides['cohesion'] = sl.cohesion / 1e3
-                sl_class = o3.nd_material.PressureIndependMultiYield
-            elif sl.o3_type == 'pdmy':
-                sl_class = o3.nd_material.PressureDependMultiYield
-            elif sl.o3_type == 'pdmy02':
-                sl_class = o3.nd_material.PressureDependMultiYield02
-                app2mod['e_init'] = 'e_curr'
-        else:
-            g_mod = sp.split['shear_vel'][i] ** 2 / unit_masses[i]
-            sl_class = o3.nd_material.ElasticIsotropic
-            sl.e_mod = 2 * g_mod * (1 - sl.poissons_ratio)
-            overrides['nu'] = sl.poissons_ratio
-            app2mod['rho'] = 'unit_moist_mass'
-        args, kwargs = o3.extensions.get_o3_kwargs_from_obj(sl, sl_class, custom=app2mod, overrides=overrides)
-
-        if o3.extensions.has_o3_model_changed(sl_class, prev_sl_class, args, prev_args, kwargs, prev_kwargs):
-            mat = sl_class(osi, *args, **kwargs)
-            prev_sl_class = sl_class
-            prev_args = copy.deepcopy(args)
-            prev_kwargs = copy.deepcopy(kwargs)
-            mat.dynamic_poissons_ratio = sl.poissons_ratio
-            soil_mats.append(mat)
-
-        # def element
-        for xx in range(nx):
-            nodes = [sn[i+1][xx], sn[i+1][xx + 1], sn[i][xx + 1], sn[i][xx]]  # anti-clockwise
-            #eles.append(o3.element.Quad(osi, nodes, ele_thick, o3.cc.PLANE_STRAIN, mat, b2=-grav * unit_masses[i]))
-            eles.append(o3.element.SSPquad(osi, nodes, mat, o3.cc.PLANE_STRAIN, ele_thick, 0.0, -grav * unit_masses[i]))
-
-    if base_imp >= 0:
-        # define material and element for viscous dampers
-        if base_imp == 0:
-            sl = sp.get_soil_at_depth(sp.height)
-            base_imp = sl.unit_dry_mass * sp.get_shear_vel_at_depth(sp.height)
-        c_base = ele_width * base_imp / 1e3
-        dashpot_mat = o3.uniaxial_material.Viscous(osi, c_base, alpha=1.)
-        o3.element.ZeroLength(osi, [dashpot_node_l, dashpot_node_2], mats=[dashpot_mat], dirs=[o3.cc.DOF2D_X])
-
-    coords = o3.get_all_node_coords(osi)
-    ele_node_tags = o3.get_all_ele_node_tags_as_dict(osi)
-
-    # Static analysis
-    o3.constraints.Transformation(osi)
-    o3.test.NormDispIncr(osi, tol=1.0e-5, max_iter=30, p_flag=0)
-    o3.algorithm.Newton(osi)
-    o3.numberer.RCM(osi)
-    o3.system.ProfileSPD(osi)
-    o3.integrator.Newmark(osi, gamma=0.5, beta=0.25)
-    o3.analysis.Transient(osi)
-    o3.analyze(osi, 10, 500.)
-
-    for i in range(len(soil_mats)):
-        if hasattr(soil_mats[i], 'update_to_nonlinear'):
-            soil_mats[i].update_to_nonlinear()
-    for ele in eles:
-        mat = ele.mat
-        if hasattr(mat, 'set_nu'):
-            mat.set_nu(mat.dynamic_poissons_ratio, eles=[ele])
-    o3.analyze(osi, 40, 500.)
-
-    # reset time and analysis
-    o3.wipe_analysis(osi)
-    o3.set_time(osi, 0.0)
-    if playback:
-        all_node_xdisp_rec = o3.recorder.NodesToArrayCache(osi, 'all', [o3.cc.DOF2D_X], 'disp', nsd=4)
-        all_node_ydisp_rec = o3.recorder.NodesToArrayCache(osi, 'all', [o3.cc.DOF2D_Y], 'disp', nsd=4)
+                g_mod = sp.split['shear_vel'][i] ** 2 / unit_masses[i]
+                sl_class = o3.nd_material.ElasticIsotropic
+                sl.e_mod = 2 * g_mod * (1 - sl.poissons_ratio)
+                overrides['nu'] = sl.poissons_ratio
+                app2mod['rho'] = 'unit_moist_mass'
+            args, kwargs = o3.extensions.get_o3_kwargs_from_obj(sl, sl_class, custom=app2mod, overrides=overrides)
+
+            n_mats = mat_registry.n_mats
+            mat = mat_registry.get_mat(sl_class, args, kwargs, dynamic_poissons_ratio=sl.poissons_ratio)
+            if mat_registry.n_mats > n_mats:  # new material
+                soil_mats.append(mat)
+
+            # def element
+            eles.append(o3.element.SSPquad(osi, list(ele_nodes[i]), mat, o3.cc.PLANE_STRAIN, ele_thick, 0.0,
+                                           -grav * unit_masses[i]))
+
+        if base_imp >= 0:
+            # define material and element for viscous dampers
+            if base_imp == 0:
+                sl = sp.get_soil_at_depth(sp.height)
+                base_imp = sl.unit_dry_mass * sp.get_shear_vel_at_depth(sp.height)
+            c_base = mesh.build_base_dashpot(osi, base_imp)
+
+        coords = o3.get_all_node_coords(osi)
+        ele_node_tags = o3.get_all_ele_node_tags_as_dict(osi)
+
+    with time_phase(stats, 'static'):
+        # Static analysis
+        o3.constraints.Transformation(osi)
+        o3.test.NormDispIncr(osi, tol=1.0e-5, max_iter=30, p_flag=0)
+        o3.algorithm.Newton(osi)
+        o3.numberer.RCM(osi)
+        o3.system.ProfileSPD(osi)
+        o3.integrator.Newmark(osi, gamma=0.5, beta=0.25)
+        o3.analysis.Transient(osi)
+        o3.analyze(osi, 10, 500.)
+
+        for i in range(len(soil_mats)):
+            if hasattr(soil_mats[i], 'update_to_nonlinear'):
+                soil_mats[i].update_to_nonlinear()
+        for ele in eles:
+            mat = ele.mat
+            if hasattr(mat, 'set_nu'):
+                mat.set_nu(mat.dynamic_poissons_ratio, eles=[ele])
+        o3.analyze(osi, 40, 500.)
+
+        # reset time and analysis
+        o3.wipe_analysis(osi)
+        o3.set_time(osi, 0.0)
+        if playback:
+            all_node_xdisp_rec = o3.recorder.NodesToArrayCache(osi, 'all', [o3.cc.DOF2D_X], 'disp', nsd=4)
+            all_node_ydisp_rec = o3.recorder.NodesToArrayCache(osi, 'all', [o3.cc.DOF2D_Y], 'disp', nsd=4)
 
     if hasattr(sp, 'hloads'):
+        with time_phase(stats, 'loads'):
+            # Define the dynamic analysis
+            o3.constraints.Transformation(osi)
+            o3.test.NormDispIncr(osi, tol=1.0e-4, max_iter=30, p_flag=0)
+            # o3.test_check.EnergyIncr(osi, tol=1.0e-6, max_iter=30)
+            o3.algorithm.Newton(osi)
+            o3.system.SparseGeneral(osi)
+            o3.numberer.RCM(osi)
+            o3.integrator.Newmark(osi, gamma=0.5, beta=0.25)
+            o3.analysis.Transient(osi)
+            # o3.rayleigh.Rayleigh(osi, a0, a1, 0, 0)
+            pload = sp.hloads[0].p_x
+            static_time = 100
+            # Add static stress bias
+            time_series = o3.time_series.Path(osi, time=[0, static_time / 2, static_time, 1e3],
+                                              values=[0, 0.5, 1, 1], use_last=1)
+            o3.pattern.Plain(osi, time_series)
+            o3.Load(osi, sn[0][0], [pload * ele_width, 0])
+            o3.Load(osi, sn[9][0], [-pload * ele_width, 0])
+            if base_imp >= 0:
+                o3.Load(osi, sn[-1][0], [-pload, 0])
+
+            static_dt = 0.1
+            o3.analyze(osi, int(static_time / static_dt) * 1.5, static_dt)
+            o3.load_constant(osi, time=0)
+
+            o3.wipe_analysis(osi)
+
+    with time_phase(stats, 'dynamic'):
+        o3.set_time(osi, 0.0)  # TODO:
         # Define the dynamic analysis
         o3.constraints.Transformation(osi)
         o3.test.NormDispIncr(osi, tol=1.0e-4, max_iter=30, p_flag=0)
@@ -599,69 +812,54 @@ def site_response(sp, asig, freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5,
         o3.numberer.RCM(osi)
         o3.integrator.Newmark(osi, gamma=0.5, beta=0.25)
         o3.analysis.Transient(osi)
-        # o3.rayleigh.Rayleigh(osi, a0, a1, 0, 0)
-        pload = sp.hloads[0].p_x
-        static_time = 100
-        print('time: ', o3.get_time(osi))
-        # Add static stress bias
-        time_series = o3.time_series.Path(osi, time=[0, static_time / 2, static_time, 1e3], values=[0, 0.5, 1, 1], use_last=1)
-        o3.pattern.Plain(osi, time_series)
-        o3.Load(osi, sn[0][0], [pload * ele_width, 0])
-        o3.Load(osi, sn[9][0], [-pload * ele_width, 0])
-        if base_imp >= 0:
-            o3.Load(osi, sn[-1][0], [-pload, 0])
+        o3.rayleigh.Rayleigh(osi, a0, a1, 0, 0)
 
-        static_dt = 0.1
-        o3.analyze(osi, int(static_time / static_dt) * 1.5, static_dt)
-        o3.load_constant(osi, time=0)
+        init_time = o3.get_time(osi)
+        o3sra_outs = O3SRAOutputs()
+        o3sra_outs.start_recorders(osi, outs, sn, eles, rec_dt=rec_dt)
 
-        o3.wipe_analysis(osi)
-    o3.set_time(osi, 0.0)  # TODO:
-    # Define the dynamic analysis
-    o3.constraints.Transformation(osi)
-    o3.test.NormDispIncr(osi, tol=1.0e-4, max_iter=30, p_flag=0)
-    # o3.test_check.EnergyIncr(osi, tol=1.0e-6, max_iter=30)
-    o3.algorithm.Newton(osi)
-    o3.system.SparseGeneral(osi)
-    o3.numberer.RCM(osi)
-    o3.integrator.Newmark(osi, gamma=0.5, beta=0.25)
-    o3.analysis.Transient(osi)
-    o3.rayleigh.Rayleigh(osi, a0, a1, 0, 0)
-
-    init_time = o3.get_time(osi)
-    o3sra_outs = O3SRAOutputs()
-    o3sra_outs.start_recorders(osi, outs, sn, eles, rec_dt=rec_dt)
-
-    # Define the dynamic input motion
-    if base_imp < 0:  # fixed base
-        acc_series = o3.time_series.Path(osi, dt=asig.dt, values=asig.values)
-        o3.pattern.UniformExcitation(osi, dir=o3.cc.X, accel_series=acc_series)
-    else:
-        ts_obj = o3.time_series.Path(osi, dt=asig.dt, values=asig.velocity * 1, factor=c_base)
-        o3.pattern.Plain(osi, ts_obj)
-        o3.Load(osi, sn[-1][0], [1., 0.])
-    if state == 3:
-        o3.extensions.to_py_file(osi, opfile)
-    # Run the dynamic motion
-    o3.record(osi)
-    while o3.get_time(osi) - init_time < analysis_time:
-        if o3.analyze(osi, 1, analysis_dt):
-            print('failed')
-            break
-    o3.wipe(osi)
-    out_dict = o3sra_outs.results_to_dict()
-
-    if cache_path:
-        o3sra_outs.cache_path = cache_path
-        o3sra_outs.results_to_files()
-        o3res = o3.results.Results2D()
-        o3res.cache_path = cache_path
-        o3res.coords = coords
-        o3res.ele2node_tags = ele_node_tags
-        if playback:
-            o3res.x_disp = all_node_xdisp_rec.collect()
-            o3res.y_disp = all_node_ydisp_rec.collect()
-        o3res.save_to_cache()
+        # Define the dynamic input motion
+        if base_imp < 0:  # fixed base
+            acc_series = o3.time_series.Path(osi, dt=asig.dt, values=asig.values)
+            o3.pattern.UniformExcitation(osi, dir=o3.cc.X, accel_series=acc_series)
+        else:
+            ts_obj = o3.time_series.Path(osi, dt=asig.dt, values=asig.velocity * 1, factor=c_base)
+            o3.pattern.Plain(osi, ts_obj)
+            o3.Load(osi, sn[-1][0], [1., 0.])
+        if state == 3:
+            o3.extensions.to_py_file(osi, opfile)
+        # Run the dynamic motion
+        o3.record(osi)
+        n_steps = 0
+        failed = []
+        while o3.get_time(osi) - init_time < analysis_time:
+            if o3.analyze(osi, 1, analysis_dt):
+                failed.append([o3.get_time(osi), analysis_dt])
+                if verbose:
+                    print(f'analysis failed to converge at time: {o3.get_time(osi) - init_time:.4g}')
+                break
+            n_steps += 1
+        o3.wipe(osi)
+        if stats is not None:
+            stats.step_history = {'time': np.array([init_time]), 'dt': np.array([analysis_dt]),
+                                  'n_steps': np.array([n_steps]), 'failed': np.array(failed).reshape(-1, 2),
+                                  'completed': not len(failed), 'rescued': np.zeros((0, 3)), 'fallbacks': [],
+                                  'n_iters': None}
+
+    with time_phase(stats, 'collect'):
+        out_dict = o3sra_outs.results_to_dict()
+
+        if cache_path:
+            o3sra_outs.cache_path = cache_path
+            o3sra_outs.results_to_files()
+            o3res = o3.results.Results2D()
+            o3res.cache_path = cache_path
+            o3res.coords = coords
+            o3res.ele2node_tags = ele_node_tags
+            if playback:
+                o3res.x_disp = all_node_xdisp_rec.collect()
+                o3res.y_disp = all_node_ydisp_rec.collect()
+            o3res.save_to_cache()
 
     return out_dict
 
@@ -1,16 +1,21 @@
 import numpy as np
 import o3seespy as o3
 import o3seespy.extensions
-import copy
 import os
 import o3soil
+from o3soil.generic import MaterialRegistry
 from o3soil.sra.output import O3SRAOutputs
+from o3soil.sra.column import SoilColumnMesh, get_ele_prop_table, gen_column_split
+from o3soil.parallel import run_in_fork
+from o3soil.sra.stepping import AdaptiveStepper, DEFAULT_FALLBACKS
+from o3soil.sra.stats import SRAStats, time_phase, timed_phase
 
 
 class ESSRA1D(object):
     osi = None
 
-    def __init__(self, sp, dy=0.5, k0=0.5, base_imp=0, cache_path=None, opfile=None, verbose=0):
+    def __init__(self, sp, dy=0.5, k0=0.5, base_imp=0, cache_path=None, opfile=None, verbose=0, mat_rtol=0.0,
+                 cache_fmt='npz', instrument=False, f_max=None, n_per_wave=10, softening=1.0):
         """
 
         Parameters
@@ -24,9 +29,24 @@ class ESSRA1D(object):
             If negative then use fixed base
         cache_path
         opfile
+        mat_rtol: float
+            If greater than zero, then sub-layers with stress-dependent moduli within this relative tolerance share a
+            material (see `o3soil.MaterialRegistry`)
+        cache_fmt: str
+            Format of the results saved to `cache_path` (see `O3SRAOutputs.results_to_files`)
+        instrument: bool
+            If True, then the time of each phase, the time steps and the solver iterations of each step are
+            recorded in `self.stats` (a `SRAStats` object) and saved to `<cache_path>stats.json`
+        f_max: float
+            If set, then the sub-layers are sized from the shear wavelength at this frequency (Hz) rather than `dy`
+            (see `o3soil.sra.column.gen_wavelength_split`)
+        n_per_wave: int
+            Number of elements per wavelength (if `f_max` is set)
+        softening: float
+            Ratio of the strain-softened to the small strain shear wave velocity used to size the sub-layers
         """
         self.sp = sp
-        sp.gen_split(props=['shear_vel', 'unit_mass'], target=dy)
+        gen_column_split(sp, dy=dy, f_max=f_max, n_per_wave=n_per_wave, softening=softening)
         thicknesses = sp.split["thickness"]
         self.n_node_rows = len(thicknesses) + 1
         node_depths = -np.cumsum(sp.split["thickness"])
@@ -42,12 +62,19 @@ class ESSRA1D(object):
         self.ele_width = 3 * min(thicknesses)
         self.cache_path = cache_path
         self.opfile = opfile
+        self.mat_rtol = mat_rtol
+        self.cache_fmt = cache_fmt
+        self.stats = SRAStats() if instrument else None
         # Defined in static analysis
         self.soil_mats = None
         self.eles = None
+        self.ele_props = None  # soil properties of each element (see `get_ele_prop_table`)
         self.sn = None  # soil nodes
+        # Defined in dynamic analysis
+        self.step_history = None
         self.verbose = verbose
 
+    @timed_phase('build')
     def build_model(self):
         # Define nodes and set boundary conditions for simple shear deformation
         # Start at top and build down?
@@ -57,51 +84,22 @@ class ESSRA1D(object):
             self.state = 0
         if self.osi is None:
             self.osi = o3.OpenSeesInstance(ndm=2, ndf=3, state=self.state)
-        nx = 1
-        sn = []
-        # sn = [[o3.node.Node(osi, ele_width * j, 0) for j in range(nx + 1)]]
-        for i in range(0, self.n_node_rows):
-            # Establish left and right nodes
-            sn.append([o3.node.Node(self.osi, self.ele_width * j, self.node_depths[i]) for j in range(nx + 1)])
-            # set x and y dofs equal for left and right nodes
-            if i != self.n_node_rows - 1:
-                o3.EqualDOF(self.osi, sn[i][0], sn[i][-1], [o3.cc.DOF2D_X, o3.cc.DOF2D_Y, o3.cc.DOF2D_PP])
-        sn = np.array(sn)
-
-        if self.base_imp < 0:
-            # Fix base nodes
-            for j in range(nx + 1):
-                o3.Fix3DOF(self.osi, sn[-1][j], o3.cc.FIXED, o3.cc.FIXED, o3.cc.FIXED)  # Fixed pore pressure at base
-        else:
-            # Fix base nodes
-            for j in range(nx + 1):
-                o3.Fix3DOF(self.osi, sn[-1][j], o3.cc.FREE, o3.cc.FIXED, o3.cc.FIXED)  # Fixed pore pressure at base
-
-            # Define dashpot nodes
-            self.osi.reset_model_params(2, ndf=2)
-            dashpot_node_l = o3.node.Node(self.osi, 0, self.node_depths[-1])
-            dashpot_node_2 = o3.node.Node(self.osi, 0, self.node_depths[-1])
-            o3.Fix2DOF(self.osi, dashpot_node_l, o3.cc.FIXED, o3.cc.FIXED)
-            o3.Fix2DOF(self.osi, dashpot_node_2, o3.cc.FREE, o3.cc.FIXED)
-
-            # define equal DOF for dashpot and soil base nodes
-            o3.EqualDOF(self.osi, sn[-1][0], sn[-1][1], [o3.cc.X])
-            o3.EqualDOF(self.osi, sn[-1][0], dashpot_node_2, [o3.cc.X])
+        self.mesh = SoilColumnMesh(self.node_depths, self.ele_width, base_imp=self.base_imp)
+        sn = self.mesh.build(self.osi, ndf=3)
+        ele_nodes = self.mesh.ele_nodes
 
         # define materials
         pois = self.k0 / (1 + self.k0)
         ele_thick = 1.0  # m
         self.soil_mats = []
         strains = np.logspace(-6, -0.5, 16)
-        prev_args = []
-        prev_kwargs = {}
-        prev_sl_class = None
+        self.mat_registry = MaterialRegistry(self.osi, rtol=self.mat_rtol)
         self.eles = []
+        self.ele_props = get_ele_prop_table(self.sp, -self.ele_depths)
+        sls = [self.sp.layer(i + 1) for i in range(self.sp.n_layers)]
         for i in range(len(self.ele_depths)):
-            y_depth = -self.ele_depths[i]
-
-            sl_id = self.sp.get_layer_index_by_depth(y_depth)
-            sl = self.sp.layer(sl_id)
+            props = self.ele_props[i]
+            sl = sls[props['layer'] - 1]
 
             if hasattr(sl, 'op_type'):
                 if sl.built:
@@ -111,20 +109,12 @@ class ESSRA1D(object):
                     mat = sl
                     self.soil_mats.append(mat)
             else:
-                if y_depth > self.sp.gwl:
-                    saturated = True
-                else:
-                    saturated = False
-                esig_v0 = self.sp.get_v_eff_stress_at_depth(y_depth)
-                sl_class, args, kwargs = o3soil.get_o3_class_and_args_from_soil_obj(sl, saturated,
+                sl_class, args, kwargs = o3soil.get_o3_class_and_args_from_soil_obj(sl, bool(props['saturated']),
                                                                                     overrides={'nu': pois},
-                                                                                    esig_v0=esig_v0)
-                if o3.extensions.has_o3_model_changed(sl_class, prev_sl_class, args, prev_args, kwargs, prev_kwargs):
-                    mat = sl_class(self.osi, *args, **kwargs)
-                    prev_sl_class = sl_class
-                    prev_args = copy.deepcopy(args)
-                    prev_kwargs = copy.deepcopy(kwargs)
-                    mat.dynamic_poissons_ratio = sl.poissons_ratio
+                                                                                    esig_v0=float(props['v_eff']))
+                n_mats = self.mat_registry.n_mats
+                mat = self.mat_registry.get_mat(sl_class, args, kwargs, dynamic_poissons_ratio=sl.poissons_ratio)
+                if self.mat_registry.n_mats > n_mats:  # new material
                     self.soil_mats.append(mat)
 
             # def element
@@ -132,21 +122,18 @@ class ESSRA1D(object):
                 k_water = self.sp.water_bulk_mod
             else:
                 k_water = 2.2e6
-            for xx in range(nx):
-                nodes = [sn[i + 1][xx], sn[i + 1][xx + 1], sn[i][xx + 1], sn[i][xx]]  # anti-clockwise
-                a_sspquad_up = 6.0e-5
-                self.eles.append(o3.element.SSPquadUP(self.osi, nodes, mat, ele_thick, k_water, f_den=1.0, k1=sl.permeability,
-                                                      k2=sl.permeability, void=sl.e_curr, alpha=a_sspquad_up,
-                                                      b2=-self.grav))
+            a_sspquad_up = 6.0e-5
+            self.eles.append(o3.element.SSPquadUP(self.osi, list(ele_nodes[i]), mat, ele_thick, k_water, f_den=1.0,
+                                                  k1=sl.permeability, k2=sl.permeability, void=sl.e_curr,
+                                                  alpha=a_sspquad_up, b2=-self.grav))
         self.sn = sn
         if self.base_imp >= 0:
             # define material and element for viscous dampers
-            if self.base_imp == 0:
+            base_imp = self.base_imp
+            if base_imp == 0:
                 sl = self.sp.get_soil_at_depth(self.sp.height)
                 base_imp = sl.unit_dry_mass * self.sp.get_shear_vel_at_depth(self.sp.height)
-            self.c_base = self.ele_width * base_imp / 1e3
-            dashpot_mat = o3.uniaxial_material.Viscous(self.osi, self.c_base, alpha=1.)
-            o3.element.ZeroLength(self.osi, [dashpot_node_l, dashpot_node_2], mats=[dashpot_mat], dirs=[o3.cc.DOF2D_X])
+            self.c_base = self.mesh.build_base_dashpot(self.osi, base_imp)
 
         self.o3res = o3.results.Results2D(cache_path=self.cache_path)
         self.o3res.wipe_old_files()
@@ -156,6 +143,7 @@ class ESSRA1D(object):
         for ele in self.eles:
             self.o3res.mat2ele_tags.append([ele.mat.tag, ele.tag])
 
+    @timed_phase('static')
     def execute_static(self, ray_freqs=(0.5, 10), xi=0.03):
         # Static analysis
         # for i in range(len(self.soil_mats)):  # TODO: should be a method on object 'update_to_linear'
@@ -204,6 +192,7 @@ class ESSRA1D(object):
         # Convert to positive since ele depths go downwards
         return int(np.round(np.interp(depth, -self.ele_depths, np.arange(len(self.ele_depths)))))
 
+    @timed_phase('loads')
     def apply_loads(self, ray_freqs=(0.5, 10), xi=0.03):
         o3.set_time(self.osi, 0.0)
 
@@ -223,7 +212,6 @@ class ESSRA1D(object):
         o3.rayleigh.Rayleigh(self.osi, a0, a1, 0, 0)
 
         static_time = 500
-        print('time: ', o3.get_time(self.osi))
         # Add static stress bias
         time_series = o3.time_series.Path(self.osi, time=[0, static_time / 2, static_time, 1e3], values=[0, 0.5, 1, 1],
                                           use_last=True)
@@ -233,7 +221,8 @@ class ESSRA1D(object):
             pload = self.sp.hloads[i].p_x
             y = self.sp.hloads[i].y
             ind = self.get_nearest_node_layer_at_depth(y)
-            print(i, y, ind)
+            if self.verbose:
+                print(f'horizontal load {i} at depth: {y}, node row: {ind}')
             if self.sp.loads_are_stresses:
                 pload *= self.ele_width
             o3.Load(self.osi, self.sn[ind][0], [pload, 0, 0])
@@ -245,14 +234,74 @@ class ESSRA1D(object):
         o3.analyze(self.osi, int(static_time / static_dt), static_dt)
         o3.load_constant(self.osi, time=0)
 
+    def apply_motion(self, asig):
+        """
+        Defines the dynamic input motion at the base of the column, returns the load pattern
+
+        A zero is appended to the motion, since OpenSees evaluates a `Path` as zero at exactly its last time
+        (which the time steps land on), so the motion would otherwise drop to zero in the last step.
+        """
+        if self.base_imp < 0:  # fixed base
+            acc_series = o3.time_series.Path(self.osi, dt=asig.dt, values=np.append(asig.values, 0.0))
+            return o3.pattern.UniformExcitation(self.osi, dir=o3.cc.X, accel_series=acc_series)
+        ts_obj = o3.time_series.Path(self.osi, dt=asig.dt, values=np.append(asig.velocity, 0.0), factor=self.c_base)
+        pattern = o3.pattern.Plain(self.osi, ts_obj)
+        o3.Load(self.osi, self.sn[-1][0], [1., 0., 0])
+        return pattern
+
     def execute_dynamic(self, asig, analysis_dt=0.001, ray_freqs=(0.5, 10), xi=0.03, analysis_time=None,
-                        outs=None, rec_dt=None, playback_dt=None, playback=True):
+                        outs=None, rec_dt=None, playback_dt=None, playback=True, keep_static_state=False,
+                        min_analysis_dt=None, chunked=False, stream=False, summary=False,
+                        fallbacks=DEFAULT_FALLBACKS):
+        """
+        Run the dynamic analysis of the input motion and collect the outputs in `self.out_dict`
+
+        The analysis uses an adaptive time step (see `o3soil.sra.stepping.AdaptiveStepper`), which starts at
+        `analysis_dt` and is halved on non-convergence (down to `min_analysis_dt`). Before the time step is halved,
+        the failed step is retried with each of the `fallbacks` solvers. The time steps used (and the steps rescued
+        by a fallback) are stored in `self.step_history`.
+
+        Parameters
+        ----------
+        analysis_dt: float
+            Maximum time step of the analysis
+        min_analysis_dt: float
+            Minimum time step of the analysis, if None then `analysis_dt / 2 ** 10`
+        chunked: bool
+            If True, then many time steps are run per call to OpenSees (see `AdaptiveStepper`),
+            the outputs match single steps, but the run times were not measurably shorter
+        fallbacks: list of `o3soil.sra.stepping.Solver`
+            Solvers tried in order on a failed step (the analysis returns to `Newton` after the step),
+            if None or empty then failed steps are only substepped
+        stream: bool
+            If True, then the outputs are streamed to binary files (in `cache_path`, which must be set) during
+            the analysis and the arrays of `out_dict` are memory-mapped to them
+        summary: bool
+            If True, then the full time series are not stored, instead `out_dict` has the running summary
+            statistics (max, min, peak, time of peak, rms, Arias intensity) of each output at each depth
+            (see `O3SRAOutputs.summary_to_dict`)
+        keep_static_state: bool
+            If True, then the dynamic analysis is run in a forked copy of the process, so that the model
+            remains in its post-static state and `execute_dynamic` can be called again for another motion
+            without rebuilding the model and repeating the static analysis.
+        """
+        if keep_static_state:
+            def run_dynamic():
+                self.execute_dynamic(asig, analysis_dt=analysis_dt, ray_freqs=ray_freqs, xi=xi,
+                                     analysis_time=analysis_time, outs=outs, rec_dt=rec_dt, playback_dt=playback_dt,
+                                     playback=playback, min_analysis_dt=min_analysis_dt,
+                                     chunked=chunked, stream=stream, summary=summary, fallbacks=fallbacks)
+                return self.out_dict, self.step_history, self.stats
+            self.out_dict, self.step_history, self.stats = run_in_fork(run_dynamic)
+            return
         self.rec_dt = rec_dt
         self.playback_dt = playback_dt
         if rec_dt is None:
             self.rec_dt = asig.dt
         if playback_dt is None:
             self.playback_dt = analysis_dt
+        if analysis_time is None:
+            analysis_time = asig.time[-1]
         o3.set_time(self.osi, 0.0)
 
         # Define the dynamic analysis
@@ -278,40 +327,51 @@ class ESSRA1D(object):
         else:
             self.o3res.dynamic = False
         self.o3sra_outs = O3SRAOutputs()
-        self.o3sra_outs.start_recorders(self.osi, outs, self.sn, self.eles, rec_dt=self.rec_dt)
+        self.o3sra_outs.start_recorders(self.osi, outs, self.sn, self.eles, rec_dt=self.rec_dt, stream=stream,
+                                        stream_path=self.cache_path, summary=summary)
 
         # Define the dynamic input motion
-        if self.base_imp < 0:  # fixed base
-            acc_series = o3.time_series.Path(self.osi, dt=asig.dt, values=asig.values)
-            o3.pattern.UniformExcitation(self.osi, dir=o3.cc.X, accel_series=acc_series)
-        else:
-            ts_obj = o3.time_series.Path(self.osi, dt=asig.dt, values=asig.velocity * 1, factor=self.c_base)
-            o3.pattern.Plain(self.osi, ts_obj)
-            o3.Load(self.osi, self.sn[-1][0], [1., 0., 0])
+        self.apply_motion(asig)
         if self.state == 3:
             o3.extensions.to_py_file(self.osi, self.opfile, compress=True)
         # Run the dynamic motion
         o3.record(self.osi)
-        curr_time = o3.get_time(self.osi)
-        while curr_time - init_time < analysis_time:
-            if self.verbose:
-                print('time: ', curr_time)
-            if o3.analyze(self.osi, 1, analysis_dt):
-                print('failed')
-                if o3.analyze(self.osi, 10, analysis_dt / 10):
-                    break
-            curr_time = o3.get_time(self.osi)
+        rec_dts = [self.rec_dt]
+        if playback:
+            rec_dts.append(self.playback_dt)
+        stepper = AdaptiveStepper(self.osi, analysis_dt, dt_min=min_analysis_dt, rec_dts=rec_dts,
+                                  chunked=chunked, verbose=self.verbose,
+                                  callback=self.o3sra_outs.update if summary else None,
+                                  record_iters=self.stats is not None, fallbacks=fallbacks)
+        with time_phase(self.stats, 'dynamic'):
+            completed = stepper.run(analysis_time)
+        if not completed and self.verbose:
+            print(f'analysis failed to converge at time: {o3.get_time(self.osi) - init_time:.4g}')
+        self.step_history = stepper.step_history
+        if self.stats is not None:
+            self.stats.step_history = self.step_history
         o3.wipe(self.osi)
-        self.out_dict = self.o3sra_outs.results_to_dict()
+        with time_phase(self.stats, 'collect'):
+            self.out_dict = self.o3sra_outs.results_to_dict()
 
         if self.cache_path:
             self.o3sra_outs.cache_path = self.cache_path
-            self.o3sra_outs.results_to_files()
+            params = {'analysis_dt': analysis_dt, 'min_analysis_dt': min_analysis_dt, 'rec_dt': self.rec_dt,
+                      'analysis_time': analysis_time, 'ray_freqs': ray_freqs, 'xi': xi, 'base_imp': self.base_imp,
+                      'k0': self.k0, 'motion': asig.label, 'motion_dt': asig.dt,
+                      'completed': self.step_history['completed'],
+                      'n_rescued': len(self.step_history['rescued'])}
+            self.o3sra_outs.results_to_files(fmt=self.cache_fmt, params=params)
+            if self.stats is not None:
+                self.stats.to_file(self.cache_path + 'stats.json')
             self.o3res.save_to_cache()
 
 
 def run_essra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5, analysis_time=None, outs=None,
-                  base_imp=0, k0=0.5, cache_path=None, opfile=None, playback=False, rec_dt=None, verbose=0):
+                  base_imp=0, k0=0.5, cache_path=None, opfile=None, playback=False, rec_dt=None, verbose=0,
+                  min_analysis_dt=None, mat_rtol=0.0, stream=False, cache_fmt='npz',
+                  summary=False, instrument=False, fallbacks=DEFAULT_FALLBACKS, f_max=None, n_per_wave=10,
+                  softening=1.0):
     """
 
     Parameters
@@ -320,7 +380,8 @@ def run_essra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5,
     asig
     ray_freqs
     xi
-    analysis_dt
+    analysis_dt: float
+        Maximum time step of the analysis
     dy
     analysis_time
     outs
@@ -332,17 +393,40 @@ def run_essra(sp, asig, ray_freqs=(0.5, 10), xi=0.03, analysis_dt=0.001, dy=0.5,
     cache_path
     opfile
     playback
+    mat_rtol: float
+        Relative tolerance for sharing materials with stress-dependent moduli (see `o3soil.MaterialRegistry`)
+    stream: bool
+        If True, then the outputs are streamed to binary files and memory-mapped (see `execute_dynamic`)
+    summary: bool
+        If True, then only the summary statistics of the outputs are collected (see `execute_dynamic`)
+    instrument: bool
+        If True, then the phase times and time step statistics are recorded in `stats` (see `SRAStats`)
+    fallbacks: list of `o3soil.sra.stepping.Solver`
+        Solvers tried in order on a failed time step (see `execute_dynamic`)
+    cache_fmt: str
+        Format of the results saved to `cache_path` (see `O3SRAOutputs.results_to_files`)
+    f_max: float
+        If set, then the sub-layers are sized from the shear wavelength at this frequency (Hz) rather than `dy`
+        (see `o3soil.sra.column.gen_wavelength_split`)
+    n_per_wave: int
+        Number of elements per wavelength (if `f_max` is set)
+    softening: float
+        Ratio of the strain-softened to the small strain shear wave velocity used to size the sub-layers
 
     Returns
     -------
 
     """
-    sra_1d = ESSRA1D(sp, dy=dy, k0=k0, base_imp=base_imp, cache_path=cache_path, opfile=opfile, verbose=verbose)
+    sra_1d = ESSRA1D(sp, dy=dy, k0=k0, base_imp=base_imp, cache_path=cache_path, opfile=opfile, verbose=verbose,
+                     mat_rtol=mat_rtol, cache_fmt=cache_fmt, instrument=instrument, f_max=f_max,
+                     n_per_wave=n_per_wave, softening=softening)
     sra_1d.build_model()
     sra_1d.execute_static()
     if hasattr(sra_1d.sp, 'hloads'):
         sra_1d.apply_loads()
     sra_1d.execute_dynamic(asig, analysis_dt=analysis_dt, ray_freqs=ray_freqs, xi=xi, analysis_time=analysis_time,
-                           outs=outs, playback=playback, playback_dt=0.01, rec_dt=rec_dt)
+                           outs=outs, playback=playback, playback_dt=0.01, rec_dt=rec_dt,
+                           min_analysis_dt=min_analysis_dt, stream=stream,
+                           summary=summary, fallbacks=fallbacks)
     return sra_1d
 
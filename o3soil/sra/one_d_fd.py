@@ -0,0 +1,308 @@
+import numpy as np
+
+
+def calc_mod_hyp_g_mod_red_and_xi(strain, strain_ref, curvature, xi_min, masing_scaling=0.62):
+    """
+    Modulus reduction and damping ratio of the modified hyperbolic model (Darendeli, 2001)
+
+    Parameters
+    ----------
+    strain: array_like
+        Shear strain (decimal)
+    strain_ref: array_like
+        Reference shear strain (decimal), strain at which G/G_max=0.5
+    curvature: array_like
+        Curvature of the modulus reduction curve
+    xi_min: array_like
+        Small strain damping ratio (decimal)
+    masing_scaling: float
+        Scaling of the Masing damping (default corresponds to 10 loading cycles)
+
+    Returns
+    -------
+    g_mod_red: array_like
+        Modulus reduction G/G_max
+    xi: array_like
+        Damping ratio (decimal)
+    """
+    x = np.abs(strain) / strain_ref
+    g_mod_red = 1. / (1 + x ** curvature)
+    xs = np.where(x > 1.0e-4, x, 1.0)  # avoid round-off in the small strain expression
+    xi_a1 = np.where(x > 1.0e-4, 100. / np.pi * (4 * (1 + xs) * (xs - np.log1p(xs)) / xs ** 2 - 2), 200. / (3 * np.pi) * x)
+    c1 = -1.1143 * curvature ** 2 + 1.8618 * curvature + 0.2523
+    c2 = 0.0805 * curvature ** 2 - 0.0710 * curvature - 0.0095
+    c3 = -0.0005 * curvature ** 2 + 0.0002 * curvature + 0.0003
+    xi_masing = c1 * xi_a1 + c2 * xi_a1 ** 2 + c3 * xi_a1 ** 3  # in percent
+    xi = xi_min + masing_scaling * xi_masing * g_mod_red ** 0.1 / 100
+    return g_mod_red, xi
+
+
+def get_hyp_params(sp, depths, xi=0.03):
+    """
+    Small strain damping and modified hyperbolic parameters of the soil at each depth
+
+    Soils with `sra_type='hyperbolic'` and `strain_ref` set are strain-compatible (using `strain_curvature`
+    and `xi_min`), all other soils are linear with damping `sl.xi` (or `xi` if not set).
+
+    Returns
+    -------
+    xi0: array_like
+        Small strain damping ratio
+    strain_ref: array_like
+        Reference strain (nan if linear)
+    strain_curvature: array_like
+    """
+    n = len(depths)
+    xi0 = np.ones(n) * xi
+    strain_ref = np.full(n, np.nan)
+    strain_curvature = np.ones(n)
+    for i, depth in enumerate(depths):
+        sl = sp.get_soil_at_depth(depth)
+        if getattr(sl, 'sra_type', None) == 'hyperbolic' and getattr(sl, 'strain_ref', None) is not None:
+            strain_ref[i] = sl.strain_ref
+            strain_curvature[i] = getattr(sl, 'strain_curvature', 1.0)
+            if getattr(sl, 'xi_min', None) is not None:
+                xi0[i] = sl.xi_min
+        elif getattr(sl, 'xi', None) is not None:
+            xi0[i] = sl.xi
+    return xi0, strain_ref, strain_curvature
+
+
+class FDSRA1D(object):
+
+    def __init__(self, sp, dy=0.5, base_imp=0, xi=0.03):
+        """
+        Frequency domain (linear and equivalent linear) site response analysis of a soil profile
+
+        Soils with `sra_type='hyperbolic'` and `strain_ref` set are strain-compatible in the equivalent linear
+        analysis (using `strain_curvature` and `xi_min`), all other soils are linear with damping `sl.xi`
+        (or `xi` if not set).
+
+        Parameters
+        ----------
+        sp: sfsimodels.SoilProfile object
+        dy: float
+            Target thickness of the sub-layers
+        base_imp: float
+            If positive then use as impedence at base of model,
+            If zero then use last soil layer
+            If negative then use fixed base
+        xi: float
+            Damping ratio of soils that do not have `xi` set
+        """
+        self.sp = sp
+        sp.gen_split(props=['shear_vel', 'unit_mass'], target=dy)
+        self.thicknesses = sp.split["thickness"]
+        node_depths = -np.cumsum(self.thicknesses)
+        self.node_depths = np.insert(node_depths, 0, 0)
+        self.ele_depths = (self.node_depths[1:] + self.node_depths[:-1]) / 2
+        self.unit_masses = sp.split["unit_mass"]
+        self.g_mod0 = self.unit_masses * sp.split["shear_vel"] ** 2
+        self.base_imp = base_imp
+
+        self.xi0, self.strain_ref, self.strain_curvature = get_hyp_params(sp, -self.ele_depths, xi=xi)
+        self.nonlinear = ~np.isnan(self.strain_ref)
+        if self.base_imp == 0:
+            sl = self.sp.get_soil_at_depth(self.sp.height)
+            self.base_imp = sl.unit_dry_mass * self.sp.get_shear_vel_at_depth(self.sp.height)
+        # Defined in analysis
+        self.g_mod = None
+        self.xi = None
+        self.max_strain = None
+        self.n_iters = None  # number of equivalent linear iterations of each motion
+        self.out_dict = None
+
+    def calc_wave_amplitudes(self, omega, g_mod, xi):
+        """
+        Amplitudes of the up-going and down-going waves at the top of each layer (and the base) for unit
+        amplitudes at the surface
+
+        Parameters
+        ----------
+        omega: array_like (n_freqs)
+            Angular frequencies
+        g_mod: array_like (n_motions, n_eles)
+            Shear modulus of each layer
+        xi: array_like (n_motions, n_eles)
+            Damping ratio of each layer
+
+        Returns
+        -------
+        amp_up, amp_down: array_like (n_motions, n_eles + 1, n_freqs)
+        k_star: array_like (n_motions, n_eles, n_freqs)
+            Complex wave numbers
+        e_half: array_like (n_motions, n_eles, n_freqs)
+            Phase change over half of each layer, exp(i k* h / 2)
+        g_star: array_like (n_motions, n_eles)
+            Complex shear moduli
+        """
+        g_star = g_mod * (1 - 2 * xi ** 2 + 2j * xi * np.sqrt(1 - xi ** 2))
+        imp_star = np.sqrt(self.unit_masses * g_star)
+        k_star = omega * np.sqrt(self.unit_masses / g_star)[:, :, np.newaxis]
+        e_half = np.exp(0.5j * k_star * self.thicknesses[:, np.newaxis])
+        n_m, n_e = g_star.shape
+        amp_up = np.ones((n_m, n_e + 1, len(omega)), dtype=complex)
+        amp_down = np.ones((n_m, n_e + 1, len(omega)), dtype=complex)
+        for i in range(n_e):
+            if i < n_e - 1:
+                alpha = imp_star[:, i] / imp_star[:, i + 1]
+            elif self.base_imp > 0:
+                alpha = imp_star[:, i] / self.base_imp
+            else:  # fixed base, only the total motion at the base is required
+                alpha = np.ones(n_m)
+            alpha = alpha[:, np.newaxis]
+            e_pos = e_half[:, i] ** 2
+            e_neg = 1. / e_pos
+            amp_up[:, i + 1] = 0.5 * (amp_up[:, i] * (1 + alpha) * e_pos + amp_down[:, i] * (1 - alpha) * e_neg)
+            amp_down[:, i + 1] = 0.5 * (amp_up[:, i] * (1 - alpha) * e_pos + amp_down[:, i] * (1 + alpha) * e_neg)
+        return amp_up, amp_down, k_star, e_half, g_star
+
+    def calc_tfs(self, omega, g_mod, xi, acc=True):
+        """
+        Transfer functions from the input motion to the node accelerations and to the strain (and complex modulus)
+        at the centre of each element
+
+        Returns
+        -------
+        acc_tfs: array_like (n_motions, n_eles + 1, n_freqs)
+            None if not `acc`
+        strain_tfs: array_like (n_motions, n_eles, n_freqs)
+            Shear strain (`gxy`, with y upwards) per unit input acceleration
+        g_star: array_like (n_motions, n_eles)
+        """
+        amp_up, amp_down, k_star, e_half, g_star = self.calc_wave_amplitudes(omega, g_mod, xi)
+        if self.base_imp < 0:  # input motion is the within motion at the base
+            denom = amp_up[:, -1] + amp_down[:, -1]
+        else:  # input motion is the outcropping motion
+            denom = 2 * amp_up[:, -1]
+        inv_denom = 1. / denom[:, np.newaxis]
+        acc_tfs = (amp_up + amp_down) * inv_denom if acc else None
+        omega_sqr = np.where(omega > 0, omega ** 2, np.inf)
+        # displacement is -acc / omega ** 2, and y is upwards (dz = -dy)
+        strain_tfs = 1j * k_star * (amp_up[:, :-1] * e_half - amp_down[:, :-1] / e_half) * (inv_denom / omega_sqr)
+        return acc_tfs, strain_tfs, g_star
+
+    def execute(self, asigs, outs=None, eql=True, n_iter=15, strain_ratio=0.65, tol=0.01):
+        """
+        Run the analysis of a single motion or a batch of motions
+
+        The motions are analysed together as arrays of (motion, frequency), so the equivalent linear
+        iterations of all motions run at once.
+
+        Parameters
+        ----------
+        asigs: eqsig.AccSignal object or list of eqsig.AccSignal objects
+            Input motion(s) with the same time step, if `base_imp` is negative then the within motion at the base,
+            otherwise the outcropping motion
+        outs: dict
+            Outputs ('ACCX', 'STRS', 'TAU') and either 'all' or a list of depths (default all outputs at all depths)
+        eql: bool
+            If True then the modulus and damping of the hyperbolic soils are iterated to be strain-compatible
+        n_iter: int
+            Maximum number of equivalent linear iterations
+        strain_ratio: float
+            Ratio of the effective to the maximum shear strain
+        tol: float
+            Convergence tolerance of the relative change of the modulus and damping between iterations
+
+        Sets `self.out_dict` with arrays of shape (n_locations, n_times) for a single motion, or
+        (n_motions, n_locations, n_times) for a list of motions. 'ACCX' is the absolute acceleration at the nodes,
+        'STRS' and 'TAU' (in kPa) are the shear strain and stress at the element centres.
+        """
+        if outs is None:
+            outs = {'ACCX': 'all', 'STRS': 'all', 'TAU': 'all'}
+        single = not isinstance(asigs, (list, tuple))
+        if single:
+            asigs = [asigs]
+        dt = asigs[0].dt
+        for asig in asigs:
+            if not np.isclose(asig.dt, dt):
+                raise ValueError('all motions must have the same time step')
+        npts = max([asig.npts for asig in asigs])
+        n_fft = 2 ** int(np.ceil(np.log2(2 * npts)))
+        acc = np.zeros((len(asigs), npts))
+        for i, asig in enumerate(asigs):
+            acc[i, :asig.npts] = asig.values
+        fa = np.fft.rfft(acc, n=n_fft)
+        omega = 2 * np.pi * np.fft.rfftfreq(n_fft, d=dt)
+
+        g_mod = np.tile(self.g_mod0, (len(asigs), 1))
+        xi = np.tile(self.xi0, (len(asigs), 1))
+        self.n_iters = np.zeros(len(asigs), dtype=int)
+        if eql and np.any(self.nonlinear):
+            inds = np.where(self.nonlinear)[0]
+            active = np.ones(len(asigs), dtype=bool)  # motions that have not converged
+            for i in range(n_iter):
+                ms = np.where(active)[0]
+                if not len(ms):
+                    break
+                acc_tfs, strain_tfs, g_star = self.calc_tfs(omega, g_mod[ms], xi[ms], acc=False)
+                strains = np.fft.irfft(fa[ms, np.newaxis] * strain_tfs[:, inds], n=n_fft)[:, :, :npts]
+                strain_eff = strain_ratio * np.max(np.abs(strains), axis=-1)
+                g_mod_red, xi_new = calc_mod_hyp_g_mod_red_and_xi(strain_eff, self.strain_ref[inds],
+                                                                 self.strain_curvature[inds], self.xi0[inds])
+                g_mod_new = self.g_mod0[inds] * g_mod_red
+                err = np.maximum(np.max(np.abs(g_mod_new - g_mod[np.ix_(ms, inds)]) / g_mod_new, axis=1),
+                                 np.max(np.abs(xi_new - xi[np.ix_(ms, inds)]) / xi_new, axis=1))
+                g_mod[np.ix_(ms, inds)] = g_mod_new
+                xi[np.ix_(ms, inds)] = xi_new
+                self.n_iters[ms] += 1
+                active[ms[err < tol]] = False
+        self.g_mod = g_mod
+        self.xi = xi
+
+        acc_tfs, strain_tfs, g_star = self.calc_tfs(omega, g_mod, xi, acc='ACCX' in outs)
+        strains = np.fft.irfft(fa[:, np.newaxis] * strain_tfs, n=n_fft)[:, :, :npts]
+        self.max_strain = np.max(np.abs(strains), axis=-1)
+        od = {}
+        for otype in outs:
+            if otype == 'ACCX':
+                vals = np.fft.irfft(fa[:, np.newaxis] * acc_tfs, n=n_fft)[:, :, :npts]
+                depths = self.node_depths
+            elif otype == 'STRS':
+                vals = strains
+                depths = self.ele_depths
+            elif otype == 'TAU':
+                vals = np.fft.irfft(fa[:, np.newaxis] * strain_tfs * g_star[:, :, np.newaxis], n=n_fft)[:, :, :npts]
+                vals /= 1e3
+                depths = self.ele_depths
+            else:
+                raise ValueError(f'output type: {otype} not supported')
+            if not (isinstance(outs[otype], str) and outs[otype] == 'all'):
+                inds = [np.argmin(abs(abs(depths) - abs(depth))) for depth in outs[otype]]
+                vals = vals[:, inds]
+            od[otype] = vals[0] if single else vals
+        od['time'] = np.arange(npts) * dt
+        self.out_dict = od
+
+
+def run_fd_sra(sp, asigs, dy=0.5, base_imp=0, xi=0.03, outs=None, eql=True, n_iter=15, strain_ratio=0.65, tol=0.01):
+    """
+    Runs a frequency domain (linear or equivalent linear) site response analysis of a suite of motions
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+    asigs: eqsig.AccSignal object or list of eqsig.AccSignal objects
+    dy: float
+        Target thickness of the sub-layers
+    base_imp: float
+        If positive then use as impedence at base of model,
+        If zero then use last soil layer
+        If negative then use fixed base
+    xi: float
+        Damping ratio of soils that do not have `xi` set
+    outs: dict
+    eql: bool
+        If True then run an equivalent linear analysis, otherwise linear
+    n_iter: int
+    strain_ratio: float
+    tol: float
+
+    Returns
+    -------
+    FDSRA1D object
+    """
+    fd_sra = FDSRA1D(sp, dy=dy, base_imp=base_imp, xi=xi)
+    fd_sra.execute(asigs, outs=outs, eql=eql, n_iter=n_iter, strain_ratio=strain_ratio, tol=tol)
+    return fd_sra
@@ -1,14 +1,279 @@
 import os
+import json
+import struct
+import zipfile
 
 import numpy as np
 import o3seespy as o3
 
+from o3soil.generic import get_recorder_output_ind
+
 ecp2o3_type_dict = {'TAU': ['stress', 'sxy'],
                     'ESIGY': ['stress', 'syy'],
                     'ESIGX': ['stress', 'sxx'],
                     'STRS': ['strain', 'gxy']}
 
 
+def load_binary_recorder(fname, n_cols=None, n_rows=None):
+    """
+    Memory-maps the output of a recorder that was written with the `-binary` option
+
+    Each record is written as `n_cols` doubles followed by a newline character.
+
+    Parameters
+    ----------
+    fname: str
+        Full file path
+    n_cols: int
+        Number of values per record, if None then inferred from `n_rows`
+    n_rows: int
+        Number of records (only required if `n_cols` is None)
+
+    Returns
+    -------
+    array_like (n_rows, n_cols)
+        Read-only view of the file
+    """
+    size = os.path.getsize(fname)
+    if n_cols is None:
+        if n_rows is None:
+            raise ValueError('n_cols or n_rows must be set')
+        if n_rows == 0:
+            return np.zeros((0, 0))
+        n_cols = (size // n_rows - 1) // 8
+    row_dtype = np.dtype([('vals', np.float64, (n_cols,)), ('nl', 'S1')])
+    if size < row_dtype.itemsize:
+        return np.zeros((0, n_cols))
+    return np.memmap(fname, dtype=row_dtype, mode='r', shape=(size // row_dtype.itemsize,))['vals']
+
+
+def get_index_slice(inds):
+    """Slice equivalent to the indices if they are evenly spaced and increasing, otherwise the indices"""
+    inds = np.asarray(inds, dtype=int)
+    if len(inds) == 1:
+        return slice(inds[0], inds[0] + 1)
+    step = inds[1] - inds[0] if len(inds) else 0
+    if step > 0 and np.all(np.diff(inds) == step):
+        return slice(inds[0], inds[-1] + 1, step)
+    return inds
+
+
+PARAMS_KEY = '__params__'
+CACHE_FMTS = ['npz', 'npz_uncompressed', 'txt']
+
+
+def _to_json(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def save_results_to_npz(ffp, od, params=None, compress=True):
+    """
+    Saves the results of a run to a single `.npz` container
+
+    Parameters
+    ----------
+    ffp: str
+        Full file path
+    od: dict
+        Output arrays
+    params: dict
+        Analysis parameters, stored as json
+    compress: bool
+        If True then the arrays are compressed, otherwise they are stored so that they can be memory-mapped
+    """
+    arrays = {item: np.asarray(od[item]) for item in od}
+    if params is not None:
+        arrays[PARAMS_KEY] = np.array(json.dumps(params, default=_to_json))
+    if compress:
+        np.savez_compressed(ffp, **arrays)
+    else:
+        np.savez(ffp, **arrays)
+
+
+class NpzResults(object):
+    """
+    Lazily loaded results of a run saved with `save_results_to_npz`
+
+    Each quantity is only read when it is first accessed, and if it was stored uncompressed (and `mmap`) then
+    it is memory-mapped rather than read.
+
+    Parameters
+    ----------
+    ffp: str
+        Full file path
+    mmap: bool
+        If True then uncompressed quantities are memory-mapped
+    """
+
+    def __init__(self, ffp, mmap=True):
+        self.ffp = ffp
+        self.mmap = mmap
+        with zipfile.ZipFile(ffp) as zf:
+            self._infos = {info.filename[:-4]: info for info in zf.infolist()}
+        self._cache = {}
+        if PARAMS_KEY in self._infos:
+            self.params = json.loads(str(self._read(PARAMS_KEY)))
+        else:
+            self.params = {}
+
+    def keys(self):
+        return [item for item in self._infos if item != PARAMS_KEY]
+
+    def __contains__(self, item):
+        return item in self.keys()
+
+    def __getitem__(self, item):
+        if item not in self:
+            raise KeyError(item)
+        if item not in self._cache:
+            self._cache[item] = self._read(item)
+        return self._cache[item]
+
+    def _read_header(self, f):
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            return np.lib.format.read_array_header_1_0(f)
+        return np.lib.format.read_array_header_2_0(f)
+
+    def get_shape_and_dtype(self, item):
+        """Shape and dtype of a quantity (without loading it)"""
+        with zipfile.ZipFile(self.ffp) as zf, zf.open(self._infos[item]) as f:
+            shape, fortran_order, dtype = self._read_header(f)
+        return shape, dtype
+
+    def _read(self, item):
+        info = self._infos[item]
+        if self.mmap and info.compress_type == zipfile.ZIP_STORED:
+            with open(self.ffp, 'rb') as f:
+                f.seek(info.header_offset)
+                n_name, n_extra = struct.unpack('<2H', f.read(30)[26:])
+                f.seek(info.header_offset + 30 + n_name + n_extra)
+                shape, fortran_order, dtype = self._read_header(f)
+                offset = f.tell()
+            if not dtype.hasobject and len(shape) and np.prod(shape):
+                return np.memmap(self.ffp, dtype=dtype, mode='r', shape=shape, offset=offset,
+                                 order='F' if fortran_order else 'C')
+        with zipfile.ZipFile(self.ffp) as zf, zf.open(info) as f:
+            return np.lib.format.read_array(f)
+
+
+class RecorderToBinaryBase(o3.recorder.RecorderBase):
+    fname = None
+    n_cols = None
+
+    def collect(self, unlink=False, n_rows=None):
+        """Memory-mapped array of the recorded values (the file is kept, `unlink` is ignored)"""
+        return load_binary_recorder(self.fname, self.n_cols, n_rows=n_rows)
+
+
+class NodesToBinary(RecorderToBinaryBase):
+    op_type = "Node"
+
+    def __init__(self, osi, fname, nodes, dofs, res_type, dt=None):
+        """
+        Records properties of several nodes in binary and streams them to a file
+
+        Parameters
+        ----------
+        osi: o3seespy.OpenSeesInstance
+        fname: str
+            Full file path
+        nodes: list
+            A list of o3seespy.node.Node objects
+        dofs: list
+            A list of integers representing the degrees-of-freedom
+        res_type: str
+            Response type
+        dt: float
+            Time step
+        """
+        self.osi = osi
+        self.fname = fname
+        node_tags = [x.tag for x in nodes]
+        self.n_cols = len(node_tags) * len(dofs)
+        self._parameters = [self.op_type, '-binary', self.fname, '-node', *node_tags, '-dof', *dofs, res_type]
+        if dt is not None:
+            self._parameters.insert(3, '-dT')
+            self._parameters.insert(4, dt)
+        self._tag = self.to_process(osi)
+
+
+class ElementsToBinary(RecorderToBinaryBase):
+    op_type = "Element"
+
+    def __init__(self, osi, fname, eles, arg_vals, dt=None):
+        """
+        Records the response of several elements in binary and streams them to a file
+
+        The number of values per record depends on the element and material, so `n_rows` must be passed
+        to `collect`.
+        """
+        self.osi = osi
+        self.fname = fname
+        self.ele_tags = [x.tag for x in eles]
+        self._parameters = [self.op_type, '-binary', self.fname, '-ele', *self.ele_tags, *arg_vals]
+        if dt is not None:
+            self._parameters.insert(3, '-dT')
+            self._parameters.insert(4, dt)
+        self._tag = self.to_process(osi)
+
+
+class TimeToBinary(RecorderToBinaryBase):
+    op_type = "Node"
+    n_cols = 2
+
+    def __init__(self, osi, fname, dt=None, dummy_node_tag=1):
+        """Records the recorder time in binary and streams it to a file"""
+        self.osi = osi
+        self.fname = fname
+        self._parameters = [self.op_type, '-binary', self.fname, '-time', '-node', dummy_node_tag, '-dof', 1, 'accel']
+        if dt is not None:
+            self._parameters.insert(3, '-dT')
+            self._parameters.insert(4, dt)
+        self._tag = self.to_process(osi)
+
+    def collect(self, unlink=False, n_rows=None):
+        return load_binary_recorder(self.fname, self.n_cols)[:, 0]
+
+
+class SummaryStats(object):
+    """
+    Running summary statistics of a set of time series, updated one sample at a time
+
+    Parameters
+    ----------
+    n_locs: int
+        Number of time series (locations)
+    """
+
+    def __init__(self, n_locs):
+        self.n_samples = 0
+        self.max = np.full(n_locs, -np.inf)
+        self.min = np.full(n_locs, np.inf)
+        self.peak = np.zeros(n_locs)
+        self.peak_time = np.zeros(n_locs)
+        self.sum_sqr = np.zeros(n_locs)
+
+    def add(self, vals, time):
+        vals = np.asarray(vals, dtype=float)
+        self.max = np.maximum(self.max, vals)
+        self.min = np.minimum(self.min, vals)
+        is_peak = np.abs(vals) > self.peak
+        self.peak = np.where(is_peak, np.abs(vals), self.peak)
+        self.peak_time = np.where(is_peak, time, self.peak_time)
+        self.sum_sqr += vals ** 2
+        self.n_samples += 1
+
+    @property
+    def rms(self):
+        return np.sqrt(self.sum_sqr / max(self.n_samples, 1))
+
+    def to_dict(self):
+        return {'max': self.max, 'min': self.min, 'peak': self.peak, 'peak_time': self.peak_time, 'rms': self.rms}
+
+
 class O3SRAOutputs(object):
     cache_path = ''
     out_dict = None
@@ -16,8 +281,38 @@ class O3SRAOutputs(object):
     outs = None
     results_collected = False
 
-    def start_recorders(self, osi, outs, sn, eles, rec_dt, sn_xy=False):
+    stream = False
+    stream_path = None
+    summary = False
+    node_dofs = {'ACCX': ([o3.cc.DOF2D_X], 'accel'), 'DISPX': ([o3.cc.DOF2D_X], 'disp'),
+                 'PP': ([o3.cc.DOF2D_PP], 'vel')}
+
+    def start_recorders(self, osi, outs, sn, eles, rec_dt, sn_xy=False, stream=False, stream_path=None,
+                        summary=False):
+        """
+        Element outputs at a list of depths only record the elements nearest to the depths, and outputs of the same
+        element response (e.g. 'TAU' and 'ESIGY' of 'stress') at the same depths share a recorder. All the
+        components of the response are recorded, since the OpenSees element recorder can not reliably select one.
+
+        Parameters
+        ----------
+        stream: bool
+            If True, then the recorders write binary files (in `stream_path`) during the analysis, and the
+            arrays of `results_to_dict` are memory-mapped to them, rather than held in memory
+        stream_path: str
+            Folder of the binary files (required if `stream`), which are kept after the analysis
+        summary: bool
+            If True, then no recorders are created, instead `update` must be called at each recorder time
+            and the running summary statistics of each output are collected (see `results_to_dict`)
+        """
         self.rec_dt = rec_dt
+        self.osi = osi
+        self.summary = summary
+        self.stream = stream
+        if stream:
+            if not stream_path:
+                raise ValueError('stream_path must be set to stream the outputs (e.g. the cache_path of the analysis)')
+            self.stream_path = stream_path
         self.eles = eles
         self.sn_xy = sn_xy
         if sn_xy:
@@ -31,25 +326,22 @@ class O3SRAOutputs(object):
         ele_depths = (node_depths[1:] + node_depths[:-1]) / 2
         rd = {}
         srd = {}
+        self.rec_eles = {}  # recorder key and elements of each element output
+        sel_keys = {}  # recorder key of each (recorder name, selected elements), shared by the element outputs
+        if summary:
+            self._start_summary(outs, sn, eles, node_depths, ele_depths)
+            self.rd = rd
+            self.srd = srd
+            return
         for otype in outs:
-            if otype in ['ACCX', 'DISPX', 'PP']:
+            if otype in self.node_dofs:
+                dofs, res_type = self.node_dofs[otype]
                 if isinstance(outs[otype], str) and outs[otype] == 'all':
-
-                    if otype == 'ACCX':
-                        rd['ACCX'] = o3.recorder.NodesToArrayCache(osi, nodes=self.nodes, dofs=[o3.cc.DOF2D_X], res_type='accel',
-                                                                dt=rec_dt)
-                    if otype == 'DISPX':
-                        rd['DISPX'] = o3.recorder.NodesToArrayCache(osi, nodes=self.nodes, dofs=[o3.cc.DOF2D_X], res_type='disp',
-                                                                dt=rec_dt)
-                    if otype == 'PP':
-                        rd['PP'] = o3.recorder.NodesToArrayCache(osi, nodes=self.nodes, dofs=[o3.cc.DOF2D_PP], res_type='vel',
-                                                                dt=rec_dt)
+                    nodes = self.nodes
                 else:
-                    rd['ACCX'] = []
-                    for i in range(len(outs['ACCX'])):
-                        ind = np.argmin(abs(node_depths - outs['ACCX'][i]))
-                        rd['ACCX'].append(
-                            o3.recorder.NodeToArrayCache(osi, node=sn[ind][0], dofs=[o3.cc.X], res_type='accel', dt=rec_dt))
+                    inds = [np.argmin(abs(abs(node_depths) - abs(depth))) for depth in outs[otype]]
+                    nodes = sn[inds, 0]
+                rd[otype] = self._nodes_recorder(osi, otype, nodes, dofs, res_type, rec_dt)
             if otype in ecp2o3_type_dict:
                 rname = ecp2o3_type_dict[otype][0]  # recorder name
                 for ele in eles:
@@ -57,22 +349,18 @@ class O3SRAOutputs(object):
 
                 if isinstance(outs[otype], str) and outs[otype] == 'all':
                     if rname not in srd:
-                        srd[rname] = o3.recorder.ElementsToArrayCache(osi, eles=eles, arg_vals=[rname], dt=rec_dt)
-                else:
-                    raise ValueError('Currently not supported')
-                    # rd['STRESS'] = []
-                    # for i in range(len(outs['TAU'])):
-                    #     ind = np.argmin(abs(ele_depths - outs['TAU'][i]))
-                    #     rd['STRESS'].append(o3.recorder.ElementToArrayCache(osi, ele=eles[ind], arg_vals=['stress'], dt=rec_dt))
-            # if otype == 'ESIGY':
-            #     if isinstance(outs['TAU'], str) and outs['TAU'] == 'all':
-            #         if 'stress' not in srd:
-            #             srd['stress'] = o3.recorder.ElementsToArrayCache(osi, eles=eles, arg_vals=['stress'], dt=rec_dt)
+                        srd[rname] = self._eles_recorder(osi, rname, eles, rname, rec_dt)
+                    self.rec_eles[otype] = (rname, eles)
+                else:  # only record the elements nearest to the requested depths
+                    inds = tuple(int(np.argmin(abs(abs(ele_depths) - abs(depth)))) for depth in outs[otype])
+                    sel_eles = [eles[ind] for ind in inds]
+                    if (rname, inds) not in sel_keys:
+                        sel_keys[(rname, inds)] = otype
+                        srd[otype] = self._eles_recorder(osi, otype, sel_eles, rname, rec_dt)
+                    self.rec_eles[otype] = (sel_keys[(rname, inds)], sel_eles)
             if otype == 'TAUX':
                 if isinstance(outs['TAUX'], str) and outs['TAUX'] == 'all':
-                    rd['TAUX'] = o3.recorder.NodesToArrayCache(osi, nodes=sn.flatten(f_order), dofs=[o3.cc.X],
-                                                               res_type='reaction',
-                                                               dt=rec_dt)
+                    rd['TAUX'] = self._nodes_recorder(osi, 'TAUX', sn.flatten(f_order), [o3.cc.X], 'reaction', rec_dt)
             if otype == 'STRSX':
                 if isinstance(outs['STRSX'], str) and outs['STRSX'] == 'all':
                     if 'DISPX' in outs:
@@ -81,24 +369,123 @@ class O3SRAOutputs(object):
                         nodes = sn[0, :]
                     else:
                         nodes = sn[:, 0]
-                    rd['DISPX'] = o3.recorder.NodesToArrayCache(osi, nodes=nodes, dofs=[o3.cc.X], res_type='disp',
-                                                                dt=rec_dt)
-        rd['TIME'] = o3.recorder.TimeToArrayCache(osi, dt=rec_dt)
+                    rd['DISPX'] = self._nodes_recorder(osi, 'DISPX', nodes, [o3.cc.X], 'disp', rec_dt)
+        if self.stream:
+            rd['TIME'] = TimeToBinary(osi, self._stream_fname('TIME'), dt=rec_dt)
+        else:
+            rd['TIME'] = o3.recorder.TimeToArrayCache(osi, dt=rec_dt)
         self.rd = rd
         self.srd = srd
 
-    def results_to_files(self):
+    def _start_summary(self, outs, sn, eles, node_depths, ele_depths):
+        self.summary_locs = {}
+        self.summary_stats = {}
+        self.summary_depths = {}
+        for otype in outs:
+            if otype in self.node_dofs:
+                depths = node_depths
+            elif otype in ecp2o3_type_dict:
+                depths = ele_depths
+            else:
+                raise ValueError(f'output type: {otype} not supported in summary outputs')
+            if isinstance(outs[otype], str) and outs[otype] == 'all':
+                inds = np.arange(len(depths))
+            else:
+                inds = np.array([np.argmin(abs(abs(depths) - abs(depth))) for depth in outs[otype]], dtype=int)
+            if otype in self.node_dofs:
+                self.summary_locs[otype] = list(sn[inds, 0])
+            else:
+                rname, ostr = ecp2o3_type_dict[otype]
+                self.summary_locs[otype] = [(eles[ind], get_recorder_output_ind(eles[ind].mat.type, rname, ostr)[0])
+                                            for ind in inds]
+            self.summary_stats[otype] = SummaryStats(len(inds))
+            self.summary_depths[otype] = depths[inds]
+
+    def update(self, time):
+        """Adds the current response to the summary statistics (only at multiples of `rec_dt`)"""
+        if abs(time - np.round(time / self.rec_dt) * self.rec_dt) > 1.0e-6 * self.rec_dt:
+            return
+        node_getters = {'accel': o3.get_node_accel, 'disp': o3.get_node_disp, 'vel': o3.get_node_vel}
+        for otype in self.summary_stats:
+            if otype in self.node_dofs:
+                dofs, res_type = self.node_dofs[otype]
+                getter = node_getters[res_type]
+                vals = [getter(self.osi, node, dofs[0]) for node in self.summary_locs[otype]]
+            else:
+                rname = ecp2o3_type_dict[otype][0]
+                vals = [o3.get_ele_response(self.osi, ele, rname)[ind] for ele, ind in self.summary_locs[otype]]
+            self.summary_stats[otype].add(vals, time)
+
+    def summary_to_dict(self, grav=9.81):
+        """
+        Summary statistics of each output, with keys `<output>_<stat>` for the stats 'max', 'min', 'peak'
+        (absolute maximum), 'peak_time', 'rms' and 'depth' (of each location), and 'ACCX_arias' (Arias intensity)
+        """
+        od = {}
+        for otype in self.summary_stats:
+            stats = self.summary_stats[otype]
+            sd = stats.to_dict()
+            for stat in sd:
+                od[f'{otype}_{stat}'] = sd[stat]
+            od[f'{otype}_depth'] = self.summary_depths[otype]
+            if otype == 'ACCX':
+                od['ACCX_arias'] = np.pi / (2 * grav) * stats.sum_sqr * self.rec_dt
+        return od
+
+    def _stream_fname(self, name):
+        return os.path.join(self.stream_path, f'{name}.bin')
+
+    def _eles_recorder(self, osi, name, eles, rname, rec_dt):
+        if self.stream:
+            return ElementsToBinary(osi, self._stream_fname(name), eles, [rname], dt=rec_dt)
+        return o3.recorder.ElementsToArrayCache(osi, eles=eles, arg_vals=[rname], dt=rec_dt)
+
+    def _nodes_recorder(self, osi, name, nodes, dofs, res_type, rec_dt):
+        if self.stream:
+            return NodesToBinary(osi, self._stream_fname(name), nodes, dofs, res_type, dt=rec_dt)
+        return o3.recorder.NodesToArrayCache(osi, nodes=nodes, dofs=dofs, res_type=res_type, dt=rec_dt)
+
+    def results_to_files(self, fmt='npz', params=None):
+        """
+        Saves the results to `cache_path`
+
+        Parameters
+        ----------
+        fmt: str
+            'npz' (a compressed `results.npz`), 'npz_uncompressed' (a `results.npz` that can be memory-mapped),
+            or 'txt' (a text file per quantity)
+        params: dict
+            Analysis parameters that are stored with the results (not stored if `fmt='txt'`)
+        """
+        if fmt not in CACHE_FMTS:
+            raise ValueError(f'fmt must be one of {CACHE_FMTS}')
         if not self.results_collected:
             od = self.results_to_dict()
         else:
             od = self.out_dict
-        for item in od:
-            ffp = self.cache_path + f'{item}.txt'
-            if os.path.exists(ffp):
-                os.remove(ffp)
-            np.savetxt(ffp, od[item])
+        if fmt == 'txt':
+            for item in od:
+                ffp = self.cache_path + f'{item}.txt'
+                if os.path.exists(ffp):
+                    os.remove(ffp)
+                np.savetxt(ffp, od[item])
+        else:
+            save_results_to_npz(self.cache_path + 'results.npz', od, params=params, compress=fmt == 'npz')
 
-    def load_results_from_files(self, outs=None):
+    def load_results_from_files(self, outs=None, mmap=True):
+        """
+        Loads the results from `cache_path`, from `results.npz` if it exists otherwise from the text files
+
+        Quantities stored uncompressed are memory-mapped if `mmap`.
+        """
+        npz_ffp = self.cache_path + 'results.npz'
+        if os.path.exists(npz_ffp):
+            res = NpzResults(npz_ffp, mmap=mmap)
+            if outs is None:
+                outs = res.keys()
+            elif 'time' in res and 'time' not in outs:
+                outs = list(outs) + ['time']
+            return {item: res[item] for item in outs}
         if outs is None:
             outs = ['ACCX', 'TAU', 'STRS', 'time']
         else:
@@ -112,9 +499,10 @@ class O3SRAOutputs(object):
 
     def results_to_dict(self):
         self.results_collected = True
-        ro = o3.recorder.load_recorder_options()
-        import pandas as pd
-        df = pd.read_csv(ro)
+        if self.summary:
+            if self.out_dict is None:
+                self.out_dict = self.summary_to_dict()
+            return self.out_dict
         if self.outs is None:
             raise ValueError('outs is None')
             # items = list(self.rd)
@@ -123,8 +511,12 @@ class O3SRAOutputs(object):
 
         if self.out_dict is None:
             self.out_dict = {}
+            n_rows = len(self.rd['TIME'].collect(unlink=False)) if self.stream else None
             for item in self.srd:
-                self.srd[item] = self.srd[item].collect().T
+                if self.stream:
+                    self.srd[item] = self.srd[item].collect(n_rows=n_rows).T
+                else:
+                    self.srd[item] = self.srd[item].collect().T
             for otype in items:
                 if otype in self.rd:
                     vals = self.rd[otype].collect().T
@@ -141,20 +533,15 @@ class O3SRAOutputs(object):
                     if otype in ecp2o3_type_dict:
                         rname = ecp2o3_type_dict[otype][0]
                         ostr = ecp2o3_type_dict[otype][1]
-                        dfe = df[df['recorder'] == rname]
-                        vals = self.srd[rname]
+                        key, rec_eles = self.rec_eles[otype]
+                        vals = self.srd[key]
                         cur_ind = 0
-                        self.out_dict[otype] = []
-                        for ele in self.eles:
-                            mat_type = ele.mat.type
-                            form = 'PlaneStrain'
-                            dfm = dfe[(dfe['mat'] == mat_type) & (dfe['form'] == form)]
-                            assert len(dfm) == 1, len(dfm)
-                            outs = dfm['outs'].iloc[0].split('-')
-                            oind = outs.index(ostr)
-                            self.out_dict[otype].append(vals[cur_ind + oind])
-                            cur_ind += len(outs)
-                        self.out_dict[otype] = np.array(self.out_dict[otype])
+                        inds = np.zeros(len(rec_eles), dtype=int)
+                        for i, ele in enumerate(rec_eles):
+                            oind, n_outs = get_recorder_output_ind(ele.mat.type, rname, ostr)
+                            inds[i] = cur_ind + oind
+                            cur_ind += n_outs
+                        self.out_dict[otype] = vals[get_index_slice(inds)]  # a view of a streamed output
                     if otype == 'STRSX':
                         depths = []
                         for node in self.nodes:
@@ -0,0 +1,225 @@
+import functools
+
+import numpy as np
+
+DEFAULT_SMOOTH_FREQS = tuple(np.logspace(np.log10(0.1), np.log10(30.), 50))
+
+
+def _nigam_jennings_coeffs(periods, xi, dt):
+    """Coefficients of the exact recurrence of a linear SDOF under a piecewise linear ground acceleration"""
+    w = 2 * np.pi / np.asarray(periods, dtype=float)
+    sq = np.sqrt(1 - xi ** 2)
+    wd = w * sq
+    e = np.exp(-xi * w * dt)
+    s = np.sin(wd * dt)
+    c = np.cos(wd * dt)
+    t1 = (2 * xi ** 2 - 1) / (w ** 2 * dt)
+    t2 = 2 * xi / (w ** 3 * dt)
+    a11 = e * (xi / sq * s + c)
+    a12 = e / wd * s
+    a21 = -w / sq * e * s
+    a22 = e * (c - xi / sq * s)
+    b11 = e * ((t1 + xi / w) * s / wd + (t2 + 1 / w ** 2) * c) - t2
+    b12 = -e * (t1 * s / wd + t2 * c) - 1 / w ** 2 + t2
+    b21 = e * ((t1 + xi / w) * (c - xi / sq * s) - (t2 + 1 / w ** 2) * (wd * s + xi * w * c)) + 1 / (w ** 2 * dt)
+    b22 = -e * (t1 * (c - xi / sq * s) - t2 * (wd * s + xi * w * c)) - 1 / (w ** 2 * dt)
+    return w, (a11, a12, a21, a22), (b11, b12, b21, b22)
+
+
+def calc_response_spectra(acc, dt, periods, xi=0.05):
+    """
+    Response spectra of many acceleration time series in one vectorised pass
+
+    Uses the Nigam and Jennings (1969) recurrence, which is exact for a piecewise linear input, stepped
+    through time once for all the signals and periods at the same time.
+
+    Parameters
+    ----------
+    acc: array_like
+        Acceleration time series, the last axis is time (e.g. the (n_depths, n_times) `ACCX` output, or
+        (n_runs, n_depths, n_times) for several runs)
+    dt: float
+        Time step of the time series
+    periods: array_like
+        Natural periods of the SDOFs (must be greater than zero)
+    xi: float
+        Damping ratio
+
+    Returns
+    -------
+    s_d: array_like
+        Spectral (relative) displacement, shape (acc.shape[:-1], n_periods)
+    s_v: array_like
+        Spectral (relative) velocity
+    s_a: array_like
+        Spectral total acceleration
+    """
+    acc = np.asarray(acc, dtype=float)
+    periods = np.atleast_1d(np.asarray(periods, dtype=float))
+    if np.any(periods <= 0):
+        raise ValueError('periods must be greater than zero')
+    lead_shape = acc.shape[:-1]
+    acc = acc.reshape((-1, acc.shape[-1]))
+    w, (a11, a12, a21, a22), (b11, b12, b21, b22) = _nigam_jennings_coeffs(periods, xi, dt)
+    k_v = 2 * xi * w
+    k_u = w ** 2
+    u = np.zeros((len(acc), len(periods)))
+    v = np.zeros_like(u)
+    s_d = np.zeros_like(u)
+    s_v = np.zeros_like(u)
+    s_a = np.zeros_like(u)
+    for i in range(acc.shape[1] - 1):
+        a0 = acc[:, i:i + 1]
+        a1 = acc[:, i + 1:i + 2]
+        u, v = a11 * u + a12 * v + b11 * a0 + b12 * a1, a21 * u + a22 * v + b21 * a0 + b22 * a1
+        np.maximum(s_d, np.abs(u), out=s_d)
+        np.maximum(s_v, np.abs(v), out=s_v)
+        np.maximum(s_a, np.abs(k_v * v + k_u * u), out=s_a)
+    out_shape = lead_shape + (len(periods),)
+    return s_d.reshape(out_shape), s_v.reshape(out_shape), s_a.reshape(out_shape)
+
+
+def calc_response_spectra_from_results(out_dicts, periods, xi=0.05, otype='ACCX', dt=None):
+    """
+    Response spectra at every recorded depth of one or several analyses (see `O3SRAOutputs.results_to_dict`)
+
+    Runs with the same output shape are stacked and computed in a single pass.
+
+    Parameters
+    ----------
+    out_dicts: dict or list of dict
+        Results of an analysis (`out_dict` or `NpzResults`), or a list of them
+    periods: array_like
+        Natural periods of the SDOFs
+    xi: float
+        Damping ratio
+    otype: str
+        Output type of the accelerations
+    dt: float
+        Time step of the outputs, if None then taken from `time`
+
+    Returns
+    -------
+    s_d, s_v, s_a: array_like
+        Spectra of shape (n_depths, n_periods), or (n_runs, n_depths, n_periods) for a list of runs with
+        the same shape (otherwise lists of arrays)
+    """
+    single = not isinstance(out_dicts, (list, tuple))
+    if single:
+        out_dicts = [out_dicts]
+    accs = [np.asarray(od[otype]) for od in out_dicts]
+    dts = [dt if dt is not None else od['time'][1] - od['time'][0] for od in out_dicts]
+    if single:
+        return calc_response_spectra(accs[0], dts[0], periods, xi=xi)
+    if len(set(acc.shape for acc in accs)) == 1 and np.allclose(dts, dts[0]):
+        return calc_response_spectra(np.array(accs), dts[0], periods, xi=xi)
+    spectra = [calc_response_spectra(acc, dts[i], periods, xi=xi) for i, acc in enumerate(accs)]
+    return tuple(list(resp) for resp in zip(*spectra))
+
+
+@functools.lru_cache(maxsize=32)
+def get_konno_ohmachi_matrix(n_fft, dt, smooth_freqs=DEFAULT_SMOOTH_FREQS, band=40):
+    """
+    Konno and Ohmachi (1998) smoothing matrix from the rFFT frequencies to the smoothing frequencies
+
+    Rows are normalised so that the smoothed spectrum is `matrix @ abs(fa)`. The matrix only depends on the
+    frequency grid, so it is cached and shared (read-only) between calls.
+
+    Parameters
+    ----------
+    n_fft: int
+        Number of points of the FFT
+    dt: float
+        Time step of the signals
+    smooth_freqs: tuple
+        Centre frequencies of the smoothed spectrum
+    band: float
+        Bandwidth coefficient
+
+    Returns
+    -------
+    array_like
+        Shape (len(smooth_freqs), n_fft // 2 + 1)
+    """
+    freqs = np.fft.rfftfreq(n_fft, dt)
+    fc = np.array(smooth_freqs, dtype=float)[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = band * np.log10(freqs[np.newaxis, 1:] / fc)
+        weights = (np.sin(x) / x) ** 4
+    weights[x == 0] = 1.0
+    mat = np.zeros((len(fc), len(freqs)))
+    mat[:, 1:] = weights  # the zero frequency is excluded
+    mat /= np.sum(mat, axis=1)[:, np.newaxis]
+    mat.flags.writeable = False
+    return mat
+
+
+def calc_smooth_fa_spectra(acc, dt, smooth_freqs=DEFAULT_SMOOTH_FREQS, band=40, n_fft=None):
+    """
+    Konno-Ohmachi smoothed Fourier amplitude spectra of many time series, with a single rFFT
+
+    Parameters
+    ----------
+    acc: array_like
+        Time series, the last axis is time
+    dt: float
+        Time step of the time series
+    smooth_freqs: array_like
+        Centre frequencies of the smoothed spectra
+    band: float
+        Bandwidth coefficient of the Konno-Ohmachi window
+    n_fft: int
+        Number of points of the FFT, if None then the next power of two of the number of time steps
+
+    Returns
+    -------
+    array_like
+        Smoothed Fourier amplitudes, shape (acc.shape[:-1], len(smooth_freqs))
+    """
+    acc = np.asarray(acc, dtype=float)
+    if n_fft is None:
+        n_fft = 2 ** int(np.ceil(np.log2(acc.shape[-1])))
+    fa = np.abs(np.fft.rfft(acc, n=n_fft, axis=-1)) * dt
+    mat = get_konno_ohmachi_matrix(int(n_fft), float(dt), tuple(np.atleast_1d(smooth_freqs)), band)
+    return fa @ mat.T
+
+
+def calc_transfer_functions(acc, dt, asig=None, smooth_freqs=DEFAULT_SMOOTH_FREQS, band=40):
+    """
+    Smoothed transfer functions between every pair of recorded depths (and the input motion)
+
+    Parameters
+    ----------
+    acc: array_like
+        Accelerations at the recorded depths, (n_depths, n_times) (e.g. the `ACCX` output), or
+        (n_runs, n_depths, n_times) for several runs
+    dt: float
+        Time step of the accelerations
+    asig: eqsig.AccSignal object or list
+        The input motion (or one per run), appended as the last location
+    smooth_freqs: array_like
+        Centre frequencies of the smoothed spectra
+    band: float
+        Bandwidth coefficient of the Konno-Ohmachi window
+
+    Returns
+    -------
+    smooth_freqs: array_like
+    trans_funcs: array_like
+        Ratio of the smoothed Fourier amplitudes `[..., i, j, :] = fa[i] / fa[j]`, with shape
+        (..., n_locs, n_locs, len(smooth_freqs)), where the input motion (if given) is the last location,
+        so `[..., 0, -1, :]` is the amplification of the first depth relative to the input motion
+    """
+    smooth_freqs = tuple(np.atleast_1d(smooth_freqs))
+    sfas = calc_smooth_fa_spectra(acc, dt, smooth_freqs=smooth_freqs, band=band)
+    if asig is not None:
+        asigs = asig if isinstance(asig, (list, tuple)) else [asig]
+        in_sfas = np.array([calc_smooth_fa_spectra(a.values, a.dt, smooth_freqs=smooth_freqs, band=band)
+                            for a in asigs])
+        if not isinstance(asig, (list, tuple)):
+            in_sfas = in_sfas[0]
+        in_sfas = np.broadcast_to(in_sfas[..., np.newaxis, :], sfas.shape[:-2] + (1, len(smooth_freqs)))
+        sfas = np.concatenate([sfas, in_sfas], axis=-2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trans_funcs = sfas[..., :, np.newaxis, :] / sfas[..., np.newaxis, :, :]
+    return np.array(smooth_freqs), trans_funcs
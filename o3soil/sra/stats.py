@@ -0,0 +1,93 @@
+import json
+import time
+import functools
+import contextlib
+
+import numpy as np
+
+
+class SRAStats(object):
+    """
+    Wall-clock time of each phase and the time step statistics of a site response analysis
+
+    The phases are 'build', 'static', 'loads', 'dynamic' (the time stepping) and 'collect'
+    (the collection of the outputs).
+    """
+
+    def __init__(self):
+        self.phase_times = {}
+        self.step_history = None
+
+    @contextlib.contextmanager
+    def time_phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + time.perf_counter() - t0
+
+    @property
+    def n_steps(self):
+        """Number of successful time steps"""
+        return int(np.sum(self.step_history['n_steps']))
+
+    @property
+    def n_failed(self):
+        """Number of failed time steps"""
+        return len(self.step_history['failed'])
+
+    @property
+    def n_rescued(self):
+        """Number of failed time steps that converged with a fallback solver"""
+        return len(self.step_history['rescued'])
+
+    @property
+    def n_substeps(self):
+        """Number of successful time steps that were smaller than the maximum time step"""
+        dts = self.step_history['dt']
+        if not len(dts):
+            return 0
+        return int(np.sum(self.step_history['n_steps'][dts < np.max(dts) * (1 - 1.0e-6)]))
+
+    @property
+    def n_iters(self):
+        """Number of solver iterations of each successful time step (None if not recorded)"""
+        if self.step_history is None:
+            return None
+        return self.step_history.get('n_iters')
+
+    def to_dict(self):
+        od = {'phase_times': dict(self.phase_times)}
+        if self.step_history is not None:
+            od['n_steps'] = self.n_steps
+            od['n_failed'] = self.n_failed
+            od['n_substeps'] = self.n_substeps
+            od['n_rescued'] = self.n_rescued
+            od['completed'] = bool(self.step_history['completed'])
+            od['step_history'] = {}
+            for item in self.step_history:
+                if item != 'completed':
+                    od['step_history'][item] = np.asarray(self.step_history[item]).tolist()
+        return od
+
+    def to_file(self, ffp):
+        with open(ffp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def time_phase(stats, name):
+    """Times the phase `name` if `stats` is not None"""
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.time_phase(name)
+
+
+def timed_phase(name):
+    """Decorator of a method that times it as phase `name` in `self.stats` (if it is not None)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with time_phase(getattr(self, 'stats', None), name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,228 @@
+import numpy as np
+import o3seespy as o3
+
+
+class Solver(object):
+    """
+    Solution algorithm (and optionally the convergence test) of a transient analysis
+
+    Parameters
+    ----------
+    algorithm: str
+        Name of the `o3seespy.algorithm` class (e.g. 'Newton', 'KrylovNewton', 'ModifiedNewton')
+    tol: float
+        Tolerance of the `NormDispIncr` test, if None then the current test is kept
+    max_iter: int
+        Maximum number of iterations of the test
+    kwargs:
+        Passed to the algorithm
+    """
+
+    def __init__(self, algorithm, tol=None, max_iter=30, **kwargs):
+        self.algorithm = algorithm
+        self.tol = tol
+        self.max_iter = max_iter
+        self.kwargs = kwargs
+
+    def apply(self, osi):
+        if self.tol is not None:
+            o3.test.NormDispIncr(osi, tol=self.tol, max_iter=self.max_iter, p_flag=0)
+        getattr(o3.algorithm, self.algorithm)(osi, **self.kwargs)
+
+    def __repr__(self):
+        return f'Solver({self.algorithm!r}, tol={self.tol}, max_iter={self.max_iter})'
+
+
+DEFAULT_SOLVER = Solver('Newton', tol=1.0e-4, max_iter=30)  # solver defined by the SRA classes
+DEFAULT_FALLBACKS = (Solver('KrylovNewton'), Solver('NewtonLineSearch'),
+                     Solver('ModifiedNewton', tol=1.0e-3, max_iter=100))
+
+
+class AdaptiveStepper(object):
+    """
+    Adaptive time stepping for a transient analysis
+
+    A step that fails to converge is first retried with each of the `fallbacks` solvers in turn, and the
+    `solver` is restored after the step. If all fallbacks fail, then the time step is halved, and it is
+    doubled again (up to `dt_max`) after `n_grow` consecutive successful steps. The steps between recorder times
+    are evenly sized, so that the analysis lands exactly on every recorder time.
+
+    Parameters
+    ----------
+    osi: o3seespy.OpenSeesInstance
+    dt_max: float
+        Initial and maximum time step
+    dt_min: float
+        Minimum time step, if a step at `dt_min` fails then the analysis is stopped (default=`dt_max / 2 ** 10`)
+    n_grow: int
+        Number of consecutive successful steps before the time step is doubled
+    rec_dts: list
+        Time steps of the recorders (measured from the start of the analysis)
+    chunked: bool
+        If True, then while the time step is at `dt_max` (and the recorder time steps are multiples of it),
+        the steps are run in a single call to `analyze`, and only drop to single steps after a failure
+    callback: function
+        If set, then called with the elapsed analysis time at the start and at each recorder time
+        (chunks of steps then stop at each recorder time)
+    record_iters: bool
+        If True, then the number of solver iterations of each successful step is recorded
+        (the steps are then run one at a time)
+    solver: Solver
+        The primary solver, which must be the one defined in the analysis (default=`DEFAULT_SOLVER`)
+    fallbacks: list of Solver
+        Solvers tried in order on a failed step before the time step is reduced
+    """
+
+    def __init__(self, osi, dt_max, dt_min=None, n_grow=10, rec_dts=None, chunked=False, verbose=0, callback=None,
+                 record_iters=False, solver=None, fallbacks=None):
+        self.osi = osi
+        self.dt_max = dt_max
+        if dt_min is None:
+            dt_min = dt_max / 2 ** 10
+        self.dt_min = dt_min
+        self.time_tol = 1.0e-6 * dt_max  # larger than the round-off in the time after many steps
+        self.n_grow = n_grow
+        if rec_dts is None:
+            rec_dts = []
+        self.rec_dts = [rec_dt for rec_dt in rec_dts if rec_dt]
+        self.chunked = chunked
+        self.verbose = verbose
+        self.callback = callback
+        self.record_iters = record_iters
+        if record_iters:
+            self.chunked = False
+        if solver is None:
+            solver = DEFAULT_SOLVER
+        self.solver = solver
+        if fallbacks is None:
+            fallbacks = []
+        self.fallbacks = list(fallbacks)
+        self.n_iters = []  # number of iterations of each successful step
+        self.history = []  # [start time, time step, number of steps] of each run of successful steps
+        self.failed_steps = []  # [time, time step] of each failed step
+        self.rescued_steps = []  # [time, time step, index of fallback] of each step rescued by a fallback
+        self.init_time = None
+        self.end_time = None
+        self.completed = False
+
+    def get_next_time(self, curr_time, dts):
+        tol = self.time_tol
+        t_next = self.end_time
+        for dt in dts:
+            n = np.floor((curr_time - self.init_time + tol) / dt) + 1
+            t_next = min(t_next, self.init_time + n * dt)
+        return t_next
+
+    def get_next_target_time(self, curr_time):
+        """Time of the next recorder output (or the end of the analysis)"""
+        return self.get_next_time(curr_time, self.rec_dts)
+
+    def add_to_history(self, curr_time, dt, n_steps):
+        if len(self.history) and abs(self.history[-1][1] - dt) < 1.0e-9 * dt:  # ignore round-off in the step size
+            self.history[-1][2] += n_steps
+        else:
+            self.history.append([curr_time, dt, n_steps])
+
+    def get_n_chunk_steps(self, curr_time, step):
+        """Number of steps of size `step` that can be run in a single call without passing a recorder time"""
+        for rec_dt in self.rec_dts:
+            ratio = rec_dt / step
+            if abs(ratio - np.round(ratio)) > 1.0e-6 * ratio:
+                return 1
+        return max(int(np.floor((self.end_time - curr_time) / step + 1.0e-6)), 1)
+
+    def try_fallbacks(self, step):
+        """Retries a failed step with each fallback, returns the index of the one that converged (or None)"""
+        rescued = None
+        for i, fallback in enumerate(self.fallbacks):
+            fallback.apply(self.osi)
+            if not o3.analyze(self.osi, 1, step):
+                if self.record_iters:
+                    self.n_iters.append(self.osi.to_process('testIter', []))
+                rescued = i
+                break
+        self.solver.apply(self.osi)
+        return rescued
+
+    def run(self, analysis_time):
+        """
+        Run the analysis for a duration of `analysis_time`
+
+        Returns
+        -------
+        bool
+            True if the full duration was analysed
+        """
+        self.init_time = o3.get_time(self.osi)
+        self.end_time = self.init_time + analysis_time
+        tol = self.time_tol
+        curr_time = self.init_time
+        dt = self.dt_max
+        n_success = 0
+        if self.callback is not None:
+            self.callback(0.0)
+        while self.end_time - curr_time > tol:
+            t_next = self.get_next_target_time(curr_time)
+            n_sub = max(int(np.ceil((t_next - curr_time) / dt - 1.0e-6)), 1)
+            step = (t_next - curr_time) / n_sub
+            n_steps = 1
+            if self.chunked and dt == self.dt_max:
+                n_steps = self.get_n_chunk_steps(curr_time, step)
+                if self.callback is not None:
+                    n_steps = min(n_steps, n_sub)
+            failed = o3.analyze(self.osi, n_steps, step)
+            if n_steps > 1:  # steps before a failed step are committed
+                prev_time = curr_time
+                curr_time = o3.get_time(self.osi)
+                n_done = int(np.round((curr_time - prev_time) / step))
+                if n_done:
+                    self.add_to_history(prev_time, step, n_done)
+            elif not failed:
+                self.add_to_history(curr_time, step, 1)
+                curr_time += step
+                if self.record_iters:
+                    self.n_iters.append(self.osi.to_process('testIter', []))
+            # snap to the recorder (or end) time that the steps landed on, so the round-off does not build up
+            t_near = self.get_next_time(curr_time - 2 * tol, self.rec_dts)
+            if abs(curr_time - t_near) <= tol:
+                curr_time = t_near
+            if failed and self.fallbacks:
+                rescued = self.try_fallbacks(step)
+                if rescued is not None:
+                    if self.verbose:
+                        print(f'failed at time: {curr_time:.5g}, converged with {self.fallbacks[rescued]}')
+                    self.rescued_steps.append([curr_time, step, rescued])
+                    self.add_to_history(curr_time, step, 1)
+                    curr_time += step
+                    n_steps = 1
+                    failed = 0
+            if failed:
+                self.failed_steps.append([curr_time, step])
+                n_success = 0
+                while dt > step * (1 - 1.0e-6):  # halve until less than the failed step
+                    dt /= 2
+                if self.verbose:
+                    print(f'failed at time: {curr_time:.5g}, reducing time step to {dt:.3g}')
+                if dt < self.dt_min:
+                    if self.verbose:
+                        print(f'analysis stopped at time: {curr_time:.5g}, time step is less than dt_min')
+                    break
+                continue
+            if self.callback is not None and abs(t_next - curr_time) <= tol:
+                self.callback(curr_time - self.init_time)
+            n_success += n_steps
+            if n_success >= self.n_grow and dt < self.dt_max:
+                dt = min(2 * dt, self.dt_max)
+                n_success = 0
+        self.completed = self.end_time - curr_time <= tol
+        return self.completed
+
+    @property
+    def step_history(self):
+        """Dictionary of the start time, time step and number of steps of each run of equal time steps"""
+        history = np.array(self.history).reshape(-1, 3)
+        return {'time': history[:, 0], 'dt': history[:, 1], 'n_steps': history[:, 2].astype(int),
+                'failed': np.array(self.failed_steps).reshape(-1, 2), 'completed': self.completed,
+                'rescued': np.array(self.rescued_steps).reshape(-1, 3),
+                'fallbacks': [fallback.algorithm for fallback in self.fallbacks],
+                'n_iters': np.array(self.n_iters, dtype=int) if self.record_iters else None}
@@ -0,0 +1,186 @@
+import copy
+import functools
+
+import numpy as np
+
+from o3soil.parallel import map_in_workers
+
+VS_PARAMS = ['g_mod', 'g0_mod', 'g0']  # shear moduli (or coefficients), scaled by the square of the Vs factor
+STRENGTH_PARAMS = ['cohesion']  # scaled by the strength factor (the friction angle is scaled through tan(phi))
+
+
+def sample_profile_factors(n_realizations, n_layers, sigma_ln_vs=0.0, rho_vs=0.0, sigma_ln_h=0.0,
+                           sigma_ln_strength=0.0, seed=None):
+    """
+    Lognormal factors of the shear wave velocity, thickness and strength of each layer of each realization
+
+    The Vs factors of the layers are correlated with a coefficient of `rho_vs ** (j - i)` between layers i and j.
+
+    Parameters
+    ----------
+    n_realizations: int
+    n_layers: int
+    sigma_ln_vs: float
+        Standard deviation of the log of the Vs factor
+    rho_vs: float
+        Correlation of the log of the Vs factors of adjacent layers (1.0 gives the same factor in every layer)
+    sigma_ln_h: float
+        Standard deviation of the log of the thickness factor
+    sigma_ln_strength: float
+        Standard deviation of the log of the strength factor
+    seed: int
+        Seed of the random number generator
+
+    Returns
+    -------
+    dict
+        'vs', 'thickness' and 'strength' factors, each of shape (n_realizations, n_layers)
+    """
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((3, n_realizations, n_layers))
+    inds = np.arange(n_layers)
+    corr = rho_vs ** np.abs(inds[:, np.newaxis] - inds[np.newaxis, :])
+    w, v = np.linalg.eigh(corr)  # unlike cholesky, also valid for fully correlated layers (rho_vs=1)
+    ln_vs = sigma_ln_vs * z[0] @ (v * np.sqrt(np.clip(w, 0, None))).T
+    return {'vs': np.exp(ln_vs), 'thickness': np.exp(sigma_ln_h * z[1]),
+            'strength': np.exp(sigma_ln_strength * z[2])}
+
+
+def gen_profile_realization(sp, vs_factors=None, thickness_factors=None, strength_factors=None):
+    """
+    Copy of a soil profile with the Vs, thickness and strength of each layer scaled by the factors
+
+    The thicknesses are rescaled so that the height of the profile is unchanged.
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+    vs_factors: array_like
+        Factor on the shear wave velocity of each layer (see `VS_PARAMS`)
+    thickness_factors: array_like
+        Factor on the thickness of each layer
+    strength_factors: array_like
+        Factor on the strength of each layer (see `STRENGTH_PARAMS`)
+
+    Returns
+    -------
+    sfsimodels.SoilProfile object
+    """
+    new_sp = copy.deepcopy(sp)
+    n_layers = sp.n_layers
+    layer_depths = np.array([sp.layer_depth(i + 1) for i in range(n_layers)], dtype=float)
+    soils = [new_sp.layer(i + 1) for i in range(n_layers)]
+    for i, sl in enumerate(soils):
+        if vs_factors is not None:
+            for pm in VS_PARAMS:
+                if getattr(sl, pm, None) is not None:  # override resets the moduli that are derived from g_mod
+                    sl.override(pm, getattr(sl, pm) * vs_factors[i] ** 2)
+        if strength_factors is not None:
+            for pm in STRENGTH_PARAMS:
+                if getattr(sl, pm, None) is not None:
+                    sl.override(pm, getattr(sl, pm) * strength_factors[i])
+            if getattr(sl, 'phi', None):
+                sl.override('phi', np.degrees(np.arctan(np.tan(np.radians(sl.phi)) * strength_factors[i])))
+    if thickness_factors is not None and n_layers > 1:
+        thicknesses = np.diff(np.append(layer_depths, sp.height)) * thickness_factors
+        new_depths = np.cumsum(thicknesses)[:-1] * sp.height / np.sum(thicknesses)
+        for depth in layer_depths[1:]:
+            new_sp.remove_layer_at_depth(depth)
+        for i in range(1, n_layers):
+            new_sp.add_layer(float(new_depths[i - 1]), soils[i])
+    return new_sp
+
+
+def _run_realization(sp, asig, essra, kwargs, item):
+    i, factors = item
+    from o3soil.sra.one_d import run_sra
+    from o3soil.sra.one_d_eff import run_essra
+    sp_r = gen_profile_realization(sp, *factors)
+    if essra:
+        sra_1d = run_essra(sp_r, asig, summary=True, **kwargs)
+    else:
+        sra_1d = run_sra(sp_r, asig, summary=True, **kwargs)
+    return sra_1d.out_dict
+
+
+def get_percentile_envelopes(out_dicts, percentiles=(16, 50, 84)):
+    """
+    Percentiles over the realizations of each summary output (see `O3SRAOutputs.summary_to_dict`)
+
+    Returns
+    -------
+    dict
+        `<output>_<stat>` arrays of shape (len(percentiles), n_depths), and `<output>_depth` of the first result
+    """
+    out_dicts = [od for od in out_dicts if od is not None]
+    if not len(out_dicts):
+        return {}
+    env = {}
+    for item in out_dicts[0]:
+        if item.endswith('_depth'):
+            env[item] = out_dicts[0][item]
+            continue
+        vals = np.array([od[item] for od in out_dicts])
+        env[item] = np.percentile(vals, percentiles, axis=0)
+    return env
+
+
+def run_sra_monte_carlo(sp, asig, n_realizations, depths=None, outs=None, percentiles=(16, 50, 84),
+                        sigma_ln_vs=0.0, rho_vs=0.0, sigma_ln_h=0.0, sigma_ln_strength=0.0, seed=None,
+                        n_workers=None, essra=False, timeout=None, start_method=None, **kwargs):
+    """
+    Site response analysis of randomised realizations of a soil profile, summarised as percentiles per depth
+
+    The layer factors of all the realizations are sampled at once (see `sample_profile_factors`), and each
+    realization is built and analysed in its own worker process, which only returns the summary statistics
+    of its outputs (see `O3SRAOutputs.summary_to_dict`).
+
+    Parameters
+    ----------
+    sp: sfsimodels.SoilProfile object
+        The base soil profile
+    asig: eqsig.AccSignal object
+        The input motion
+    n_realizations: int
+        Number of realizations
+    depths: array_like
+        Depths of the outputs, which are the same for every realization (default every 1m)
+    outs: list of str
+        Output types (default ['ACCX', 'TAU', 'STRS'])
+    percentiles: tuple
+        Percentiles of the envelopes
+    sigma_ln_vs, rho_vs, sigma_ln_h, sigma_ln_strength, seed:
+        See `sample_profile_factors`
+    n_workers: int
+        Maximum number of concurrent analyses, if None then uses all available cores
+    essra: bool
+        If True then use the effective stress analysis (`run_essra`) otherwise `run_sra`
+    timeout: float
+        Maximum wall-clock time (in seconds) of each analysis, after which it is recorded as failed
+    start_method: str
+        Multiprocessing start method of the workers, see `o3soil.parallel.map_in_workers`
+    kwargs:
+        Passed to `run_sra` or `run_essra` (e.g. `analysis_dt`, `dy`, `base_imp`)
+
+    Returns
+    -------
+    envelopes: dict
+        Percentiles of each summary output (see `get_percentile_envelopes`), and the `factors` of the realizations
+    errors: dict
+        Error message of each failed realization, keyed by its index
+    """
+    if depths is None:
+        depths = np.arange(0, sp.height + 0.5, 1.0)
+    if outs is None:
+        outs = ['ACCX', 'TAU', 'STRS']
+    kwargs['outs'] = {otype: list(depths) for otype in outs}
+    factors = sample_profile_factors(n_realizations, sp.n_layers, sigma_ln_vs=sigma_ln_vs, rho_vs=rho_vs,
+                                     sigma_ln_h=sigma_ln_h, sigma_ln_strength=sigma_ln_strength, seed=seed)
+    items = [(i, (factors['vs'][i], factors['thickness'][i], factors['strength'][i]))
+             for i in range(n_realizations)]
+    func = functools.partial(_run_realization, sp, asig, essra, kwargs)
+    out_dicts, errors = map_in_workers(func, items, n_workers=n_workers, start_method=start_method,
+                                       timeout=timeout, preload=['o3soil.sra'])
+    envelopes = get_percentile_envelopes(out_dicts, percentiles=percentiles)
+    envelopes['factors'] = factors
+    return envelopes, errors
@@ -1 +1,9 @@
-from . import bnwf
+import importlib
+
+_SUBMODULES = ['bnwf']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
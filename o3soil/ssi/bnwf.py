@@ -1,4 +1,3 @@
-import geofound as gf
 import o3seespy as o3
 import numpy as np
 
@@ -28,6 +27,7 @@ def set_bnwf2d_via_harden_2009(osi, sl, fd, soil_node, bd_node, axis, dettach=Tr
     -------
 
     """
+    import geofound as gf
     # TODO: account for foundation height
     end_zone_ratio = 0.3  # TODO: currently based on 0.3, but Harden et al. (2005) showed this to be a ratio of B/L
     k_rot = gf.stiffness.calc_rotational_via_gazetas_1991(sl, fd, axis=axis)
@@ -136,6 +136,7 @@ def generate_example_ssi_system():
 
 
 def run_example():
+    import geofound as gf
     osi = o3.OpenSeesInstance(ndm=2, state=3)
     bd, sl = generate_example_ssi_system()
     fd = bd.fd
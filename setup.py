@@ -24,7 +24,7 @@ setup(name='o3soil',
           'Topic :: Scientific/Engineering',
           'Programming Language :: Python :: 3',
       ],
-      packages=find_packages(exclude=['contrib', 'docs', 'tests']),
+      packages=find_packages(exclude=['contrib', 'docs', 'tests', 'benchmarks']),
       install_requires=[
         "numpy",
         "o3seespy"
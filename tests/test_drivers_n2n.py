@@ -1,10 +1,84 @@
+import os
+
+import numpy as np
+import o3seespy as o3
+
 from o3soil.drivers import n2d
+from o3soil.drivers.n2d.cyclic_strength import get_n_cycles_to_criterion, fit_crr_n_curve, solve_csr_for_n_cycles
+
+
+def build_pm4sand(osi):  # in kPa, the units of the test stresses
+    return o3.nd_material.PM4Sand(osi, 0.35, 476.0, 0.53, 1.42, 101.0, nu=1. / 3)
 
 
 def test_vload_2d():
     n2d.vload_2d.run_example()
 
 
-def test_ud_cdss_2d():
-    n2d.ud_cdss_2d.run_example()
+def test_ud_cdss_2d(tmp_path):
+    n2d.ud_cdss_2d.run_example(out_dir=str(tmp_path))
+    assert os.path.exists(os.path.join(str(tmp_path), 'ss.py'))
+    assert os.path.exists(os.path.join(str(tmp_path), 'node_disp.txt'))
+
+
+def test_n_cycles_to_criterion():
+    esig_v0 = 100.0
+    csr = 0.2
+    time = np.linspace(0, 10, 2001)  # ten cycles after consolidation
+    stress = np.concatenate([np.zeros(50), csr * esig_v0 * np.sin(2 * np.pi * time)])
+    ppt = np.concatenate([-np.linspace(0, esig_v0, 50), -esig_v0 * (1 - 0.1 * time)])
+    strain = np.concatenate([np.zeros(50), 0.004 * time * np.sin(2 * np.pi * time)])
+    n_cyc = get_n_cycles_to_criterion(stress, strain, ppt, esig_v0, csr, strain_limit=0.03)
+    assert n_cyc == 8.0  # strain amplitude of 0.03 is reached on the 16th half cycle (t=7.73)
+    n_cyc_ru = get_n_cycles_to_criterion(stress, strain, ppt, esig_v0, csr, ru_limit=0.52)
+    assert n_cyc_ru == 5.5  # ru=0.52 at t=5.2
+    assert np.isnan(get_n_cycles_to_criterion(stress, strain, ppt, esig_v0, csr, strain_limit=0.05))
+    a, b = fit_crr_n_curve([0.3, 0.2, 0.1], [2.0, 2.0 * 1.5 ** 4, np.nan])
+    assert np.isclose(b, 0.25)
+    assert np.isclose(a, 0.3 * 2.0 ** 0.25)
+
+
+def test_run_csr_n_grid():
+    tests, table, errors = n2d.run_csr_n_grid(build_pm4sand, [0.12, 0.16], esig_v0s=[101.3], n_lim=20,
+                                              nu_dyn=0.3, strain_inc=5.0e-6, n_workers=2)
+    assert errors == {}
+    assert len(tests) == 2
+    assert np.isfinite(tests['n_cyc']).all()
+    assert tests['n_cyc'][0] > tests['n_cyc'][1]
+    assert table['crr'].shape == (1, 5)
+    assert np.isfinite(table['crr']).all()
+
+
+def test_solve_csr_for_n_cycles_reuses_evaluations():
+    calls = []
+
+    def n_cycles_func(csr, n_lim):
+        calls.append(n_lim)
+        n_cyc = np.round(2 * (0.3 / csr) ** 4) / 2
+        return n_cyc if n_cyc <= n_lim else np.nan
+
+    evals = {}
+    res = solve_csr_for_n_cycles(n_cycles_func, 15, 30, evals=evals)
+    assert np.isclose(res['csr'], 0.3 * 15 ** -0.25, rtol=0.01)
+    assert res['n_evals'] == len(calls) == len(evals) <= 6
+    res = solve_csr_for_n_cycles(n_cycles_func, 10, 30, evals=evals)  # starts from the bracket of the cache
+    assert np.isclose(res['csr'], 0.3 * 10 ** -0.25, rtol=0.01)
+    assert res['n_evals'] <= 2
+    # tests stopped at the target only give a bound on the cycles, so the search bisects
+    res = solve_csr_for_n_cycles(n_cycles_func, 15, 15, evals={})
+    assert np.isclose(res['csr'], 0.3 * 15 ** -0.25, rtol=0.01)
+
 
+def test_find_csr_for_n_cycles():
+    cache = {}
+    res = n2d.find_csr_for_n_cycles(build_pm4sand, n_target=5, esig_v0=101.3, max_evals=4, cache=cache,
+                                    nu_dyn=0.3, strain_inc=5.0e-6)
+    assert 0 < res['n_evals'] <= 4
+    key, evals = list(cache.items())[0]
+    assert key[0] == 'tests.test_drivers_n2n.build_pm4sand'  # the same in every process
+    assert len(evals) == res['n_evals']
+    assert all(n_lim == 10 for n_cyc, n_lim in evals.values())
+    assert np.isfinite(res['n_cyc'])
+    lo, hi = res['bracket']
+    assert np.isfinite(evals[lo][0]) and evals[lo][0] > 5 > evals[hi][0]  # the tests liquefied on both sides
+    assert lo < res['csr'] < hi
@@ -0,0 +1,61 @@
+import sfsimodels as sm
+import o3seespy as o3
+
+import o3soil.sra
+
+
+def build_soil(vs):
+    sl = sm.Soil()
+    unit_mass = 1700.0
+    sl.g_mod = vs ** 2 * unit_mass
+    sl.poissons_ratio = 0.0
+    sl.unit_dry_weight = unit_mass * 9.8
+    sl.specific_gravity = 2.65
+    return sl
+
+
+def test_material_registry_reuses_interleaved_materials():
+    soft = build_soil(160.)
+    stiff = build_soil(300.)
+    sp = sm.SoilProfile()
+    sp.add_layer(0, soft)
+    sp.add_layer(3, stiff)
+    sp.add_layer(6, soft)
+    sp.add_layer(9, stiff)
+    sp.height = 12.
+    sra_1d = o3soil.sra.SRA1D(sp, dy=0.5)
+    sra_1d.build_model()
+    assert len(sra_1d.eles) == 24
+    assert len(sra_1d.soil_mats) == 2
+    assert sra_1d.eles[0].mat is sra_1d.eles[12].mat
+    o3.wipe(sra_1d.osi)
+
+
+def test_material_registry_quantises_stress_dependent_moduli():
+    sl = sm.StressDependentSoil()
+    sl.g0_mod = 500.
+    sl.a = 0.5
+    sl.poissons_ratio = 0.3
+    sl.unit_dry_weight = 17000.
+    sl.specific_gravity = 2.65
+    sl.p_atm = 101.0e3
+    sp = sm.SoilProfile()
+    sp.add_layer(0, sl)
+    sp.height = 30.
+    sp.gwl = 100.
+    n_mats = []
+    for rtol in [0.0, 0.05]:
+        sra_1d = o3soil.sra.SRA1D(sp, dy=0.25, mat_rtol=rtol)
+        sra_1d.build_model()
+        n_mats.append(len(sra_1d.soil_mats))
+        o3.wipe(sra_1d.osi)
+        for mat in sra_1d.soil_mats:
+            assert isinstance(mat, o3.nd_material.ElasticIsotropic)
+    assert n_mats[0] == 120
+    assert n_mats[1] < 40
+
+
+def test_recorder_output_ind():
+    assert o3soil.generic.get_recorder_output_ind('ElasticIsotropic', 'stress', 'sxy') == (2, 3)
+    assert o3soil.generic.get_recorder_output_ind('ElasticIsotropic', 'strain', 'gxy') == (2, 3)
+    assert o3soil.generic.get_recorder_layout() is o3soil.generic.get_recorder_layout()  # parsed once
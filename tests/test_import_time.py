@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIONAL_DEPS = ['geofound', 'liquepy', 'eqsig', 'sfsimodels']
+
+
+def _run_python(code, *args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    res = subprocess.run([sys.executable, *args, '-c', code], cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+                         check=True)
+    return res
+
+
+def _loaded_modules(code):
+    res = _run_python(code + '\nimport sys\nprint(",".join(sys.modules))')
+    return set(res.stdout.strip().split('\n')[-1].split(','))
+
+
+def test_import_o3soil_is_lazy():
+    mods = _loaded_modules('import o3soil')
+    for name in ['o3seespy', 'numpy', 'o3soil.sra', 'o3soil.ssi.bnwf', 'o3soil.drivers.n2d'] + OPTIONAL_DEPS:
+        assert name not in mods, name
+    mods = _loaded_modules('import o3soil.sra')
+    for name in ['o3soil.ssi', 'o3soil.drivers'] + OPTIONAL_DEPS:
+        assert name not in mods, name
+    mods = _loaded_modules('import o3soil\no3soil.ssi.bnwf\no3soil.drivers.n2d.run_ud_cdss\no3soil.MaterialRegistry')
+    assert 'o3soil.ssi.bnwf' in mods
+    assert 'geofound' not in mods
+
+
+def test_import_time_of_o3soil_modules():
+    # `-X importtime` reports the self time (us) of each imported module, only the o3soil modules are summed
+    res = _run_python('import o3soil.sra', '-X', 'importtime')
+    self_time = 0
+    for line in res.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip().startswith('o3soil'):
+            self_time += int(parts[0].split(':')[1])
+    assert self_time < 0.5e6
@@ -0,0 +1,36 @@
+import os
+import time
+
+from o3soil.parallel import map_in_workers
+
+
+def square_or_fail(x):
+    if x == 2:
+        raise ValueError('bad item')
+    if x == 3:
+        os._exit(1)  # mimic a crash of the OpenSees library
+    if x == 4:
+        time.sleep(30)
+    return x ** 2
+
+
+def test_map_in_workers_keeps_order_and_collects_failures():
+    results, errors = map_in_workers(square_or_fail, [0, 1, 2, 3, 4, 5], n_workers=3, timeout=3)
+    assert results == [0, 1, None, None, None, 25]
+    assert sorted(errors) == [2, 3, 4]
+    assert 'bad item' in errors[2]
+    assert 'exited with code 1' in errors[3]
+    assert 'timeout' in errors[4]
+
+
+def test_map_in_workers_callback():
+    finished = {}
+
+    def callback(i, res, error):
+        finished[i] = (res, error)
+
+    results, errors = map_in_workers(square_or_fail, [0, 1, 2], n_workers=2, callback=callback)
+    assert results == [None, None, None]  # only passed to the callback
+    assert finished[1] == (1, None)
+    assert finished[2][0] is None and 'bad item' in finished[2][1]
+    assert list(errors) == [2]
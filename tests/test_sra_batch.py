@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import sfsimodels as sm
+import eqsig
+
+import o3soil.sra
+from tests.conftest import TEST_DATA_DIR
+
+
+def build_elastic_profile():
+    sp = sm.SoilProfile()
+    for depth, vs in [(0, 160.), (9.5, 400.)]:
+        sl = sm.Soil()
+        unit_mass = 1700.0
+        sl.g_mod = vs ** 2 * unit_mass
+        sl.poissons_ratio = 0.0
+        sl.unit_dry_weight = unit_mass * 9.8
+        sl.specific_gravity = 2.65
+        sp.add_layer(depth, sl)
+    sp.height = 20.0
+    return sp
+
+
+def load_short_asig(m=1.0, npts=200):
+    asig = eqsig.load_asig(TEST_DATA_DIR + 'short_motion_dt0p01.txt', m=m)
+    return eqsig.AccSignal(asig.values[:npts], asig.dt)
+
+
+def test_run_sra_suite_matches_serial():
+    asigs = [load_short_asig(m=1.0), load_short_asig(m=0.5)]
+    outs = {'ACCX': 'all'}
+    out_dicts, errors = o3soil.sra.run_sra_suite(build_elastic_profile(), asigs, n_workers=2, outs=outs,
+                                                 analysis_dt=0.005)
+    assert errors == {}
+    for i, asig in enumerate(asigs):
+        sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005)
+        assert np.isclose(out_dicts[i]['ACCX'], sra_1d.out_dict['ACCX']).all()
+
+
+def test_run_sra_suite_collects_failures():
+    asigs = [load_short_asig(), None]
+    out_dicts, errors = o3soil.sra.run_sra_suite(build_elastic_profile(), asigs, n_workers=2, outs={'ACCX': 'all'},
+                                                 analysis_dt=0.005)
+    assert out_dicts[0] is not None
+    assert out_dicts[1] is None
+    assert list(errors) == [1]
+
+
+def test_run_sra_suite_accepts_generator():
+    asigs = (load_short_asig(m=m) for m in [1.0, 0.5])
+    for reuse_static in [True, False]:
+        out_dicts, errors = o3soil.sra.run_sra_suite(build_elastic_profile(), asigs, n_workers=2, outs={'ACCX': 'all'},
+                                                     analysis_dt=0.005, reuse_static=reuse_static)
+        assert errors == {}
+        assert len(out_dicts) == 2
+        asigs = [load_short_asig(m=m) for m in [1.0, 0.5]]
+
+
+def test_run_sra_suite_static_failure():
+    sp = build_elastic_profile()
+    sl = sm.Soil()
+    sl.g_mod = 1.0e8
+    sp.add_layer(15.0, sl)  # no unit weight, so the column can not be built
+    with pytest.raises(RuntimeError, match='static analysis of the suite failed'):
+        o3soil.sra.run_sra_suite(sp, [load_short_asig(), load_short_asig()], outs={'ACCX': 'all'},
+                                 analysis_dt=0.005)
+
+
+def test_run_sra_suite_builds_static_state_in_worker(monkeypatch):
+    def build_static_sra(*args, **kwargs):
+        raise AssertionError('the static state was built in the calling process')
+
+    # the (spawned) static state worker imports its own unpatched copy of the module
+    monkeypatch.setattr(o3soil.sra.batch, 'build_static_sra', build_static_sra)
+    out_dicts, errors = o3soil.sra.run_sra_suite(build_elastic_profile(), [load_short_asig()], outs={'ACCX': 'all'},
+                                                 analysis_dt=0.005, start_method='spawn')
+    assert errors == {}
+    assert out_dicts[0] is not None
+
+
+def test_execute_dynamic_keep_static_state():
+    asig = load_short_asig()
+    outs = {'ACCX': 'all'}
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005)
+    sra_1d_ks = o3soil.sra.SRA1D(build_elastic_profile())
+    sra_1d_ks.build_model()
+    sra_1d_ks.execute_static()
+    for i in range(2):
+        sra_1d_ks.execute_dynamic(asig, analysis_dt=0.005, outs=outs, playback=False, keep_static_state=True)
+        assert np.isclose(sra_1d_ks.out_dict['ACCX'], sra_1d.out_dict['ACCX']).all()
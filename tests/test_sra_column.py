@@ -0,0 +1,78 @@
+import numpy as np
+import sfsimodels as sm
+import o3seespy as o3
+
+from o3soil.sra.column import SoilColumnMesh, get_ele_prop_table, gen_wavelength_split
+
+
+def test_soil_column_mesh_matches_row_by_row_build():
+    node_depths = -np.array([0., 0.5, 1.0, 2.0, 3.0])
+    mesh = SoilColumnMesh(node_depths, 1.5, base_imp=0)
+    osi = o3.OpenSeesInstance(ndm=2, ndf=2, state=0)
+    sn = mesh.build(osi, ndf=2)
+    assert sn.shape == (5, 2)
+    assert [nd.tag for nd in sn[:, 0]] == [1, 3, 5, 7, 9]  # left node then right node of each row
+    ele_nodes = mesh.ele_nodes
+    assert len(ele_nodes) == 4
+    assert list(ele_nodes[1]) == [sn[2][0], sn[2][1], sn[1][1], sn[1][0]]  # anti-clockwise
+    c_base = mesh.build_base_dashpot(osi, 1000.)
+    assert np.isclose(c_base, 1.5)
+    coords = o3.get_all_node_coords(osi)
+    assert len(coords) == 12
+    np.testing.assert_allclose(coords[2], [0, -0.5])
+    np.testing.assert_allclose(coords[9], [1.5, -3.0])
+    o3.wipe(osi)
+
+
+def test_ele_prop_table_matches_profile_lookups():
+    sp = sm.SoilProfile()
+    for depth, g0_mod in [(0, 400.), (3.2, 600.), (7.0, 900.)]:
+        sl = sm.StressDependentSoil()
+        sl.g0_mod = g0_mod
+        sl.a = 0.5
+        sl.poissons_ratio = 0.3
+        sl.unit_dry_weight = 17000.
+        sl.specific_gravity = 2.65
+        sl.p_atm = 101.0e3
+        sp.add_layer(depth, sl)
+    sp.height = 12.
+    sp.gwl = 4.5
+    depths = np.arange(0.25, 12., 0.5)
+    props = get_ele_prop_table(sp, depths)
+    for i, depth in enumerate(depths):
+        sl_id = sp.get_layer_index_by_depth(depth)
+        sl = sp.layer(sl_id)
+        assert props['layer'][i] == sl_id
+        assert props['saturated'][i] == (depth > sp.gwl)
+        v_eff = sp.get_v_eff_stress_at_depth(depth)
+        assert np.isclose(props['v_eff'][i], v_eff)
+        m_eff = v_eff * (1 + 2 * 0.3 / 0.7) / 3
+        assert np.isclose(props['m_eff'][i], m_eff)
+        assert np.isclose(props['g_mod'][i], sl.get_g_mod_at_m_eff_stress(m_eff))
+        umass = sl.unit_sat_mass if depth > sp.gwl else sl.unit_dry_mass
+        assert np.isclose(props['unit_mass'][i], umass)
+
+
+def test_wavelength_split_sizes_sub_layers_from_vs():
+    sp = sm.SoilProfile()
+    for depth, vs in [(0, 150.), (10.0, 1000.)]:
+        sl = sm.Soil()
+        sl.g_mod = vs ** 2 * 1700.
+        sl.poissons_ratio = 0.3
+        sl.unit_dry_weight = 1700. * 9.8
+        sl.specific_gravity = 2.65
+        sp.add_layer(depth, sl)
+    sp.height = 60.0
+    split = gen_wavelength_split(sp, f_max=25., n_per_wave=10)
+    node_depths = np.insert(np.cumsum(split['thickness']), 0, 0)
+    assert np.isclose(node_depths[-1], 60.0)
+    assert np.min(np.abs(node_depths - 10.0)) < 1.0e-9  # layer boundary is a node
+    h_targets = split['shear_vel'] / (25. * 10)
+    assert np.all(split['thickness'] <= h_targets * (1 + 1.0e-9))
+    n_soft = np.sum(split['depth'] < 10.0)
+    assert n_soft == int(np.ceil(10.0 / h_targets[0]))
+    assert len(split['thickness']) - n_soft == int(np.ceil(50.0 / h_targets[-1]))
+    assert len(split['thickness']) < 60.0 / 0.5
+
+    split_soft = gen_wavelength_split(sp, f_max=25., n_per_wave=10, softening=0.5)
+    assert len(split_soft['thickness']) > len(split['thickness'])
@@ -0,0 +1,86 @@
+import numpy as np
+import sfsimodels as sm
+import eqsig
+
+import o3soil.sra
+from tests.test_sra_batch import load_short_asig
+
+
+def build_uniform_profile(vs=200., height=20., hyperbolic=False):
+    sp = sm.SoilProfile()
+    sl = sm.Soil()
+    unit_mass = 1700.0
+    sl.g_mod = vs ** 2 * unit_mass
+    sl.poissons_ratio = 0.0
+    sl.unit_dry_weight = unit_mass * 9.8
+    sl.specific_gravity = 2.65
+    if hyperbolic:
+        sl.sra_type = 'hyperbolic'
+        sl.strain_ref = 0.0005
+        sl.strain_curvature = 0.9
+        sl.xi_min = 0.02
+    else:
+        sl.xi = 0.02
+    sp.add_layer(0, sl)
+    sp.height = height
+    return sp
+
+
+def test_fd_sra_fixed_base_matches_closed_form():
+    vs = 200.
+    height = 20.
+    asig = eqsig.AccSignal(np.sin(2 * np.pi * 1.0 * np.arange(4000) * 0.01), 0.01)
+    fd = o3soil.sra.run_fd_sra(build_uniform_profile(vs, height), asig, base_imp=-1, outs={'ACCX': 'all'})
+    assert np.isclose(fd.out_dict['ACCX'][-1], asig.values, atol=1.0e-6 * 9.8).all()  # within motion at base
+    # steady state amplification of a uniform damped layer on rigid base is 1 / |cos(k* H)|
+    xi = 0.02
+    k_star = 2 * np.pi * 1.0 / (vs * np.sqrt(1 - 2 * xi ** 2 + 2j * xi * np.sqrt(1 - xi ** 2)))
+    amp = 1 / abs(np.cos(k_star * height))
+    surf = fd.out_dict['ACCX'][0]
+    assert np.isclose(np.max(np.abs(surf[3000:3900])), amp, rtol=0.01)
+
+
+def test_fd_sra_soil_params_at_element_centres():
+    sp = build_uniform_profile(hyperbolic=True)
+    sl = sm.Soil()
+    sl.g_mod = 400. ** 2 * 1700.
+    sl.poissons_ratio = 0.0
+    sl.unit_dry_weight = 1700. * 9.8
+    sl.specific_gravity = 2.65
+    sl.xi = 0.01
+    sp.add_layer(2.0, sl)  # linear layer from a sub-layer boundary
+    fd = o3soil.sra.FDSRA1D(sp, dy=0.5)
+    below = -fd.ele_depths > 2.0
+    assert np.all(fd.nonlinear == ~below)
+    assert np.allclose(fd.xi0[below], 0.01)
+    assert np.allclose(fd.xi0[~below], 0.02)
+
+
+def test_fd_sra_batch_matches_single_motions():
+    asigs = [load_short_asig(m=2.5, npts=600), load_short_asig(m=0.5, npts=600)]
+    sp = build_uniform_profile(hyperbolic=True)
+    fd_batch = o3soil.sra.run_fd_sra(sp, asigs)
+    assert fd_batch.out_dict['ACCX'].shape == (2, 41, 600)
+    assert fd_batch.out_dict['TAU'].shape == (2, 40, 600)
+    for i, asig in enumerate(asigs):
+        fd = o3soil.sra.run_fd_sra(build_uniform_profile(hyperbolic=True), asig)
+        for item in ['ACCX', 'STRS', 'TAU']:
+            assert np.isclose(fd_batch.out_dict[item][i], fd.out_dict[item]).all()
+    # stronger motion softens the soil
+    assert np.all(fd_batch.g_mod[0] < fd_batch.g_mod[1])
+    assert np.all(fd_batch.xi[0] > fd_batch.xi[1])
+
+
+def test_time_domain_eql_softens_column():
+    asig = load_short_asig(m=2.5, npts=300)
+    outs = {'ACCX': 'all', 'TAU': [2.0, 10.0]}
+    sra_lin = o3soil.sra.run_eql_sra(build_uniform_profile(), asig, outs=outs, analysis_dt=0.005, dy=1.0)
+    assert sra_lin.eql_n_iters == 1  # no strain-compatible soils
+    sra_eql = o3soil.sra.run_eql_sra(build_uniform_profile(hyperbolic=True), asig, outs=outs, analysis_dt=0.005,
+                                     dy=1.0, n_iter=6)
+    assert sra_eql.eql_n_iters > 1
+    assert sorted(sra_eql.out_dict) == sorted(sra_lin.out_dict)
+    assert sra_eql.out_dict['TAU'].shape == sra_lin.out_dict['TAU'].shape
+    e_mod0 = np.array([ele.mat.e_mod for ele in sra_eql.eles])
+    assert np.all(sra_eql.eql_e_mods < e_mod0)
+    assert np.all(sra_eql.eql_xi > 0.02)
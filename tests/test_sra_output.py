@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import o3soil.sra
+from tests.test_sra_batch import build_elastic_profile, load_short_asig
+
+
+def test_streamed_outputs_match_array_cache(tmp_path):
+    asig = load_short_asig()
+    outs = {'ACCX': 'all', 'TAU': 'all', 'STRS': 'all'}
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005)
+    sra_1d_st = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005, stream=True,
+                                   cache_path=str(tmp_path) + '/')
+    assert (tmp_path / 'ACCX.bin').exists()
+    assert isinstance(sra_1d_st.out_dict['ACCX'].base, np.memmap)
+    for item in ['ACCX', 'TAU', 'STRS', 'TIME']:
+        assert sra_1d_st.out_dict[item].shape == sra_1d.out_dict[item].shape
+        scale = np.max(np.abs(sra_1d.out_dict[item]))
+        assert np.allclose(sra_1d_st.out_dict[item], sra_1d.out_dict[item], rtol=1.0e-6, atol=1.0e-6 * scale)
+
+
+def test_results_npz_cache_round_trip(tmp_path):
+    asig = load_short_asig()
+    outs = {'ACCX': 'all', 'TAU': 'all'}
+    for cache_fmt in ['npz', 'npz_uncompressed', 'txt']:
+        (tmp_path / cache_fmt).mkdir()
+        cache_path = str(tmp_path / cache_fmt) + '/'
+        sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005,
+                                    cache_path=cache_path, cache_fmt=cache_fmt)
+        od = sra_1d.o3sra_outs.load_results_from_files(outs=['ACCX', 'TAU'])
+        assert np.allclose(od['ACCX'], sra_1d.out_dict['ACCX'], rtol=1.0e-6, atol=1.0e-9)
+        assert np.allclose(od['time'], sra_1d.out_dict['time'])
+    res = o3soil.sra.NpzResults(str(tmp_path / 'npz_uncompressed' / 'results.npz'))
+    assert isinstance(res['TAU'], np.memmap)
+    assert res.get_shape_and_dtype('TAU')[0] == sra_1d.out_dict['TAU'].shape
+    assert np.isclose(res.params['analysis_dt'], 0.005)
+    assert res.params['completed']
+
+
+def test_depth_selective_outputs_match_all():
+    asig = load_short_asig()
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs={'ACCX': 'all', 'TAU': 'all', 'STRS': 'all'},
+                                analysis_dt=0.005)
+    depths = [0.0, 2.0, 10.]
+    outs = {'ACCX': depths, 'TAU': depths, 'STRS': [2.0]}
+    sra_1d_d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005)
+    node_inds = [np.argmin(abs(abs(sra_1d.node_depths) - depth)) for depth in depths]
+    ele_inds = [np.argmin(abs(abs(sra_1d.ele_depths) - depth)) for depth in depths]
+    assert np.allclose(sra_1d_d.out_dict['ACCX'], sra_1d.out_dict['ACCX'][node_inds])
+    assert np.allclose(sra_1d_d.out_dict['TAU'], sra_1d.out_dict['TAU'][ele_inds])
+    assert np.allclose(sra_1d_d.out_dict['STRS'], sra_1d.out_dict['STRS'][ele_inds[1:2]])
+
+
+def test_depth_selective_outputs_share_streamed_recorders(tmp_path):
+    asig = load_short_asig()
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs={'TAU': 'all', 'ESIGY': 'all'},
+                                analysis_dt=0.005)
+    depths = [2.0, 10.]
+    outs = {'TAU': depths, 'ESIGY': depths, 'STRS': depths}
+    sra_1d_d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005, stream=True,
+                                  cache_path=str(tmp_path) + '/')
+    assert sorted(sra_1d_d.o3sra_outs.srd) == ['STRS', 'TAU']  # ESIGY shares the stress recorder of TAU
+    n_rows = len(sra_1d_d.out_dict['TIME'])
+    assert (tmp_path / 'TAU.bin').stat().st_size == n_rows * (len(depths) * 3 * 8 + 1)  # only the selected elements
+    ele_inds = [np.argmin(abs(abs(sra_1d.ele_depths) - depth)) for depth in depths]
+    for otype in ['TAU', 'ESIGY']:
+        assert isinstance(sra_1d_d.out_dict[otype], np.memmap)  # not copied into memory
+        scale = np.max(np.abs(sra_1d.out_dict[otype]))
+        assert np.allclose(sra_1d_d.out_dict[otype], sra_1d.out_dict[otype][ele_inds], atol=1.0e-6 * scale)
+
+
+def test_stream_requires_path():
+    with pytest.raises(ValueError, match='stream_path'):
+        o3soil.sra.run_sra(build_elastic_profile(), load_short_asig(), outs={'ACCX': 'all'}, analysis_dt=0.005,
+                           stream=True)
+
+
+def test_summary_outputs_match_full_series():
+    asig = load_short_asig()
+    outs = {'ACCX': 'all', 'TAU': [2.0, 10.0]}
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005)
+    sra_1d_s = o3soil.sra.run_sra(build_elastic_profile(), asig, outs=outs, analysis_dt=0.005, summary=True)
+    od = sra_1d_s.out_dict
+    assert 'ACCX' not in od
+    for otype in outs:
+        vals = sra_1d.out_dict[otype]
+        scale = np.max(np.abs(vals))
+        assert np.allclose(od[f'{otype}_max'], np.max(vals, axis=1), atol=1.0e-6 * scale)
+        assert np.allclose(od[f'{otype}_min'], np.min(vals, axis=1), atol=1.0e-6 * scale)
+        assert np.allclose(od[f'{otype}_rms'], np.sqrt(np.mean(vals ** 2, axis=1)), atol=1.0e-6 * scale)
+        peak_inds = np.argmax(np.abs(vals), axis=1)
+        assert np.allclose(od[f'{otype}_peak_time'], sra_1d.out_dict['time'][peak_inds])
+    arias = np.pi / (2 * 9.81) * np.sum(sra_1d.out_dict['ACCX'] ** 2, axis=1) * asig.dt
+    assert np.allclose(od['ACCX_arias'], arias, rtol=1.0e-5)
+    assert len(od['TAU_depth']) == 2
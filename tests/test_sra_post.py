@@ -0,0 +1,67 @@
+import numpy as np
+
+from o3soil.sra.post import (calc_response_spectra, calc_response_spectra_from_results, calc_smooth_fa_spectra,
+                             calc_transfer_functions, get_konno_ohmachi_matrix)
+from tests.test_sra_batch import load_short_asig
+
+
+def test_calc_response_spectra_batched_matches_single():
+    asig = load_short_asig()
+    periods = np.logspace(-2, 0.5, 20)
+    acc = np.array([asig.values, 0.5 * asig.values, np.roll(asig.values, 10)])
+    s_d, s_v, s_a = calc_response_spectra(acc, asig.dt, periods)
+    assert s_a.shape == (3, len(periods))
+    for i in range(len(acc)):
+        s_d_i, s_v_i, s_a_i = calc_response_spectra(acc[i], asig.dt, periods)
+        assert np.allclose(s_a[i], s_a_i)
+        assert np.allclose(s_d[i], s_d_i)
+    assert np.allclose(s_a[1], 0.5 * s_a[0])
+    # a stiff oscillator follows the ground motion
+    assert np.isclose(s_a[0, 0], np.max(np.abs(asig.values)), rtol=0.02)
+    # pseudo spectral acceleration is close to the total acceleration for low damping
+    w = 2 * np.pi / periods
+    assert np.allclose(w ** 2 * s_d[0], s_a[0], rtol=0.1)
+
+
+def test_calc_response_spectra_from_results_for_runs():
+    asig = load_short_asig()
+    time = np.arange(asig.npts) * asig.dt
+    ods = [{'ACCX': m * np.array([asig.values, 0.5 * asig.values]), 'time': time} for m in [1.0, 2.0]]
+    periods = np.array([0.1, 0.5, 1.0])
+    s_d, s_v, s_a = calc_response_spectra_from_results(ods, periods)
+    assert s_a.shape == (2, 2, 3)
+    s_d_0, s_v_0, s_a_0 = calc_response_spectra_from_results(ods[0], periods)
+    assert np.allclose(s_a[0], s_a_0)
+    assert np.allclose(s_a[1], 2 * s_a_0)
+
+
+def test_calc_transfer_functions_matches_direct_smoothing():
+    asig = load_short_asig()
+    acc = np.array([2.0 * asig.values, np.roll(asig.values, 5)])
+    smooth_freqs = np.logspace(-0.5, 1.3, 15)
+    freqs, h = calc_transfer_functions(acc, asig.dt, asig=asig, smooth_freqs=smooth_freqs)
+    assert h.shape == (3, 3, 15)
+    assert np.allclose(h[0, -1], 2.0)
+    assert np.allclose(h[1, 0] * h[0, 1], 1.0)
+
+    # direct Konno-Ohmachi smoothing of one signal
+    n_fft = 256
+    fa = np.abs(np.fft.rfft(acc[1], n=n_fft)) * asig.dt
+    fa_freqs = np.fft.rfftfreq(n_fft, asig.dt)
+    expected = []
+    for fc in smooth_freqs:
+        x = 40 * np.log10(fa_freqs[1:] / fc)
+        x[x == 0] = 1.0e-10
+        wts = (np.sin(x) / x) ** 4
+        expected.append(np.sum(wts * fa[1:]) / np.sum(wts))
+    sfas = calc_smooth_fa_spectra(acc, asig.dt, smooth_freqs=smooth_freqs)
+    assert np.allclose(sfas[1], expected)
+    hits = get_konno_ohmachi_matrix.cache_info().hits
+    calc_smooth_fa_spectra(acc, asig.dt, smooth_freqs=smooth_freqs)
+    assert get_konno_ohmachi_matrix.cache_info().hits == hits + 1
+
+    # several runs with an input motion each
+    freqs, h_runs = calc_transfer_functions(np.array([acc, 0.5 * acc]), asig.dt, asig=[asig, asig],
+                                            smooth_freqs=smooth_freqs)
+    assert h_runs.shape == (2, 3, 3, 15)
+    assert np.allclose(h_runs[1, 0, -1], 1.0)
@@ -0,0 +1,173 @@
+import json
+
+import eqsig
+import numpy as np
+
+import o3soil.sra
+from tests.conftest import TEST_DATA_DIR
+from tests.test_sra_batch import build_elastic_profile, load_short_asig
+
+
+def test_adaptive_steps_land_on_recorder_times():
+    asig = load_short_asig()
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs={'ACCX': 'all'}, analysis_dt=0.003)
+    hist = sra_1d.step_history
+    assert hist['completed']
+    assert len(hist['failed']) == 0
+    assert np.isclose(hist['dt'], 0.01 / 4).all()  # largest step <= 0.003 that divides rec_dt
+    assert np.isclose(np.sum(hist['dt'] * hist['n_steps']), asig.time[-1])
+    assert np.isclose(np.diff(sra_1d.out_dict['time']), asig.dt).all()
+
+
+def run_dynamic(asig, chunked, **kwargs):
+    sra_1d = o3soil.sra.SRA1D(build_elastic_profile())
+    sra_1d.build_model()
+    sra_1d.execute_static()
+    sra_1d.execute_dynamic(asig, playback=False, chunked=chunked, **kwargs)
+    return sra_1d
+
+
+def test_chunked_steps_match_single_steps():
+    asig = load_short_asig()
+    outs = {'ACCX': 'all', 'TAU': 'all'}
+    sra_single = run_dynamic(asig, False, analysis_dt=0.005, outs=outs, analysis_time=1.5)
+    sra_chunked = run_dynamic(asig, True, analysis_dt=0.005, outs=outs, analysis_time=1.5)
+    assert sra_chunked.step_history['n_steps'].sum() == sra_single.step_history['n_steps'].sum()
+    for item in outs:
+        assert np.isclose(sra_chunked.out_dict[item], sra_single.out_dict[item]).all()
+
+
+def test_chunked_steps_match_single_steps_on_long_record():
+    asig = eqsig.load_asig(TEST_DATA_DIR + 'test_motion_dt0p01.txt')
+    outs = {'ACCX': 'all'}
+    sra_single = run_dynamic(asig, False, analysis_dt=0.005, outs=outs)
+    sra_chunked = run_dynamic(asig, True, analysis_dt=0.005, outs=outs)
+    n_steps = int(round(asig.time[-1] / 0.005))
+    for sra_1d in [sra_single, sra_chunked]:  # no extra round-off step at the end
+        assert list(sra_1d.step_history['n_steps']) == [n_steps]
+        assert np.isclose(sra_1d.out_dict['TIME'][-1], asig.time[-1])
+    assert np.isclose(sra_chunked.out_dict['ACCX'], sra_single.out_dict['ACCX'], rtol=0, atol=1.0e-6).all()
+    # the base does not drop to zero input at the last time
+    assert abs(sra_single.out_dict['ACCX'][-1, -1]) < 10 * np.max(np.abs(sra_single.out_dict['ACCX'][-1, -20:-1]))
+
+
+class FakeDomain(object):
+    """Domain whose steps fail if they are longer than `dt_fail` and start within the `fail_window`"""
+    def __init__(self, dt_fail, fail_window):
+        self.time = 0.0
+        self.dt_fail = dt_fail
+        self.fail_window = fail_window
+        self.n_calls = 0
+
+    def analyze(self, osi, num_inc=1, dt=None):
+        self.n_calls += 1
+        for i in range(num_inc):
+            if dt > self.dt_fail and self.fail_window[0] <= self.time < self.fail_window[1]:
+                return -3
+            self.time += dt
+        return 0
+
+    def get_time(self, osi):
+        return self.time
+
+
+def test_stepper_reduces_and_recovers_time_step(monkeypatch):
+    from o3soil.sra import stepping
+    dom = FakeDomain(dt_fail=0.003, fail_window=(0.5, 0.6))
+    monkeypatch.setattr(stepping.o3, 'analyze', dom.analyze)
+    monkeypatch.setattr(stepping.o3, 'get_time', dom.get_time)
+    stepper = stepping.AdaptiveStepper(None, 0.01, n_grow=5, rec_dts=[0.02], chunked=True)
+    assert stepper.run(1.0)
+    hist = stepper.step_history
+    assert np.isclose(np.sum(hist['dt'] * hist['n_steps']), 1.0)
+    assert np.isclose(hist['failed'][:2, 1], [0.01, 0.005]).all()
+    assert np.isclose(hist['dt'].min(), 0.0025)
+    assert np.isclose(hist['dt'][-1], 0.01)
+    assert dom.n_calls < 100  # chunked away from the failure
+
+    dom = FakeDomain(dt_fail=0.0, fail_window=(0.5, 0.6))
+    monkeypatch.setattr(stepping.o3, 'analyze', dom.analyze)
+    stepper = stepping.AdaptiveStepper(None, 0.01, dt_min=0.001, rec_dts=[0.02])
+    assert not stepper.run(1.0)
+    assert np.isclose(dom.time, 0.5)
+
+
+class FakeSolver(object):
+    def __init__(self, dom, algorithm):
+        self.dom = dom
+        self.algorithm = algorithm
+
+    def apply(self, osi):
+        self.dom.algorithm = self.algorithm
+
+
+class FakeSolverDomain(FakeDomain):
+    """Domain whose steps in the `fail_window` only converge with one of the `rescue_algs`"""
+    def __init__(self, fail_window, rescue_algs):
+        super(FakeSolverDomain, self).__init__(0.0, fail_window)
+        self.algorithm = 'Newton'
+        self.rescue_algs = rescue_algs
+        self.algs_used = []
+
+    def analyze(self, osi, num_inc=1, dt=None):
+        self.algs_used.append(self.algorithm)
+        if self.algorithm in self.rescue_algs:
+            self.time += dt * num_inc
+            return 0
+        return super(FakeSolverDomain, self).analyze(osi, num_inc, dt)
+
+
+def test_stepper_rescues_steps_with_fallback_solvers(monkeypatch):
+    from o3soil.sra import stepping
+    dom = FakeSolverDomain(fail_window=(0.495, 0.545), rescue_algs=['ModifiedNewton'])
+    monkeypatch.setattr(stepping.o3, 'analyze', dom.analyze)
+    monkeypatch.setattr(stepping.o3, 'get_time', dom.get_time)
+    fallbacks = [FakeSolver(dom, 'KrylovNewton'), FakeSolver(dom, 'ModifiedNewton')]
+    stepper = stepping.AdaptiveStepper(None, 0.01, rec_dts=[0.02], solver=FakeSolver(dom, 'Newton'),
+                                       fallbacks=fallbacks)
+    assert stepper.run(1.0)
+    hist = stepper.step_history
+    assert len(hist['failed']) == 0  # no substepping
+    assert np.isclose(hist['dt'], 0.01).all()
+    assert len(hist['rescued']) == 5
+    assert (hist['rescued'][:, 2] == 1).all()
+    assert hist['fallbacks'] == ['KrylovNewton', 'ModifiedNewton']
+    assert dom.algorithm == 'Newton'  # primary restored
+    assert dom.algs_used[-1] == 'Newton'
+
+    dom = FakeSolverDomain(fail_window=(0.495, 0.545), rescue_algs=[])
+    monkeypatch.setattr(stepping.o3, 'analyze', dom.analyze)
+    monkeypatch.setattr(stepping.o3, 'get_time', dom.get_time)
+    stepper = stepping.AdaptiveStepper(None, 0.01, dt_min=0.001, rec_dts=[0.02], solver=FakeSolver(dom, 'Newton'),
+                                       fallbacks=[FakeSolver(dom, 'KrylovNewton')])
+    assert not stepper.run(1.0)
+    assert len(stepper.step_history['rescued']) == 0
+    assert np.isclose(dom.time, 0.5)
+
+
+def test_instrumented_sra_records_stats(tmp_path):
+    asig = load_short_asig()
+    cache_path = str(tmp_path) + '/'
+    sra_1d = o3soil.sra.run_sra(build_elastic_profile(), asig, outs={'ACCX': 'all'}, analysis_dt=0.005,
+                                analysis_time=1.0, cache_path=cache_path, instrument=True)
+    stats = sra_1d.stats
+    for phase in ['build', 'static', 'dynamic', 'collect']:
+        assert stats.phase_times[phase] > 0
+    assert stats.n_failed == 0
+    assert len(stats.n_iters) == stats.n_steps
+    assert min(stats.n_iters) >= 1
+    with open(cache_path + 'stats.json') as f:
+        sd = json.load(f)
+    assert sd['n_steps'] == stats.n_steps
+
+
+def test_site_response_records_phase_times():
+    asig = load_short_asig()
+    stats = o3soil.sra.stats.SRAStats()
+    o3soil.sra.site_response(build_elastic_profile(), asig, analysis_dt=0.005, analysis_time=1.0, stats=stats)
+    for phase in ['build', 'static', 'dynamic', 'collect']:
+        assert stats.phase_times[phase] > 0
+    assert 'loads' not in stats.phase_times  # no static bias
+    assert stats.n_steps == 200
+    assert stats.n_failed == 0
+    assert stats.to_dict()['completed']
@@ -0,0 +1,44 @@
+import numpy as np
+
+import o3soil.sra
+from o3soil.sra import stochastic
+from tests.test_sra_batch import build_elastic_profile, load_short_asig
+
+
+def test_profile_realizations_are_reproducible():
+    fs = stochastic.sample_profile_factors(50, 2, sigma_ln_vs=0.3, rho_vs=0.5, sigma_ln_h=0.2, seed=3)
+    fs2 = stochastic.sample_profile_factors(50, 2, sigma_ln_vs=0.3, rho_vs=0.5, sigma_ln_h=0.2, seed=3)
+    assert fs['vs'].shape == (50, 2)
+    assert np.allclose(fs['vs'], fs2['vs'])
+    assert np.allclose(fs['strength'], 1.0)
+    sp = build_elastic_profile()
+    sp_r = stochastic.gen_profile_realization(sp, fs['vs'][0], fs['thickness'][0])
+    assert sp_r.n_layers == 2
+    assert sp_r.height == sp.height
+    assert not np.isclose(sp_r.layer_depth(2), 9.5)
+    assert np.isclose(sp_r.layer(1).g_mod, sp.layer(1).g_mod * fs['vs'][0, 0] ** 2)
+    vs_r = sp_r.layer(1).get_shear_vel(saturated=False)
+    assert np.isclose(vs_r, sp.layer(1).get_shear_vel(saturated=False) * fs['vs'][0, 0])
+    assert np.isclose(sp.layer_depth(2), 9.5)  # base profile unchanged
+
+
+def test_profile_factors_correlation():
+    fs = stochastic.sample_profile_factors(4000, 3, sigma_ln_vs=0.3, rho_vs=0.5, seed=1)
+    ln_vs = np.log(fs['vs'])
+    assert np.isclose(np.std(ln_vs), 0.3, rtol=0.05)
+    assert np.isclose(np.corrcoef(ln_vs[:, 0], ln_vs[:, 1])[0, 1], 0.5, atol=0.05)
+    assert np.isclose(np.corrcoef(ln_vs[:, 0], ln_vs[:, 2])[0, 1], 0.25, atol=0.05)
+    fs = stochastic.sample_profile_factors(20, 3, sigma_ln_vs=0.3, rho_vs=1.0, seed=1)  # fully correlated
+    assert np.allclose(fs['vs'], fs['vs'][:, :1])
+    assert not np.allclose(fs['vs'], 1.0)
+
+def test_run_sra_monte_carlo_envelopes():
+    depths = [0.0, 5.0, 10.0]
+    env, errors = o3soil.sra.run_sra_monte_carlo(build_elastic_profile(), load_short_asig(), 4, depths=depths,
+                                                 outs=['ACCX'], percentiles=(0, 50, 100), sigma_ln_vs=0.2, seed=1,
+                                                 n_workers=2, analysis_dt=0.005)
+    assert errors == {}
+    assert env['ACCX_peak'].shape == (3, 3)
+    assert (env['ACCX_peak'][0] <= env['ACCX_peak'][1]).all()
+    assert (env['ACCX_peak'][1] <= env['ACCX_peak'][2]).all()
+    assert len(env['ACCX_depth']) == 3